@@ -21,6 +21,7 @@ from fuzzytools.files import load_pickle, save_pickle, get_dict_from_filedir
 from fuzzytools.cuteplots.utils import save_fig
 import matplotlib.pyplot as plt
 from lchandler.plots.lc import plot_lightcurve
+from lchandler.columnar_files import load_lcdataset
 from fuzzytools.files import save_time_stamp
 
 methods = ['linear-fstw', 'bspline-fstw', 'spm-mle-fstw', 'spm-mle-estw', 'spm-mcmc-fstw', 'spm-mcmc-estw'] if main_args.method=='.' else main_args.method
@@ -31,7 +32,7 @@ for method in methods:
 	filedict = get_dict_from_filedir(filedir)
 	rootdir = filedict['_rootdir']
 	cfilename = filedict['_cfilename']
-	lcdataset = load_pickle(filedir)
+	lcdataset = load_lcdataset(filedir) # pickle or columnar folder
 	lcset_info = lcdataset['raw'].get_info()
 	print(lcdataset)
 	
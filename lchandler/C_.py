@@ -1,4 +1,5 @@
 import numpy as np
+import os
 
 ###################################################################################################################################################
 EPS = 1e-5
@@ -8,6 +9,10 @@ DEFAULT_FLUX_SCALE = 1e26 # 1e0, 1e26
 DEFAULT_MAG_SCALE = 1
 CHECK = False
 
+### PARALLEL
+N_JOBS = os.cpu_count() or 1 # workers of the process pools
+CHUNK_SIZE = 500 # objects per shard
+
 ### THRESHOLDS
 MIN_POINTS_LIGHTCURVE_SURVEY_EXPORT = 5
 MIN_POINTS_LIGHTCURVE_DEFINITION = 5
@@ -0,0 +1,173 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+from .lc_classes import SubLCO, get_new_noisy_obs, OBSE_STD_SCALE, DF, OBS_NOISE_RANGE
+from . import segments as seg
+from . import parallel
+
+DS_MODES = ['none', 'left', 'random']
+
+###################################################################################################################################################
+
+'''
+Batched data augmentation: same operations as SubLCO.apply_downsampling_window, SubLCO.add_day_noise_uniform
+and SubLCO.add_obs_noise_gaussian, but for many curves at once over CSR-style band buffers (see segments.py)
+All the randomness comes from an explicit np.random.Generator
+'''
+
+def get_downsampling_window_mask(offsets, rng, mode_d, ds_prob,
+	min_valid_length:int=C_.MIN_POINTS_LIGHTCURVE_DEFINITION,
+	min_frac=1/3,
+	):
+	'''
+	Boolean mask over the buffer, one window (and Bernoulli drop) per segment
+	'''
+	assert ds_prob>=0 and ds_prob<=1
+	if mode_d is None or len(mode_d)==0:
+		mode_d = {'none':1}
+	for mode in mode_d.keys():
+		if not mode in DS_MODES:
+			raise Exception(f'no mode {mode}')
+
+	lengths = seg.get_lengths(offsets)
+	segment_ids = seg.get_segment_ids(offsets)
+	positions = seg.get_segment_positions(offsets)
+	n = len(lengths)
+	valid_segments = lengths>min_valid_length # shorter curves are not modified
+
+	### window
+	keys = list(mode_d.keys())
+	modes = np.array(keys)[rng.choice(len(keys), size=n, p=[mode_d[k] for k in keys])]
+	min_lengths = np.minimum(np.maximum(min_valid_length, (min_frac*lengths).astype(seg.OFFSETS_DTYPE)), lengths)
+	new_lengths = rng.integers(min_lengths, lengths+1) # [a,b]
+	new_lengths[modes=='none'] = lengths[modes=='none']
+	indexs = rng.integers(0, lengths-new_lengths+1) # [a,b]
+	indexs[modes!='random'] = 0
+	valid_mask = (positions>=indexs[segment_ids]) & (positions<(indexs+new_lengths)[segment_ids])
+
+	### Bernoulli drop
+	if ds_prob>0:
+		valid_mask &= rng.random(size=len(valid_mask))>=ds_prob
+
+	### extra case. If by change the mask implies a very short curve: keep min_length random points
+	short_segments = seg.segment_reduce(np.add, valid_mask.astype(seg.OFFSETS_DTYPE), offsets, 0)<min_lengths
+	if np.any(short_segments):
+		ranks = np.empty((len(valid_mask),), dtype=seg.OFFSETS_DTYPE)
+		ranks[np.lexsort((rng.random(size=len(valid_mask)), segment_ids))] = positions
+		short_mask = short_segments[segment_ids]
+		valid_mask[short_mask] = (ranks<min_lengths[segment_ids])[short_mask]
+
+	valid_mask[~valid_segments[segment_ids]] = True
+	return valid_mask
+
+def get_day_noise_sorted_indexs(days, offsets, rng, hours_noise:float):
+	'''
+	Returns the new days and the indexs that sort the buffer inside every segment
+	'''
+	new_days = days+rng.uniform(-hours_noise, hours_noise, size=len(days)).astype(days.dtype)/24.
+	sorted_indexs = np.lexsort((new_days, seg.get_segment_ids(offsets)))
+	return new_days, sorted_indexs
+
+def augment_band_buffer(buffers:dict, offsets, rng,
+	ds_mode:dict=None,
+	ds_prob:float=0,
+	hours_noise:float=0,
+	obs_min_lim=0,
+	std_scale=OBSE_STD_SCALE,
+	df=DF,
+	obs_noise_range=OBS_NOISE_RANGE,
+	min_valid_length:int=C_.MIN_POINTS_LIGHTCURVE_DEFINITION,
+	min_frac=1/3,
+	):
+	'''
+	Downsampling window, day noise and observation noise (in that order) for all the segments of a band buffer
+	Returns new buffers (days, obs, obse) and offsets
+	'''
+	days, obs, obse = buffers['days'], buffers['obs'], buffers['obse']
+
+	### downsampling window
+	valid_mask = get_downsampling_window_mask(offsets, rng, ds_mode, ds_prob, min_valid_length, min_frac)
+	new_offsets = seg.compact_segments(valid_mask, offsets)
+	days, obs, obse = days[valid_mask], obs[valid_mask], obse[valid_mask]
+
+	### day noise
+	if hours_noise!=0:
+		days, sorted_indexs = get_day_noise_sorted_indexs(days, new_offsets, rng, hours_noise)
+		days, obs, obse = days[sorted_indexs], obs[sorted_indexs], obse[sorted_indexs]
+
+	### obs noise
+	if std_scale!=0:
+		obs = get_new_noisy_obs(obs, obse, obs_min_lim,
+			std_scale,
+			df,
+			obs_noise_range,
+			rng,
+			new_offsets,
+			)
+
+	return {'days':days, 'obs':obs, 'obse':obse}, new_offsets
+
+def get_augmented_lcobjs_from_buffers(lcobjs, band_buffers:dict, rng,
+	**kwargs
+	):
+	'''
+	lcobjs: original objects (used for metadata and dtypes)
+	band_buffers: dict b->(buffers, offsets), the object k lives in the segment k of every band
+	'''
+	new_lcobjs = [lcobj.copy_only_data() for lcobj in lcobjs]
+	for b in band_buffers.keys():
+		buffers, offsets = band_buffers[b]
+		new_buffers, new_offsets = augment_band_buffer(buffers, offsets, rng, **kwargs)
+		for k,lcobj in enumerate(lcobjs):
+			sublcobj = lcobj.get_b(b)
+			i, j = new_offsets[k], new_offsets[k+1]
+			new_sublcobj = SubLCO.from_arrays(*[new_buffers[attr][i:j].astype(sublcobj.dtype, copy=False) for attr in SubLCO.ARRAY_ATTRS],
+				sublcobj.y,
+				sublcobj.dtype,
+				)
+			new_lcobjs[k].add_sublcobj_b(b, new_sublcobj)
+	return new_lcobjs
+
+def get_augmented_lcobjs(lcobjs:list, rng,
+	bands:list=None,
+	**kwargs
+	):
+	'''
+	Augmented copies of a list of LCO, in one vectorized pass per band
+	kwargs: see augment_band_buffer
+	'''
+	bands = lcobjs[0].bands if bands is None and len(lcobjs)>0 else bands
+	band_buffers = {}
+	for b in ([] if bands is None else bands):
+		sublcobjs = [lcobj.get_b(b) for lcobj in lcobjs]
+		buffers = {attr:seg.concatenate_segments([sublcobj.get_attr(attr) for sublcobj in sublcobjs])[0] for attr in SubLCO.ARRAY_ATTRS}
+		band_buffers[b] = (buffers, seg.get_offsets([len(sublcobj) for sublcobj in sublcobjs]))
+	return get_augmented_lcobjs_from_buffers(lcobjs, band_buffers, rng, **kwargs)
+
+def get_augmented_lcset(lcset, rng,
+	lcobj_names:list=None,
+	n_jobs:int=1,
+	chunk_size:int=C_.CHUNK_SIZE,
+	**kwargs
+	):
+	'''
+	New LCSet with augmented copies of the objects lcobj_names (all by default)
+	The objects are augmented by shards of chunk_size objects, every shard with its own generator spawned from rng (see parallel.map_shards):
+	the results only depend on rng and chunk_size, the same for any n_jobs
+	n_jobs: if not 1, the shards run in a process pool, otherwise they run here over the band buffers of the lcset
+	kwargs: see augment_band_buffer
+	'''
+	lcobj_names = lcset.get_lcobj_names() if lcobj_names is None else list(lcobj_names)
+	lcobjs = [lcset.get_lcobj_source(lcobj_name) for lcobj_name in lcobj_names]
+	seed = np.random.SeedSequence(rng.integers(0, 2**63))
+	if n_jobs==1:
+		shard_slices = parallel.get_shard_slices(len(lcobjs), chunk_size)
+		new_lcobjs = []
+		for shard_slice,seed_sequence in zip(shard_slices, parallel.get_seed_sequences(seed, len(shard_slices))):
+			band_buffers = {b:lcset.get_band_buffer(b, SubLCO.ARRAY_ATTRS, lcobj_names[shard_slice]) for b in lcset.band_names}
+			new_lcobjs += get_augmented_lcobjs_from_buffers(lcobjs[shard_slice], band_buffers, np.random.default_rng(seed_sequence), **kwargs)
+	else:
+		new_lcobjs = parallel.map_shards(get_augmented_lcobjs, lcobjs, n_jobs, chunk_size, seed, bands=lcset.band_names, **kwargs)
+	return lcset.copy({lcobj_name:new_lcobj for lcobj_name,new_lcobj in zip(lcobj_names, new_lcobjs)})
@@ -0,0 +1,236 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from . import segments as seg
+from .lc_classes import SubLCO
+from .augmentation import augment_band_buffer
+
+###################################################################################################################################################
+
+def get_serial_buffer(lcset, lcobj_names:list, attrs:list,
+	bands:list=None,
+	):
+	'''
+	Serial (multiband, sorted by days) values of many objects as a CSR-style buffer, in one vectorized pass
+	Same order as LCO.get_custom_x_serial
+	Returns x (total_obs, len(attrs)), band indexs (total_obs,) and offsets
+	'''
+	bands = lcset.band_names if bands is None else bands
+	buffer_attrs = attrs if 'days' in attrs else attrs+['days']
+	band_buffers = [lcset.get_band_buffer(b, buffer_attrs, lcobj_names) for b in bands]
+	return get_serial_buffer_from_band_buffers(band_buffers, attrs)
+
+def get_serial_buffer_from_band_buffers(band_buffers:list, attrs:list):
+	'''
+	band_buffers: list of (buffers, offsets), one per band, as returned by LCSet.get_band_buffer. The buffers must include days
+	'''
+	values = {attr:np.concatenate([buffers[attr] for buffers,_ in band_buffers], axis=0) for attr in set(attrs+['days'])}
+	lcobj_indexs = np.concatenate([seg.get_segment_ids(offsets) for _,offsets in band_buffers], axis=0)
+	band_indexs = np.concatenate([np.full((offsets[-1],), kb, dtype=np.int64) for kb,(_,offsets) in enumerate(band_buffers)], axis=0)
+	serial_lengths = sum([seg.get_lengths(offsets) for _,offsets in band_buffers])
+
+	sorted_indexs = np.lexsort((values['days'], lcobj_indexs)) # lexsort is stable: same order as LCO.get_serial()
+	x = np.concatenate([values[attr][sorted_indexs][...,None] for attr in attrs], axis=-1)
+	return x, band_indexs[sorted_indexs], seg.get_offsets(serial_lengths)
+
+def get_padded_serial_batch(lcset, lcobj_names:list, attrs:list,
+	bands:list=None,
+	max_length:int=None,
+	out:dict=None,
+	dtype=np.float32,
+	):
+	'''
+	Padded arrays for a batch of objects:
+		x: (N, max_length, len(attrs)) serial values
+		onehot: (N, max_length, len(bands)) band onehot
+		mask: (N, max_length) True for valid (not padded) observations
+		lengths: (N,)
+	max_length: by default, the max serial length in the batch. Longer curves are clipped (the first observations are kept)
+	out: dict of preallocated arrays (like the output of get_padded_batch_buffers), reused to avoid allocations per batch
+	'''
+	bands = lcset.band_names if bands is None else bands
+	buffer_attrs = attrs if 'days' in attrs else attrs+['days']
+	band_buffers = [lcset.get_band_buffer(b, buffer_attrs, lcobj_names) for b in bands]
+	return get_padded_serial_batch_from_band_buffers(band_buffers, attrs,
+		max_length=max_length,
+		out=out,
+		dtype=dtype,
+		)
+
+def get_padded_serial_batch_from_band_buffers(band_buffers:list, attrs:list,
+	max_length:int=None,
+	out:dict=None,
+	dtype=np.float32,
+	):
+	'''
+	Same as get_padded_serial_batch, from a list of (buffers, offsets), one per band (see get_serial_buffer_from_band_buffers)
+	'''
+	x, band_indexs, offsets = get_serial_buffer_from_band_buffers(band_buffers, attrs)
+	lengths = seg.get_lengths(offsets)
+	n = len(lengths)
+	n_bands = len(band_buffers)
+	max_length = (int(np.max(lengths)) if n>0 else 0) if max_length is None else max_length
+
+	if out is None:
+		out = get_padded_batch_buffers(n, max_length, len(attrs), n_bands, dtype)
+	else:
+		assert out['x'].shape[0]>=n and out['x'].shape[1]>=max_length
+		for k in out.keys():
+			out[k][:n] = 0
+
+	positions = seg.get_segment_positions(offsets)
+	valid = positions<max_length
+	lcobj_indexs = seg.get_segment_ids(offsets)[valid]
+	positions = positions[valid]
+	out['x'][lcobj_indexs,positions] = x[valid]
+	out['onehot'][lcobj_indexs,positions,band_indexs[valid]] = True
+	out['mask'][lcobj_indexs,positions] = True
+	out['lengths'][:n] = np.minimum(lengths, max_length)
+	return {k:out[k][:n] if k=='lengths' else out[k][:n,:max_length] for k in out.keys()}
+
+def get_padded_batch_buffers(batch_size:int, max_length:int, n_attrs:int, n_bands:int,
+	dtype=np.float32,
+	):
+	'''
+	Preallocated output for get_padded_serial_batch
+	'''
+	out = {
+		'x':np.zeros((batch_size, max_length, n_attrs), dtype=dtype),
+		'onehot':np.zeros((batch_size, max_length, n_bands), dtype=bool),
+		'mask':np.zeros((batch_size, max_length), dtype=bool),
+		'lengths':np.zeros((batch_size,), dtype=np.int64),
+	}
+	return out
+
+def get_length_buckets(lengths, batch_size:int,
+	rng=None,
+	):
+	'''
+	Batches (as index arrays) of objects with similar lengths, to minimize padding
+	rng: np.random.Generator used to shuffle objects with equal lengths and the order of the batches
+	'''
+	lengths = np.asarray(lengths)
+	tie_breaker = np.arange(0, len(lengths)) if rng is None else rng.permutation(len(lengths))
+	sorted_indexs = np.lexsort((tie_breaker, lengths))
+	buckets = [sorted_indexs[i:i+batch_size] for i in range(0, len(sorted_indexs), batch_size)]
+	if not rng is None:
+		buckets = [buckets[k] for k in rng.permutation(len(buckets))]
+	return buckets
+
+###################################################################################################################################################
+
+def get_band_buffers_batch(band_buffers:list, attrs:list, seed_sequence,
+	augment_kwargs:dict=None,
+	max_length:int=None,
+	dtype=np.float32,
+	):
+	'''
+	Padded serial batch from the band buffers of the batch objects, augmented first if augment_kwargs is not None (see augmentation.augment_band_buffer)
+	The augmentation uses its own generator from seed_sequence, so the batch does not depend on the worker that builds it
+	'''
+	if not augment_kwargs is None:
+		assert all([attr in SubLCO.ARRAY_ATTRS for attr in attrs]), f'only {SubLCO.ARRAY_ATTRS} can be augmented'
+		rng = np.random.default_rng(seed_sequence)
+		band_buffers = [augment_band_buffer(buffers, offsets, rng, **augment_kwargs) for buffers,offsets in band_buffers]
+	return get_padded_serial_batch_from_band_buffers(band_buffers, attrs,
+		max_length=max_length,
+		dtype=dtype,
+		)
+
+def get_batch_buffer_attrs(attrs:list,
+	augment:bool=False,
+	):
+	if augment:
+		return SubLCO.ARRAY_ATTRS
+	return attrs if 'days' in attrs else attrs+['days']
+
+def get_lcset_batch(lcset, lcobj_names:list, attrs:list, bands:list, seed_sequence,
+	augment_kwargs:dict=None,
+	max_length:int=None,
+	dtype=np.float32,
+	):
+	buffer_attrs = get_batch_buffer_attrs(attrs, not augment_kwargs is None)
+	band_buffers = [lcset.get_band_buffer(b, buffer_attrs, lcobj_names) for b in bands]
+	return get_band_buffers_batch(band_buffers, attrs, seed_sequence, augment_kwargs, max_length, dtype)
+
+def get_boostrap_batch_names(lcset, batch_size:int,
+	n_batches:int=None,
+	drop_last:bool=False,
+	):
+	'''
+	Batches of object names from consecutive rounds of the lcset bootstrap (see LCSet.get_boostrap_samples)
+	n_batches: if None, the batches of one bootstrap round
+	'''
+	assert len(lcset)>0
+	lcobj_names = []
+	n_rounds = 0
+	k = 0
+	while n_batches is None or k<n_batches:
+		while len(lcobj_names)<batch_size and (not n_batches is None or n_rounds==0):
+			lcobj_names += list(lcset.get_boostrap_samples())
+			n_rounds += 1
+		if len(lcobj_names)==0 or (len(lcobj_names)<batch_size and drop_last):
+			return
+		yield lcobj_names[:batch_size]
+		lcobj_names = lcobj_names[batch_size:]
+		k += 1
+
+def iter_boostrap_batches(lcset, batch_size:int,
+	attrs:list=['days', 'obs', 'obse'],
+	bands:list=None,
+	n_batches:int=None,
+	drop_last:bool=False,
+	augment_kwargs:dict=None,
+	max_length:int=None,
+	dtype=np.float32,
+	prefetch:int=2,
+	n_workers:int=1,
+	use_processes:bool=False,
+	seed=0,
+	):
+	'''
+	Iterator of padded serial batches (see get_padded_serial_batch) of bootstrap samples, with lcobj_names and y
+	The batches are built by background workers, up to prefetch batches ahead of the consumer
+	The batches are yielded in order and each one has its own augmentation seed, so the output does not depend on n_workers
+	use_processes: the band buffers are gathered in this thread and the batches are built in a process pool
+	The lcset must not be modified while iterating
+	'''
+	bands = lcset.band_names if bands is None else bands
+	buffer_attrs = get_batch_buffer_attrs(attrs, not augment_kwargs is None)
+	seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+	labels = lcset.get_class_index()['labels']
+	batch_names = get_boostrap_batch_names(lcset, batch_size, n_batches, drop_last)
+	executor = (ProcessPoolExecutor if use_processes else ThreadPoolExecutor)(max_workers=n_workers)
+	pending = deque() # bounded queue of (lcobj_names, future)
+
+	def submit_next_batch():
+		lcobj_names = next(batch_names, None)
+		if lcobj_names is None:
+			return False
+		batch_seed_sequence = seed_sequence.spawn(1)[0]
+		if use_processes:
+			band_buffers = [lcset.get_band_buffer(b, buffer_attrs, lcobj_names) for b in bands]
+			future = executor.submit(get_band_buffers_batch, band_buffers, attrs, batch_seed_sequence, augment_kwargs, max_length, dtype)
+		else:
+			future = executor.submit(get_lcset_batch, lcset, lcobj_names, attrs, bands, batch_seed_sequence, augment_kwargs, max_length, dtype)
+		pending.append((lcobj_names, future))
+		return True
+
+	try:
+		while len(pending)<max(1, prefetch) and submit_next_batch():
+			pass
+		while len(pending)>0:
+			lcobj_names, future = pending.popleft()
+			batch = future.result()
+			submit_next_batch()
+			batch['lcobj_names'] = lcobj_names
+			batch['y'] = np.array([labels[lcobj_name] for lcobj_name in lcobj_names], dtype=np.int64)
+			yield batch
+	finally:
+		for _,future in pending:
+			future.cancel()
+		executor.shutdown(wait=True)
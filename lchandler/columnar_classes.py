@@ -0,0 +1,340 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+from .lc_classes import SubLCO, LCO, _get_readonly, get_derived_attr_source, get_derived_values
+from .dataset_classes import LCSet, LCSetData
+from . import segments as seg
+
+BUFFER_ATTRS = ['days', 'obs', 'obse']
+METADATA_COLUMNS = ['y', 'ra', 'dec', 'z', 'global_first_day', 'is_flux']
+NO_LABEL = -1
+
+###################################################################################################################################################
+
+def get_metadata_columns(lcobjs):
+	lcobjs = list(lcobjs)
+	metadata = {
+		'y':np.array([NO_LABEL if lcobj.y is None else lcobj.y for lcobj in lcobjs], dtype=np.int64),
+		'ra':np.array([np.nan if lcobj.ra is None else lcobj.ra for lcobj in lcobjs], dtype=np.float64),
+		'dec':np.array([np.nan if lcobj.dec is None else lcobj.dec for lcobj in lcobjs], dtype=np.float64),
+		'z':np.array([np.nan if lcobj.z is None else lcobj.z for lcobj in lcobjs], dtype=np.float64),
+		'global_first_day':np.array([lcobj.global_first_day for lcobj in lcobjs], dtype=np.float64),
+		'is_flux':np.array([lcobj.is_flux for lcobj in lcobjs], dtype=bool),
+	}
+	return metadata
+
+def get_band_buffers(lcobjs, band_names,
+	dtype=np.float32,
+	):
+	lcobjs = list(lcobjs)
+	buffers = {}
+	for b in band_names:
+		sublcobjs = [lcobj.get_b(b) for lcobj in lcobjs]
+		buffers[b] = {attr:seg.concatenate_segments([getattr(sublcobj, attr) for sublcobj in sublcobjs], dtype)[0] for attr in BUFFER_ATTRS}
+		buffers[b]['offsets'] = seg.get_offsets([len(sublcobj) for sublcobj in sublcobjs])
+	return buffers
+
+def get_labels(y):
+	'''
+	Label column as a list of y, NO_LABEL as None (never as an index of class_names)
+	'''
+	return [None if label==NO_LABEL else label for label in y.tolist()]
+
+def _get_optional_float(x):
+	return None if np.isnan(x) else float(x)
+
+###################################################################################################################################################
+
+class ColumnarLCSet(LCSet):
+	'''
+	LCSet backend storing the days/obs/obse of every band in contiguous buffers with CSR-style offsets,
+	plus one metadata column per object attribute (y, ra, dec, z, global_first_day)
+	lcset[lcobj_name] returns an LCO whose arrays are read-only views over the buffers: to modify an object, set it back with set_lcobj
+	Objects set/popped after construction are kept in an overlay and merged into the buffers before any set-wide operation
+	Versions (used by the caches, see get_lcobj_state_keys): lcobj_versions per object, increased by set_lcobj,
+	and buffers_version, increased by the set-wide operations that change the values of every object
+	'''
+	def __init__(self, lcobj_names:list, buffers:dict, metadata:dict, survey:str, description:str, band_names:list, class_names:list, obs_is_flux:bool,
+		dtype=np.float32,
+		):
+		self.lcobj_names = list(lcobj_names)
+		self.buffers = buffers
+		self.metadata = metadata
+		self.dtype = dtype
+		self.overlay = {}
+		self.lcobj_versions = {}
+		self.buffers_version = 0
+		self.reset_rows()
+		super().__init__(LCSetData(self), survey, description, band_names, class_names, obs_is_flux)
+
+	@classmethod
+	def from_lcset(cls, lcset,
+		dtype=np.float32,
+		):
+		lcobj_names = lcset.get_lcobj_names()
+		lcobjs = [lcset.get_lcobj_source(lcobj_name) for lcobj_name in lcobj_names]
+		return cls(
+			lcobj_names,
+			get_band_buffers(lcobjs, lcset.band_names, dtype),
+			get_metadata_columns(lcobjs),
+			lcset.survey,
+			lcset.description,
+			lcset.band_names,
+			lcset.class_names,
+			lcset.obs_is_flux,
+			dtype,
+			)
+
+	def to_lcset(self):
+		'''
+		Materialize as a standard dict based LCSet (with copies)
+		'''
+		return LCSet.copy(self, None)
+
+	def reset_rows(self):
+		self.rows = {lcobj_name:k for k,lcobj_name in enumerate(self.lcobj_names)}
+		self.is_consolidated = True
+
+	def has_lcobj(self, lcobj_name):
+		return lcobj_name in self.overlay or lcobj_name in self.rows
+
+	def get_lcobj(self, lcobj_name):
+		if lcobj_name in self.overlay:
+			return self.overlay[lcobj_name]
+		return self.get_lcobj_view(self.rows[lcobj_name])
+
+	def get_lcobj_view(self, row:int):
+		metadata = self.metadata
+		lcobj = LCO(
+			is_flux=bool(metadata['is_flux'][row]),
+			y=None if metadata['y'][row]==NO_LABEL else int(metadata['y'][row]),
+			global_first_day=metadata['global_first_day'][row],
+			ra=_get_optional_float(metadata['ra'][row]),
+			dec=_get_optional_float(metadata['dec'][row]),
+			z=_get_optional_float(metadata['z'][row]),
+			)
+		for b in self.band_names:
+			buffers = self.buffers[b]
+			i, j = buffers['offsets'][row], buffers['offsets'][row+1]
+			sublcobj = SubLCO.from_arrays(*[_get_readonly(buffers[attr][i:j]) for attr in BUFFER_ATTRS],
+				lcobj.y,
+				self.dtype,
+				)
+			lcobj.add_sublcobj_b(b, sublcobj)
+		return lcobj
+
+	def set_lcobj(self, lcobj_name, lcobj):
+		if not self.has_lcobj(lcobj_name):
+			self.lcobj_names.append(lcobj_name)
+		self.overlay[lcobj_name] = lcobj
+		self.lcobj_versions[lcobj_name] = self.lcobj_versions.get(lcobj_name, 0)+1
+		self.is_consolidated = False
+
+	def pop_lcobj(self, lcobj_name,
+		default=None,
+		):
+		if not self.has_lcobj(lcobj_name):
+			return default
+		lcobj = self.get_lcobj(lcobj_name)
+		self.lcobj_names.remove(lcobj_name)
+		self.overlay.pop(lcobj_name, None)
+		self.rows.pop(lcobj_name, None)
+		self.lcobj_versions.pop(lcobj_name, None)
+		self.is_consolidated = False
+		return lcobj
+
+	def consolidate(self):
+		'''
+		Merge the overlay and the removed objects into the buffers
+		'''
+		if self.is_consolidated:
+			return
+		overlay_names = [lcobj_name for lcobj_name in self.lcobj_names if lcobj_name in self.overlay]
+		overlay_lcobjs = [self.overlay[lcobj_name] for lcobj_name in overlay_names]
+		overlay_rows = {lcobj_name:k for k,lcobj_name in enumerate(overlay_names)}
+		total_rows = len(self.metadata['y'])
+		indexs = [total_rows+overlay_rows[lcobj_name] if lcobj_name in overlay_rows else self.rows[lcobj_name] for lcobj_name in self.lcobj_names]
+
+		overlay_buffers = get_band_buffers(overlay_lcobjs, self.band_names, self.dtype)
+		for b in self.band_names:
+			offsets = np.concatenate([self.buffers[b]['offsets'], self.buffers[b]['offsets'][-1]+overlay_buffers[b]['offsets'][1:]])
+			new_buffers = {}
+			for attr in BUFFER_ATTRS:
+				x = np.concatenate([self.buffers[b][attr], overlay_buffers[b][attr]])
+				new_buffers[attr], new_buffers['offsets'] = seg.gather_segments(x, offsets, indexs)
+			self.buffers[b] = new_buffers
+
+		overlay_metadata = get_metadata_columns(overlay_lcobjs)
+		self.metadata = {k:np.concatenate([self.metadata[k], overlay_metadata[k]])[indexs] for k in METADATA_COLUMNS}
+		self.overlay = {}
+		self.reset_rows()
+
+	def keep_rows(self, valid_rows):
+		'''
+		Keep only the objects given by the boolean mask valid_rows (aligned with the consolidated lcobj_names)
+		'''
+		self.consolidate()
+		indexs = np.where(valid_rows)[0]
+		for b in self.band_names:
+			new_buffers = {}
+			for attr in BUFFER_ATTRS:
+				new_buffers[attr], new_buffers['offsets'] = seg.gather_segments(self.buffers[b][attr], self.buffers[b]['offsets'], indexs)
+			self.buffers[b] = new_buffers
+		self.metadata = {k:self.metadata[k][indexs] for k in METADATA_COLUMNS}
+		self.lcobj_names = [self.lcobj_names[k] for k in indexs]
+		for lcobj_name in self.rows.keys()-set(self.lcobj_names):
+			self.lcobj_versions.pop(lcobj_name, None)
+		self.reset_rows()
+
+	def get_lengths_b(self, b:str,
+		lcobj_names:list=None,
+		):
+		if not lcobj_names is None:
+			return LCSet.get_lengths_b(self, b, lcobj_names)
+		self.consolidate()
+		return seg.get_lengths(self.buffers[b]['offsets'])
+
+	### LCSet overrides
+	def get_lcobj_names(self,
+		c=None,
+		):
+		if c is None:
+			return list(self.lcobj_names)
+		self.consolidate()
+		y = self.class_names.index(c)
+		return [self.lcobj_names[k] for k in np.where(self.metadata['y']==y)[0]]
+
+	def get_lcobj_labels(self):
+		self.consolidate()
+		return get_labels(self.metadata['y'])
+
+	def get_class_index(self):
+		'''
+		Built from the label column, it is never stale
+		'''
+		self.consolidate()
+		labels = dict(zip(self.lcobj_names, get_labels(self.metadata['y'])))
+		lcobj_names_cdict = {c:dict.fromkeys(self.get_lcobj_names(c)) for c in self.class_names}
+		return {
+			'labels':labels,
+			'lcobj_names_cdict':lcobj_names_cdict,
+			}
+
+	def get_populations_cdict(self):
+		self.consolidate()
+		populations = np.bincount(self.metadata['y'][self.metadata['y']>=0], minlength=len(self.class_names))
+		return {c:int(populations[kc]) for kc,c in enumerate(self.class_names)}
+
+	def get_stats_key(self):
+		'''
+		Set-wide operations always replace buffers, so the ids of the current arrays identify the state
+		'''
+		self.consolidate()
+		arrays = [self.metadata['y']]+[self.buffers[b][attr] for b in self.band_names for attr in BUFFER_ATTRS+['offsets']]
+		return (tuple(self.lcobj_names), tuple([id(x) for x in arrays])), arrays
+
+	def get_lcobj_state_keys(self):
+		'''
+		Key of every object: label, buffers_version, its own version (set_lcobj) and, for the overlay objects, their band versions
+		(they can be modified in place). No consolidation: only the objects set since the last call get new keys
+		'''
+		state_keys = {}
+		for lcobj_name in self.lcobj_names:
+			lcobj_version = self.lcobj_versions.get(lcobj_name, 0)
+			if lcobj_name in self.overlay:
+				lcobj = self.overlay[lcobj_name]
+				sublcobjs = [lcobj.get_b(b) for b in self.band_names]
+				state_keys[lcobj_name] = (lcobj.y, self.buffers_version, lcobj_version, tuple([(id(sublcobj), sublcobj.version) for sublcobj in sublcobjs])), sublcobjs
+			else:
+				y = self.metadata['y'][self.rows[lcobj_name]]
+				state_keys[lcobj_name] = (None if y==NO_LABEL else int(y), self.buffers_version, lcobj_version, None), []
+		return state_keys
+
+	def get_band_buffer(self, b:str,
+		attrs:list=['days', 'obs', 'obse'],
+		lcobj_names:list=None,
+		):
+		'''
+		Derived attributes (d_days, log_obs, ...) are computed over the buffers
+		'''
+		self.consolidate()
+		buffers = self.buffers[b]
+		if lcobj_names is None:
+			return {attr:self.get_buffer_b(b, attr) for attr in attrs}, buffers['offsets']
+		indexs = np.array([self.rows[lcobj_name] for lcobj_name in lcobj_names], dtype=seg.OFFSETS_DTYPE)
+		new_buffers = {attr:seg.gather_segments(self.get_buffer_b(b, attr), buffers['offsets'], indexs)[0] for attr in attrs}
+		offsets = seg.get_offsets(seg.get_lengths(buffers['offsets'])[indexs])
+		return new_buffers, offsets
+
+	def get_buffer_b(self, b:str, attr:str):
+		buffers = self.buffers[b]
+		if attr in BUFFER_ATTRS:
+			return buffers[attr]
+		derived_attr_source = get_derived_attr_source(attr)
+		if derived_attr_source is None:
+			raise Exception(f'no attr {attr}')
+		kind, source_attr = derived_attr_source
+		return get_derived_values(kind, self.get_buffer_b(b, source_attr), buffers['offsets'])
+
+	def set_band_buffer(self, b:str, buffers:dict, offsets):
+		self.consolidate()
+		assert len(offsets)==len(self.lcobj_names)+1
+		self.buffers_version += 1
+		self.buffers[b] = {attr:np.asarray(buffers[attr]).astype(self.dtype, copy=False) for attr in BUFFER_ATTRS}
+		self.buffers[b]['offsets'] = np.asarray(offsets, dtype=seg.OFFSETS_DTYPE)
+
+	def apply_valid_mask_b(self, b:str, valid_mask):
+		self.consolidate()
+		buffers = self.buffers[b]
+		new_offsets = seg.compact_segments(valid_mask, buffers['offsets'])
+		self.buffers_version += 1
+		self.buffers[b] = {attr:buffers[attr][valid_mask] for attr in BUFFER_ATTRS}
+		self.buffers[b]['offsets'] = new_offsets
+
+	def reset_day_offset_serial(self,
+		store_day_offset:bool=False,
+		n_jobs:int=1,
+		):
+		'''
+		Vectorized over the buffers, n_jobs is not used
+		'''
+		self.consolidate()
+		day_offsets = np.full((len(self.lcobj_names),), np.inf)
+		for b in self.band_names:
+			buffers = self.buffers[b]
+			nonempty = self.get_lengths_b(b)>0
+			first_days = buffers['days'][buffers['offsets'][:-1][nonempty]]
+			day_offsets[nonempty] = np.minimum(day_offsets[nonempty], first_days)
+		assert np.all(np.isfinite(day_offsets))
+		self.buffers_version += 1
+		for b in self.band_names:
+			buffers = self.buffers[b]
+			buffers['days'] = (buffers['days']-np.repeat(day_offsets, self.get_lengths_b(b))).astype(self.dtype)
+		if store_day_offset:
+			self.metadata['global_first_day'] = day_offsets
+
+	def copy(self,
+		data:dict=None,
+		cow:bool=False,
+		):
+		'''
+		cow: copy-on-write, the buffers are shared (set-wide operations always replace buffers instead of modifying them)
+		'''
+		if not data is None:
+			return LCSet.copy(self, data)
+		self.consolidate()
+		_copy = (lambda x:x) if cow else np.copy
+		new_set = ColumnarLCSet(
+			self.lcobj_names,
+			{b:{k:_copy(self.buffers[b][k]) for k in self.buffers[b].keys()} for b in self.band_names},
+			{k:_copy(self.metadata[k]) for k in METADATA_COLUMNS},
+			self.survey,
+			self.description,
+			self.band_names,
+			self.class_names,
+			self.obs_is_flux,
+			self.dtype,
+			)
+		return new_set
@@ -0,0 +1,205 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+import os
+import json
+from functools import partial
+from fuzzytools.files import load_pickle
+from .dataset_classes import LCDataset, LCSetView, DeferredLCSet
+from .columnar_classes import ColumnarLCSet, BUFFER_ATTRS, METADATA_COLUMNS
+
+FORMAT_NAME = 'lchandler-columnar'
+FORMAT_VERSION = 1
+MANIFEST_FILENAME = 'manifest.json'
+
+###################################################################################################################################################
+
+'''
+On-disk columnar format for LCDataset: a folder with a versioned manifest and, per lcset, plain .npy files:
+	manifest.json
+	<lcset_dirname>/lcobj_names.npy
+	<lcset_dirname>/metadata/<column>.npy (y, ra, dec, z, global_first_day, is_flux)
+	<lcset_dirname>/bands/<b>/<attr>.npy (days, obs, obse, offsets)
+Views (k-fold splits, see LCSetView) are saved as an indexs.npy over a shared base lcset folder
+The buffers are opened with memory mapping: objects are read lazily and processes share pages
+'''
+
+def _get_lcset_info(lcset):
+	info = lcset.get_info()
+	info['length'] = len(lcset)
+	return info
+
+def save_lcset_files(lcset_dir:str, lcset):
+	'''
+	Any LCSet is saved through its columnar representation
+	'''
+	columnar_lcset = lcset if isinstance(lcset, ColumnarLCSet) else ColumnarLCSet.from_lcset(lcset)
+	columnar_lcset.consolidate()
+	os.makedirs(f'{lcset_dir}/metadata', exist_ok=True)
+	np.save(f'{lcset_dir}/lcobj_names.npy', np.array(columnar_lcset.lcobj_names, dtype=str))
+	for k in METADATA_COLUMNS:
+		np.save(f'{lcset_dir}/metadata/{k}.npy', columnar_lcset.metadata[k])
+	for b in columnar_lcset.band_names:
+		os.makedirs(f'{lcset_dir}/bands/{b}', exist_ok=True)
+		for attr in BUFFER_ATTRS+['offsets']:
+			np.save(f'{lcset_dir}/bands/{b}/{attr}.npy', columnar_lcset.buffers[b][attr])
+	info = _get_lcset_info(columnar_lcset)
+	info['dtype'] = np.dtype(columnar_lcset.dtype).str
+	return info
+
+def _get_band_names(info:dict, bands:list):
+	if bands is None:
+		return info['band_names']
+	for b in bands:
+		if not b in info['band_names']:
+			raise Exception(f'no band {b} in {info["band_names"]}')
+	return [b for b in info['band_names'] if b in bands]
+
+def load_lcset_files(lcset_dir:str, info:dict,
+	mmap:bool=True,
+	bands:list=None,
+	):
+	'''
+	bands: load only these bands (all by default)
+	'''
+	mmap_mode = 'r' if mmap else None
+	band_names = _get_band_names(info, bands)
+	lcobj_names = np.load(f'{lcset_dir}/lcobj_names.npy').tolist()
+	metadata = {k:np.load(f'{lcset_dir}/metadata/{k}.npy', mmap_mode=mmap_mode) for k in METADATA_COLUMNS}
+	buffers = {b:{attr:np.load(f'{lcset_dir}/bands/{b}/{attr}.npy', mmap_mode=mmap_mode) for attr in BUFFER_ATTRS+['offsets']} for b in band_names}
+	lcset = ColumnarLCSet(
+		lcobj_names,
+		buffers,
+		metadata,
+		info['survey'],
+		info['description'],
+		band_names,
+		info['class_names'],
+		info['obs_is_flux'],
+		np.dtype(info['dtype']).type,
+		)
+	return lcset
+
+def save_lcdataset(rootdir:str, lcdataset):
+	'''
+	Views without modified objects (see LCSetView.is_modified) share the saved base, any other lcset is saved with all its objects
+	'''
+	os.makedirs(rootdir, exist_ok=True)
+	manifest = {
+		'format':FORMAT_NAME,
+		'version':FORMAT_VERSION,
+		'kfolds':lcdataset.kfolds,
+		'bases':{},
+		'lcsets':{},
+		}
+	base_keys = {}
+	for k,lcset_name in enumerate(lcdataset.get_lcset_names()):
+		lcset = lcdataset[lcset_name]
+		dirname = f'lcset{k}'
+		if isinstance(lcset, LCSetView) and not lcset.is_modified():
+			base_key = base_keys.get(id(lcset.base), None)
+			if base_key is None:
+				base_key = f'base{len(base_keys)}'
+				base_keys[id(lcset.base)] = base_key
+				assert lcset.base.get_lcobj_names()==lcset.base_lcobj_names
+				manifest['bases'][base_key] = save_lcset_files(f'{rootdir}/{base_key}', lcset.base)
+				manifest['bases'][base_key]['dirname'] = base_key
+			os.makedirs(f'{rootdir}/{dirname}', exist_ok=True)
+			np.save(f'{rootdir}/{dirname}/indexs.npy', lcset.indexs)
+			info = _get_lcset_info(lcset)
+			info['base'] = base_key
+		else:
+			info = save_lcset_files(f'{rootdir}/{dirname}', lcset)
+		info['dirname'] = dirname
+		manifest['lcsets'][lcset_name] = info
+
+	with open(f'{rootdir}/{MANIFEST_FILENAME}', 'w') as f:
+		json.dump(manifest, f, indent=1)
+	return manifest
+
+def load_manifest(rootdir:str):
+	with open(f'{rootdir}/{MANIFEST_FILENAME}', 'r') as f:
+		manifest = json.load(f)
+	if manifest.get('format', None)!=FORMAT_NAME:
+		raise Exception(f'{rootdir} is not a {FORMAT_NAME} dataset')
+	if manifest['version']>FORMAT_VERSION:
+		raise Exception(f'format version {manifest["version"]} is not supported (max version={FORMAT_VERSION})')
+	return manifest
+
+def get_selected_lcset_names(lcset_names:list,
+	selected_lcset_names:list=None,
+	kf:str=None,
+	):
+	'''
+	lcset names given explicitly or by kfold prefix (kf@lcset_name), all if both are None
+	'''
+	if selected_lcset_names is None and kf is None:
+		return list(lcset_names)
+	selected_lcset_names = [] if selected_lcset_names is None else selected_lcset_names
+	return [lcset_name for lcset_name in lcset_names if lcset_name in selected_lcset_names or (not kf is None and lcset_name.split('@')[0]==str(kf) and '@' in lcset_name)]
+
+###################################################################################################################################################
+
+class LCDatasetLoader():
+	'''
+	Loads the lcsets of a saved dataset one by one, sharing the bases of the views
+	'''
+	def __init__(self, rootdir:str,
+		mmap:bool=True,
+		bands:list=None,
+		):
+		self.rootdir = rootdir
+		self.mmap = mmap
+		self.bands = bands
+		self.manifest = load_manifest(rootdir)
+		self.bases = {}
+
+	def get_lcset_names(self):
+		return list(self.manifest['lcsets'].keys())
+
+	def get_base(self, base_key:str):
+		if not base_key in self.bases:
+			self.bases[base_key] = load_lcset_files(f'{self.rootdir}/{base_key}', self.manifest['bases'][base_key], self.mmap, self.bands)
+		return self.bases[base_key]
+
+	def load_lcset(self, lcset_name:str):
+		info = self.manifest['lcsets'][lcset_name]
+		lcset_dir = f'{self.rootdir}/{info["dirname"]}'
+		if 'base' in info:
+			base = self.get_base(info['base'])
+			return LCSetView(base, np.load(f'{lcset_dir}/indexs.npy'), base.lcobj_names)
+		return load_lcset_files(lcset_dir, info, self.mmap, self.bands)
+
+	def get_deferred_lcset(self, lcset_name:str):
+		return DeferredLCSet(partial(self.load_lcset, lcset_name))
+
+def load_lcdataset(rootdir:str,
+	mmap:bool=True,
+	lcset_names:list=None,
+	kf:str=None,
+	bands:list=None,
+	lazy:bool=True,
+	):
+	'''
+	The lcsets are ColumnarLCSet (or LCSetView over a shared ColumnarLCSet base)
+	lcset_names, kf: lcsets loaded now (by name or by kfold prefix), all by default
+	bands: load only these bands
+	lazy: the other lcsets are deferred until they are accessed (see DeferredLCSet), if False they are not included
+	Pickled datasets (files) are loaded with load_pickle
+	'''
+	if not os.path.isdir(rootdir):
+		return load_pickle(rootdir)
+	loader = LCDatasetLoader(rootdir, mmap, bands)
+	selected_lcset_names = get_selected_lcset_names(loader.get_lcset_names(), lcset_names, kf)
+	lcsets = {}
+	for lcset_name in loader.get_lcset_names():
+		if lcset_name in selected_lcset_names:
+			lcsets[lcset_name] = loader.load_lcset(lcset_name)
+		elif lazy:
+			lcsets[lcset_name] = loader.get_deferred_lcset(lcset_name)
+
+	lcdataset = LCDataset(lcsets)
+	lcdataset.kfolds = loader.manifest['kfolds']
+	return lcdataset
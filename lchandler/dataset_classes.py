@@ -10,7 +10,10 @@ from fuzzytools.datascience.xerror import XError
 from fuzzytools.strings import get_bar
 from fuzzytools.level_bars import LevelBar
 from fuzzytools.lists import get_bootstrap
-from .lc_classes import diff_vector
+from .lc_classes import SubLCO, diff_vector, clean_small_cadence_buffers
+from . import segments as seg
+from . import batching
+from . import parallel
 import pandas as pd
 from copy import copy
 from fuzzytools.boostraping import BalancedCyclicBoostraping
@@ -29,16 +32,200 @@ def get_sigma_clipping_indexing(x, dist_mean, dist_sigma, sigma_m:float,
 def search_over_sigma_samples(lcset, b:str, dist_mean, dist_sigma, sigma_m,
 	apply_lower_bound:bool=True,
 	):
-	total_deleted_points = 0
-	for lcobj_name in lcset.get_lcobj_names():
-		sigmas = lcset[lcobj_name].get_b(b).obse
-		valid_indexs = get_sigma_clipping_indexing(sigmas, dist_mean, dist_sigma, sigma_m, apply_lower_bound)
-		deleted_points = np.sum(~valid_indexs)
-		total_deleted_points += deleted_points
-		lcset.data[lcobj_name].get_b(b).apply_valid_indexs_to_attrs(valid_indexs)
-
+	buffers, _ = lcset.get_band_buffer(b, ['obse'])
+	valid_indexs = get_sigma_clipping_indexing(buffers['obse'], dist_mean, dist_sigma, sigma_m, apply_lower_bound)
+	total_deleted_points = np.sum(~valid_indexs)
+	lcset.apply_valid_mask_b(b, valid_indexs)
 	return total_deleted_points
 
+def get_gathered_band_buffer(buffers:dict, offsets, indexs):
+	new_buffers = {attr:seg.gather_segments(buffers[attr], offsets, indexs)[0] for attr in buffers.keys()}
+	return new_buffers, seg.get_offsets(seg.get_lengths(offsets)[indexs])
+
+def get_tmaxs(days, obs, offsets):
+	'''
+	SubLCO.get_tmax of every segment (nan for empty segments)
+	'''
+	argmaxs = seg.segment_argmax(obs, offsets)
+	tmaxs = np.full((len(argmaxs),), np.nan)
+	nonempty = argmaxs>=0
+	tmaxs[nonempty] = days[argmaxs[nonempty]]
+	return tmaxs
+
+def get_days_durations(days, offsets):
+	'''
+	SubLCO.get_days_duration of every segment (nan for empty segments)
+	'''
+	first_days = seg.segment_reduce(np.minimum, days, offsets, np.nan, dtype=np.float64)
+	last_days = seg.segment_reduce(np.maximum, days, offsets, np.nan, dtype=np.float64)
+	return last_days-first_days
+
+def get_stats_info_dict(c,
+	x=[],
+	lengths=[],
+	durations=[],
+	d_days=[],
+	tmaxs=None,
+	):
+	info_dict = {
+		f'{c}-$x$':XError(x),
+		f'{c}-$L$':XError(lengths),
+		f'{c}-$\Delta T$':XError(durations),
+		f'{c}-$\Delta t$':XError(d_days),
+	}
+	if not tmaxs is None:
+		info_dict[f'{c}-tmax'] = XError(tmaxs)
+	return info_dict
+
+def get_class_index(labels:dict, class_names:list):
+	'''
+	labels: ordered dict lcobj_name->y, objects without label (y=None) are not in any class
+	'''
+	lcobj_names_cdict = {c:{} for c in class_names} # dicts as ordered sets
+	for lcobj_name,y in labels.items():
+		if not y is None:
+			lcobj_names_cdict[class_names[y]][lcobj_name] = None
+	class_index = {
+		'labels':labels,
+		'lcobj_names_cdict':lcobj_names_cdict,
+		}
+	return class_index
+
+def get_lcset_stats(lcset):
+	'''
+	Band and serial stats of every class, walking the band buffers of the lcset once
+	Returns a dict with the populations, the mean lengths and the info dicts used by get_bstats_idf and get_serial_stats_idf
+	'''
+	lcobj_names = lcset.get_lcobj_names()
+	labels = np.array(lcset.get_lcobj_labels(), dtype=int)
+	band_buffers = [lcset.get_band_buffer(b, ['days', 'obs'], lcobj_names) for b in lcset.band_names]
+	populations = np.bincount(labels, minlength=len(lcset.class_names)) if len(labels)>0 else np.zeros((len(lcset.class_names),), dtype=int)
+	stats = {
+		'populations':{c:int(populations[kc]) for kc,c in enumerate(lcset.class_names)},
+		'mean_lengths':{},
+		'bands':{},
+		'serial':{},
+		}
+
+	for b,(buffers, offsets) in zip(lcset.band_names, band_buffers):
+		lengths = seg.get_lengths(offsets)
+		durations = get_days_durations(buffers['days'], offsets)
+		tmaxs = get_tmaxs(buffers['days'], buffers['obs'], offsets)
+		d_days = seg.segment_diff(buffers['days'], offsets)
+		segment_labels = labels[seg.get_segment_ids(offsets)]
+		stats['mean_lengths'][b] = {}
+		stats['bands'][b] = {}
+		for kc,c in enumerate(lcset.class_names):
+			lcobj_mask = labels==kc
+			mask = segment_labels==kc
+			stats['mean_lengths'][b][c] = np.sum(lengths[lcobj_mask])/populations[kc] if populations[kc]>0 else np.nan
+			if populations[kc]==0:
+				stats['bands'][b][c] = get_stats_info_dict(c)
+				continue
+			stats['bands'][b][c] = get_stats_info_dict(c,
+				buffers['obs'][mask],
+				lengths[lcobj_mask],
+				durations[lcobj_mask & (lengths>=1)],
+				d_days[mask],
+				tmaxs[lcobj_mask & ~np.isnan(tmaxs)],
+				)
+
+	x, _, serial_offsets = batching.get_serial_buffer_from_band_buffers(band_buffers, ['days', 'obs'])
+	serial_days = x[:,C_.DAYS_INDEX]
+	serial_lengths = seg.get_lengths(serial_offsets)
+	serial_durations = get_days_durations(serial_days, serial_offsets)
+	serial_d_days = seg.segment_diff(serial_days, serial_offsets)
+	serial_labels = labels[seg.get_segment_ids(serial_offsets)]
+	for kc,c in enumerate(lcset.class_names):
+		lcobj_mask = labels==kc
+		mask = serial_labels==kc
+		if populations[kc]==0:
+			stats['serial'][c] = get_stats_info_dict(c)
+			continue
+		stats['serial'][c] = get_stats_info_dict(c,
+			x[:,C_.OBS_INDEX][mask],
+			serial_lengths[lcobj_mask],
+			serial_durations[lcobj_mask & (serial_lengths>=1)],
+			serial_d_days[mask],
+			)
+	return stats
+
+###################################################################################################################################################
+
+class LCSetSummary():
+	'''
+	Per-object lengths, durations, tmax and cadences of every band (and serial), used by LCSet.__repr__
+	Objects added or removed only change their own records. Objects modified in place (see LCSet.get_lcobj_state_keys)
+	are computed again, all the new records in one vectorized pass over the band buffers
+	'''
+	def __init__(self, band_names:list):
+		self.band_names = list(band_names)
+		self.records = {}
+
+	def pop(self, lcobj_name):
+		self.records.pop(lcobj_name, None)
+
+	def update(self, lcset):
+		state_keys = lcset.get_lcobj_state_keys()
+		for lcobj_name in list(self.records.keys()):
+			if not lcobj_name in state_keys or self.records[lcobj_name]['key']!=state_keys[lcobj_name][0]:
+				self.records.pop(lcobj_name)
+		new_lcobj_names = [lcobj_name for lcobj_name in state_keys.keys() if not lcobj_name in self.records]
+		if len(new_lcobj_names)>0:
+			self.add_lcobjs(lcset, new_lcobj_names, state_keys)
+		return self
+
+	def add_lcobjs(self, lcset, lcobj_names:list, state_keys:dict):
+		records = {lcobj_name:{'key':state_keys[lcobj_name][0], 'refs':state_keys[lcobj_name][1]} for lcobj_name in lcobj_names}
+		band_buffers = [lcset.get_band_buffer(b, ['days', 'obs'], lcobj_names) for b in self.band_names]
+		for b,(buffers, offsets) in zip(self.band_names, band_buffers):
+			self._set_records_values(records, lcobj_names, b, buffers['days'], offsets, buffers['obs'])
+		x, _, serial_offsets = batching.get_serial_buffer_from_band_buffers(band_buffers, ['days'])
+		self._set_records_values(records, lcobj_names, '.', x[:,0], serial_offsets)
+		self.records.update(records)
+
+	def _set_records_values(self, records:dict, lcobj_names:list, b:str, days, offsets,
+		obs=None,
+		):
+		lengths = seg.get_lengths(offsets).tolist()
+		durations = get_days_durations(days, offsets).tolist()
+		tmaxs = [np.nan]*len(lcobj_names) if obs is None else get_tmaxs(days, obs, offsets).tolist()
+		d_days = seg.split_segments(seg.segment_diff(days, offsets), offsets)
+		for k,lcobj_name in enumerate(lcobj_names):
+			records[lcobj_name][b] = (lengths[k], durations[k], tmaxs[k], d_days[k])
+
+	def get_values_b(self, b:str):
+		'''
+		b: band, or '.' for serial
+		Returns the lengths, the durations (non-empty curves), the tmaxs (non-empty curves) and all the cadences
+		'''
+		values = [record[b] for record in self.records.values()]
+		lengths = np.array([v[0] for v in values], dtype=int)
+		durations = np.array([v[1] for v in values], dtype=np.float64)[lengths>=1]
+		tmaxs = np.array([v[2] for v in values], dtype=np.float64)
+		d_days = np.concatenate([v[3] for v in values], axis=0) if len(values)>0 else np.zeros((0,))
+		return lengths, durations, tmaxs[~np.isnan(tmaxs)], d_days
+
+	def get_txt_b(self, b:str):
+		lengths, durations, tmaxs, d_days = self.get_values_b(b)
+		durations, cadences = XError(durations), XError(d_days)
+		if b=='.':
+			return f'(.) obs_samples={lengths.sum():,}; min_len={lengths.min()}; max_dur={durations.max():.1f}[days]; dur(p50)={durations.p50:.1f}[days]; cadence(p50)={cadences.p50:.1f}[days]\n'
+		tmaxs = XError(tmaxs)
+		return f'({b}) obs_samples={lengths.sum():,}; min_len={lengths.min()}; tmax={tmaxs.p50}; max_dur={durations.max():.1f} [days]; dur(p50)={durations.p50:.1f} [days]; cadence(p50)={cadences.p50:.1f} [days]\n'
+
+###################################################################################################################################################
+
+class DeferredLCSet():
+	'''
+	Placeholder for an lcset that is loaded the first time it is accessed through LCDataset.__getitem__
+	'''
+	def __init__(self, load_function):
+		self.load_function = load_function
+
+	def load(self):
+		return self.load_function()
+
 ###################################################################################################################################################
 
 class LCDataset():
@@ -73,7 +260,13 @@ class LCDataset():
 		return self
 
 	def __getitem__(self, lcset_name):
-		return self.lcsets[lcset_name]
+		lcset = self.lcsets[lcset_name]
+		if isinstance(lcset, DeferredLCSet):
+			lcset = self.set_lcset(lcset_name, lcset.load())
+		return lcset
+
+	def is_loaded(self, lcset_name):
+		return not isinstance(self.lcsets[lcset_name], DeferredLCSet)
 
 	def __repr__(self):
 		txt = 'LCDataset:\n'
@@ -99,20 +292,34 @@ class LCDataset():
 		to_split_lcset = self[to_split_lcset_name]
 		class_names = to_split_lcset.class_names
 		obj_names = to_split_lcset.get_lcobj_names()
-		obj_classes = [class_names[to_split_lcset[obj_name].y] for obj_name in obj_names]
+		obj_classes = [class_names[to_split_lcset.get_lcobj_source(obj_name).y] for obj_name in obj_names]
 		obj_names_kdict = fstats.stratified_kfold_split(obj_names, obj_classes, class_names, new_sets_props, kfolds,
 			random_state=random_state,
 			permute=permute,
 			)
 
+		### the new lcsets are views over one shared snapshot of the split lcset (see LCSetView)
+		### the snapshot is a copy that only the views reach, so later changes to the split lcset never reach the new lcsets
+		base = to_split_lcset.materialize(cow=False) if isinstance(to_split_lcset, LCSetView) else to_split_lcset.copy(cow=False)
+		base_lcobj_names = base.get_lcobj_names()
+		base_rows = {obj_name:k for k,obj_name in enumerate(base_lcobj_names)}
 		for new_set_name in obj_names_kdict.keys():
-			self.set_lcset(new_set_name, to_split_lcset.copy({}))
-			obj_names = obj_names_kdict[new_set_name]
-			for obj_name in obj_names:
-				lcobj = to_split_lcset[obj_name].copy()
-				self[new_set_name].data.update({obj_name:lcobj})
+			indexs = [base_rows[obj_name] for obj_name in obj_names_kdict[new_set_name]]
+			self.set_lcset(new_set_name, LCSetView(base, indexs, base_lcobj_names))
 		return
 
+	def materialize(self,
+		lcset_names=None,
+		cow:bool=False,
+		):
+		'''
+		Replace the lcset views by independent lcsets
+		'''
+		lcset_names = self.get_lcset_names() if lcset_names is None else lcset_names
+		for lcset_name in lcset_names:
+			if isinstance(self[lcset_name], LCSetView):
+				self.set_lcset(lcset_name, self[lcset_name].materialize(cow))
+
 	def sigma_clipping(self, lcset_name, new_lcset_name,
 		sigma_n:int=1,
 		sigma_m:float=3.,
@@ -120,30 +327,41 @@ class LCDataset():
 		verbose:int=1,
 		remove_old_lcset=True,
 		):
-		lcset = self.set_lcset(new_lcset_name, self[lcset_name].copy())
-		#print(f'survey={lcset.survey}; after processing={lcset_name} (>{new_lcset_name})')
-		total_deleted_points = {b:0 for b in lcset.band_names}
-		for k in range(sigma_n):
-			#print(f'k={k}')
-			for b in lcset.band_names:
-				sigma_values = lcset.get_lcset_values_b(b, 'obse')
-				sigma_samples = len(sigma_values)
-				mean = np.mean(sigma_values)
-				sigma = np.std(sigma_values)
-				deleted_points = search_over_sigma_samples(lcset, b, mean, sigma, sigma_m, apply_lower_bound)
-				#print(f'\tband={b}; sigma_samples={sigma_samples:,}; mean={mean}; std={sigma}')
-				#print(f'\tdeleted_points={deleted_points:,}')
-				total_deleted_points[b] += deleted_points
-		
-			lcset.clean_empty_obs_keys()
-			lcset.reset_day_offset_serial()
-			sigma_samples = len(lcset.get_lcset_values_b(b, 'obse'))
-			#print(f'sigma_samples={sigma_samples:,}; total_deleted_points={total_deleted_points}')
+		lcset = self.set_lcset(new_lcset_name, self[lcset_name].copy(cow=True))
+		total_deleted_points = lcset.sigma_clipping(sigma_n, sigma_m, apply_lower_bound)
 
 		if remove_old_lcset:
 			self.del_lcset(lcset_name)
 		return total_deleted_points
 
+	def clean_small_cadence(self,
+		dt=C_.CADENCE_THRESHOLD,
+		mode='expectation',
+		lcset_names=None,
+		):
+		'''
+		Along all lcsets
+		'''
+		lcset_names = self.get_lcset_names() if lcset_names is None else lcset_names
+		for lcset_name in lcset_names:
+			self[lcset_name].clean_small_cadence(dt, mode)
+
+	def parallel_apply(self, function,
+		lcset_names=None,
+		n_jobs:int=None,
+		chunk_size:int=C_.CHUNK_SIZE,
+		seed=0,
+		**kwargs
+		):
+		'''
+		Along all lcsets, see LCSet.parallel_apply
+		Every lcset gets its own seed spawned from seed
+		'''
+		lcset_names = self.get_lcset_names() if lcset_names is None else lcset_names
+		seed_sequences = parallel.get_seed_sequences(seed, len(lcset_names))
+		for lcset_name,seed_sequence in zip(lcset_names, seed_sequences):
+			self[lcset_name].parallel_apply(function, None, n_jobs, chunk_size, seed_sequence, **kwargs)
+
 	def get_serial_stats_idf(self,
 		lcset_names=None,
 		):
@@ -167,8 +385,13 @@ class LCDataset():
 	def __copy__(self):
 		return self.copy()
 
-	def copy(self):
-		lcsets = {k:copy(self.lcsets[k]) for k in self.lcsets.keys()}
+	def copy(self,
+		cow:bool=False,
+		):
+		'''
+		cow: copy-on-write, see LCSet.copy
+		'''
+		lcsets = {k:self[k].copy(cow=cow) for k in self.get_lcset_names()}
 		return LCDataset(lcsets)
 
 ###################################################################################################################################################
@@ -191,13 +414,64 @@ class LCSet():
 		self.reset()
 
 	def reset(self):
+		self.reset_class_index()
+		self.reset_summary()
 		self.reset_boostrap()
 
+	def reset_summary(self):
+		self.summary = None
+
+	def get_summary(self):
+		'''
+		Summary kept between calls and updated only for the objects added, removed or modified since the last call (see LCSetSummary)
+		'''
+		summary = getattr(self, 'summary', None)
+		if summary is None or summary.band_names!=list(self.band_names):
+			summary = LCSetSummary(self.band_names)
+			self.summary = summary
+		return summary.update(self)
+
+	def pop_summary(self, lcobj_name):
+		summary = getattr(self, 'summary', None)
+		if not summary is None:
+			summary.pop(lcobj_name)
+
+	def reset_class_index(self):
+		'''
+		The class index (object labels and class -> ordered object names) is built lazily and kept updated by set_lcobj, pop_lcobj and keep_rows
+		If objects or labels are modified directly in data, call this method
+		'''
+		self.class_index = None
+
+	def get_class_index(self):
+		class_index = getattr(self, 'class_index', None)
+		if class_index is None or len(class_index['labels'])!=len(self.data):
+			labels = {lcobj_name:self.get_lcobj_source(lcobj_name).y for lcobj_name in self.data.keys()}
+			self.class_index = get_class_index(labels, self.class_names)
+		return self.class_index
+
+	def update_class_index(self, lcobj_name, y):
+		class_index = self.get_class_index()
+		if lcobj_name in class_index['labels'] and class_index['labels'][lcobj_name]!=y:
+			self.reset_class_index() # the order inside the new class would change, rebuild it
+			return
+		class_index['labels'][lcobj_name] = y
+		if not y is None:
+			class_index['lcobj_names_cdict'][self.class_names[y]][lcobj_name] = None
+
+	def pop_class_index(self, lcobj_name):
+		class_index = self.get_class_index()
+		if not lcobj_name in class_index['labels']:
+			return
+		y = class_index['labels'].pop(lcobj_name)
+		if not y is None:
+			class_index['lcobj_names_cdict'][self.class_names[y]].pop(lcobj_name, None)
+
 	def reset_boostrap(self,
 		k_n=1,
 		):
 		lcobj_names = self.get_lcobj_names()
-		lcobj_classes = [self.class_names[self[lcobj_name].y] for lcobj_name in lcobj_names]
+		lcobj_classes = self.get_lcobj_classes()
 		self.boostrap = BalancedCyclicBoostraping(lcobj_names, lcobj_classes,
 			k_n=k_n,
 			)
@@ -209,6 +483,18 @@ class LCSet():
 	def __getitem__(self, lcobj_name):
 		return self.data[lcobj_name]
 
+	def get_lcobj_source(self, lcobj_name):
+		'''
+		Stored object, used by the reading methods. Do not modify it in place
+		'''
+		return self.data[lcobj_name]
+
+	def get_lcobj_writable(self, lcobj_name):
+		'''
+		Stored object, used by the methods that modify objects in place
+		'''
+		return self.data[lcobj_name]
+
 	def get_info(self):
 		info = {
 			'survey':self.survey,
@@ -225,7 +511,7 @@ class LCSet():
 		if c is None:
 			return list(self.data.keys())
 		else:
-			return [k for k in self.data.keys() if self.class_names[self.data[k].y]==c]
+			return list(self.get_class_index()['lcobj_names_cdict'][c].keys())
 
 	def get_lcobjs(self,
 		c=None,
@@ -236,18 +522,25 @@ class LCSet():
 		length_to_keep=C_.MIN_POINTS_LIGHTCURVE_DEFINITION,
 		verbose:int=0,
 		):
-		lcobj_names = self.get_lcobj_names()
-		to_delete_lcobj_names = [lcobj_name for lcobj_name in lcobj_names if not any([len(self[lcobj_name].get_b(b))>=length_to_keep for b in self.band_names])]
-		deleted_lcobjs = len(to_delete_lcobj_names)
+		valid_rows = np.zeros((len(self),), dtype=bool)
+		for b in self.band_names:
+			valid_rows |= self.get_lengths_b(b)>=length_to_keep
+		deleted_lcobjs = int(np.sum(~valid_rows))
 
 		if verbose:
 			print(f'deleted lcobjs={deleted_lcobjs}')
 
-		for lcobj_name in to_delete_lcobj_names:
-			self.data.pop(lcobj_name, None)
-
+		self.keep_rows(valid_rows)
 		return deleted_lcobjs
 
+	def keep_rows(self, valid_rows):
+		'''
+		Keep only the objects given by the boolean mask valid_rows (aligned with get_lcobj_names)
+		'''
+		lcobj_names = self.get_lcobj_names()
+		for k in np.where(~np.asarray(valid_rows))[0]:
+			self.pop_lcobj(lcobj_names[k])
+
 	def get_random_lcobj_name(self):
 		lcobj_names = self.get_lcobj_names()
 		return lcobj_names[random.randint(0, len(lcobj_names)-1)]
@@ -261,45 +554,141 @@ class LCSet():
 		return self[lcobj_name]
 
 	def set_lcobj(self, lcobj_name, lcobj):
+		self.update_class_index(lcobj_name, lcobj.y)
+		self.pop_summary(lcobj_name)
 		self.data[lcobj_name] = lcobj
 
+	def pop_lcobj(self, lcobj_name,
+		default=None,
+		):
+		self.pop_class_index(lcobj_name)
+		self.pop_summary(lcobj_name)
+		return self.data.pop(lcobj_name, default)
+
+	def parallel_map(self, function,
+		lcobj_names:list=None,
+		n_jobs:int=None,
+		chunk_size:int=C_.CHUNK_SIZE,
+		seed=0,
+		**kwargs
+		):
+		'''
+		Results of function(lcobj, rng, **kwargs) along the objects lcobj_names (all by default), see parallel.map_shards
+		The workers receive copies of the objects, use parallel_apply to keep the modified objects
+		'''
+		lcobj_names = self.get_lcobj_names() if lcobj_names is None else lcobj_names
+		return parallel.map_shards(parallel.apply_lcobj_function, [self.get_lcobj_source(lcobj_name) for lcobj_name in lcobj_names],
+			n_jobs,
+			chunk_size,
+			seed,
+			lcobj_function=function,
+			**kwargs
+			)
+
+	def parallel_apply(self, function,
+		lcobj_names:list=None,
+		n_jobs:int=None,
+		chunk_size:int=C_.CHUNK_SIZE,
+		seed=0,
+		**kwargs
+		):
+		'''
+		Same as parallel_map, but function returns the new object, which replaces the old one
+		'''
+		lcobj_names = self.get_lcobj_names() if lcobj_names is None else lcobj_names
+		new_lcobjs = self.parallel_map(function, lcobj_names, n_jobs, chunk_size, seed, **kwargs)
+		for lcobj_name,new_lcobj in zip(lcobj_names, new_lcobjs):
+			self.set_lcobj(lcobj_name, new_lcobj)
+
+	def call_lcobj_method(self, method:str,
+		args:tuple=(),
+		n_jobs:int=1,
+		chunk_size:int=C_.CHUNK_SIZE,
+		):
+		'''
+		Along all keys, calls an in-place method of LCO and sets the modified objects back
+		With n_jobs!=1 the objects come back pickled from the workers: only their state is kept, not their derived arrays (see SubLCO.__getstate__)
+		'''
+		if n_jobs==1:
+			for lcobj_name in self.get_lcobj_names():
+				lcobj = self[lcobj_name]
+				getattr(lcobj, method)(*args)
+				self.set_lcobj(lcobj_name, lcobj)
+		else:
+			self.parallel_apply(parallel.call_lcobj_method, None, n_jobs, chunk_size, method=method, args=args)
+
 	def set_diff_parallel(self, attr:str):
 		'''
 		Along all keys
+		Not needed anymore: d_{attr} is computed on first access (see SubLCO), this only computes it ahead for the stored objects
 		'''
 		for lcobj_name in self.get_lcobj_names():
-			self[lcobj_name].set_diff_parallel(attr)
+			self.get_lcobj_source(lcobj_name).set_diff_parallel(attr)
 
 	def keys(self):
 		return self.__dict__.keys()
 
 	def get_lcobj_labels(self):
-		return [lcobj.y for lcobj in self.get_lcobjs()]
+		return list(self.get_class_index()['labels'].values())
 
 	def get_lcobj_classes(self):
 		'''
 		Used for classes histogram
 		'''
 		lcobj_labels =self.get_lcobj_labels()
+		if None in lcobj_labels:
+			raise Exception('objects without label (y=None) have no class')
 		return [self.class_names[y] for y in lcobj_labels]
 
 	def get_populations_cdict(self):
-		return fstats.get_populations_cdict(self.get_lcobj_classes(), self.class_names)
+		lcobj_names_cdict = self.get_class_index()['lcobj_names_cdict']
+		return {c:len(lcobj_names_cdict[c]) for c in self.class_names}
 
 	def get_class_balanced_weights_cdict(self):
 		pop_cdict = self.get_populations_cdict()
 		w = {c:1/(pop_cdict[c]*len(self.class_names)) for c in self.class_names} # 1/(Nc*C)
 		return w
 
+	def get_stats_key(self):
+		'''
+		Key of the current state of the set (objects, labels and band versions, see SubLCO.version), and the objects it refers to
+		The referred objects are kept alive by the stats cache, so their ids can not be reused while cached
+		'''
+		key = []
+		sublcobjs = []
+		for lcobj_name,(lcobj_key, lcobj_sublcobjs) in self.get_lcobj_state_keys().items():
+			key.append((lcobj_name,)+lcobj_key)
+			sublcobjs += lcobj_sublcobjs
+		return key, sublcobjs
+
+	def get_lcobj_state_keys(self):
+		'''
+		Dict lcobj_name->(key, refs): key of the current state of every object (label and band versions) and the objects it refers to
+		'''
+		state_keys = {}
+		for lcobj_name in self.data.keys():
+			lcobj = self.get_lcobj_source(lcobj_name)
+			sublcobjs = [lcobj.get_b(b) for b in self.band_names]
+			state_keys[lcobj_name] = (lcobj.y, tuple([(id(sublcobj), sublcobj.version) for sublcobj in sublcobjs])), sublcobjs
+		return state_keys
+
+	def get_stats(self):
+		'''
+		Cached get_lcset_stats, computed again only if the set was modified
+		'''
+		key, refs = self.get_stats_key()
+		stats_cache = getattr(self, 'stats_cache', None)
+		if stats_cache is None or stats_cache['key']!=key:
+			self.stats_cache = {'key':key, 'refs':refs, 'stats':get_lcset_stats(self)}
+		return self.stats_cache['stats']
+
 	def get_mean_length_df_bdict(self,
 		index=None,
 		):
+		stats = self.get_stats()
 		df_bdict = {}
 		for kb,b in enumerate(self.band_names):
-			info_dict = {}
-			for kc,c in enumerate(self.class_names):
-				lcobjs = self.get_lcobjs(c)
-				info_dict[f'{c}{b}-$N_c$'] = sum([len(lcobj.get_b(b)) for lcobj in lcobjs])/len(lcobjs)
+			info_dict = {f'{c}{b}-$N_c$':stats['mean_lengths'][b][c] for c in self.class_names}
 			df = pd.DataFrame.from_dict({id(self) if index is None else index:info_dict}, orient='index')
 			df.index.rename(C_.SET_NAME_STR, inplace=True)
 			df_bdict[b] = df
@@ -309,32 +698,14 @@ class LCSet():
 	def get_class_stats_idf(self,
 		index=None,
 		):
-		info_dict = {}
-		for kc,c in enumerate(self.class_names):
-			lcobjs = self.get_lcobjs(c)
-			info_dict[f'{c}-$N_c$'] = len(lcobjs)
+		stats = self.get_stats()
+		info_dict = {f'{c}-$N_c$':stats['populations'][c] for c in self.class_names}
 		df = pd.DataFrame.from_dict({id(self) if index is None else index:info_dict}, orient='index')
 		df.index.rename(C_.SET_NAME_STR, inplace=True)
 		return df, self.get_mean_length_df_bdict()
 
 	def get_serial_stats_idf_c(self, c):
-		lcobjs = self.get_lcobjs(c)
-		if len(lcobjs)>0:
-			xs = [lcobj.get_x_serial() for lcobj in lcobjs]
-			info_dict = {
-				f'{c}-$x$':XError(np.concatenate([x[:,C_.OBS_INDEX] for x in xs])),
-				f'{c}-$L$':XError([len(lcobj) for lcobj in lcobjs]),
-				f'{c}-$\Delta T$':XError([lcobj.get_days_serial_duration() for lcobj in lcobjs]),
-				f'{c}-$\Delta t$':XError(np.concatenate([diff_vector(x[:,C_.DAYS_INDEX]) for x in xs])),
-			}
-		else:
-			info_dict = {
-				f'{c}-$x$':XError([]),
-				f'{c}-$L$':XError([]),
-				f'{c}-$\Delta T$':XError([]),
-				f'{c}-$\Delta t$':XError([]),
-			}
-		return info_dict
+		return self.get_stats()['serial'][c].copy()
 
 	def get_serial_stats_idf(self,
 		index=None,
@@ -351,23 +722,7 @@ class LCSet():
 	def get_bstats_idf_c(self, c, b,
 		index=None,
 		):
-		lcobjs = self.get_lcobjs(c)
-		if len(lcobjs)>0:
-			info_dict = {
-				f'{c}-$x$':XError(np.concatenate([lcobj.get_b(b).obs for lcobj in lcobjs])),
-				f'{c}-$L$':XError([len(lcobj.get_b(b)) for lcobj in lcobjs]),
-				f'{c}-$\Delta T$':XError([lcobj.get_b(b).get_days_duration() for lcobj in lcobjs if len(lcobj.get_b(b))>=1]),
-				f'{c}-$\Delta t$':XError(np.concatenate([lcobj.get_b(b).get_diff('days') for lcobj in lcobjs])),
-				f'{c}-tmax':XError([lcobj.get_b(b).get_tmax() for lcobj in lcobjs if not np.isnan(lcobj.get_b(b).get_tmax())]),
-			}
-		else:
-			info_dict = {
-				f'{c}-$x$':XError([]),
-				f'{c}-$L$':XError([]),
-				f'{c}-$\Delta T$':XError([]),
-				f'{c}-$\Delta t$':XError([]),
-			}
-		
+		info_dict = self.get_stats()['bands'][b][c].copy()
 		info_dict = {id(self) if index is None else index:info_dict}
 		df = pd.DataFrame.from_dict(info_dict, orient='index').reindex(list(info_dict.keys()))
 		df.index.rename(C_.SET_NAME_STR, inplace=True)
@@ -384,28 +739,12 @@ class LCSet():
 		return df
 
 	### repr
-	def __repr__b(self, b):
-		df = self.get_bstats_idf(b)
-		lengths = sum([df[f'{c}-$L$'].values[0] for c in self.class_names])
-		durations = sum([df[f'{c}-$\Delta T$'].values[0] for c in self.class_names])
-		cadences = sum([df[f'{c}-$\Delta t$'].values[0] for c in self.class_names])
-		tmaxs = sum([df[f'{c}-tmax'].values[0] for c in self.class_names])
-		txt = f'({b}) obs_samples={lengths.sum():,}; min_len={lengths.min()}; tmax={tmaxs.p50}; max_dur={durations.max():.1f} [days]; dur(p50)={durations.p50:.1f} [days]; cadence(p50)={cadences.p50:.1f} [days]\n'
-		return txt
-
-	def __repr_serial(self):
-		df = self.get_serial_stats_idf()
-		lengths = sum([df[f'{c}-$L$'].values[0] for c in self.class_names])
-		durations = sum([df[f'{c}-$\Delta T$'].values[0] for c in self.class_names])
-		cadences = sum([df[f'{c}-$\Delta t$'].values[0] for c in self.class_names])
-		txt = f'(.) obs_samples={lengths.sum():,}; min_len={lengths.min()}; max_dur={durations.max():.1f}[days]; dur(p50)={durations.p50:.1f}[days]; cadence(p50)={cadences.p50:.1f}[days]\n'
-		return txt
-
 	def __repr__(self):
 		if len(self)>0:
-			txt = self.__repr_serial()
+			summary = self.get_summary()
+			txt = summary.get_txt_b('.')
 			for b in self.band_names:
-				txt += self.__repr__b(b)
+				txt += summary.get_txt_b(b)
 			populations_cdict = self.get_populations_cdict()
 			txt += str(LevelBar(populations_cdict, ' '*3))
 		else:
@@ -415,29 +754,53 @@ class LCSet():
 	def __len__(self):
 		return len(self.get_lcobj_names())
 
+	def get_obs_counts_bdict(self):
+		'''
+		Number of observations of every class, for all bands: b -> c -> count
+		'''
+		return {b:self.get_obs_counts_b_cdict(b) for b in self.band_names}
+
+	def get_obs_counts_b_cdict(self, b:str):
+		labels = np.array(self.get_lcobj_labels(), dtype=int)
+		counts = np.bincount(labels, weights=self.get_lengths_b(b), minlength=len(self.class_names)) if len(labels)>0 else np.zeros((len(self.class_names),))
+		return {c:int(counts[kc]) for kc,c in enumerate(self.class_names)}
+
 	def get_lcobj_obs_classes_b_cdict(self, b:str):
 		'''
 		Used for obs histogram
+		The class of every observation, see get_obs_counts_b_cdict to get the counts directly
 		'''
-		classes = [[self.class_names[self.data[k].y]]*len(self.data[k].get_b(b)) for k in self.data.keys()]
-		classes = sum(classes, []) # flat lists
-		return classes
+		labels = np.array(self.get_lcobj_labels(), dtype=int)
+		classes = np.repeat(np.array(self.class_names, dtype=object)[labels], self.get_lengths_b(b))
+		return classes.tolist()
 
 	def get_lcobj_obsmean_b_cdict(self, b:str):
 		population_dict = self.get_populations_cdict()
-		uniques, counts = np.unique(self.get_lcobj_obs_classes_b_cdict(b), return_counts=True)
-		return {c:counts[list(uniques).index(c)]/population_dict[c] for c in self.class_names}
+		obs_counts_cdict = self.get_obs_counts_b_cdict(b)
+		return {c:obs_counts_cdict[c]/population_dict[c] for c in self.class_names}
 
 	def get_max_length_serial(self):
-		return max([len(self.data[k]) for k in self.data.keys()])
+		return max(self.get_lengths_serial())
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state.pop('stats_cache', None) # caches are not saved
+		state.pop('class_index', None)
+		state.pop('summary', None)
+		return state
 
 	def __copy__(self):
 		return self.copy()
 
 	def copy(self,
 		data:dict=None,
+		cow:bool=False,
 		):
-		new_data = {k:copy(self.data[k]) for k in self.data.keys()} if data is None else data
+		'''
+		cow: copy-on-write, objects share their arrays with this lcset until they are modified (see SubLCO.copy)
+		the arrays of this lcset must not be written in place afterwards (LCDataset.split uses a full copy for this reason)
+		'''
+		new_data = {k:self.get_lcobj_source(k).copy(cow=cow) for k in self.data.keys()} if data is None else data
 		new_set = LCSet(
 			new_data,
 			self.survey,
@@ -462,9 +825,162 @@ class LCSet():
 	def get_lcset_values_b(self, b:str, attr:str,
 		target_class:str=None,
 		):
-		values = [getattr(lcobj.get_b(b), attr) for lcobj in self.get_lcobjs() if (target_class is None or target_class==self.class_names[lcobj.y])]
-		values = np.concatenate(values, axis=0)
-		return values
+		lcobj_names = None if target_class is None else self.get_lcobj_names(target_class)
+		buffers, _ = self.get_band_buffer(b, [attr], lcobj_names)
+		return buffers[attr]
+
+	def get_band_buffer(self, b:str,
+		attrs:list=['days', 'obs', 'obse'],
+		lcobj_names:list=None,
+		):
+		'''
+		Values of the band b concatenated along objects (CSR-style)
+		Returns a dict attr->buffer and the offsets: the object k lives in buffer[offsets[k]:offsets[k+1]]
+		Buffers can be shared with the lcset, do not modify them in place
+		'''
+		lcobj_names = self.get_lcobj_names() if lcobj_names is None else lcobj_names
+		sublcobjs = [self.get_lcobj_source(lcobj_name).get_b(b) for lcobj_name in lcobj_names]
+		offsets = seg.get_offsets([len(sublcobj) for sublcobj in sublcobjs])
+		buffers = {}
+		for attr in attrs:
+			buffers[attr], _ = seg.concatenate_segments([getattr(sublcobj, attr) for sublcobj in sublcobjs])
+		return buffers, offsets
+
+	def set_band_buffer(self, b:str, buffers:dict, offsets):
+		'''
+		Inverse of get_band_buffer: set new days, obs and obse to the band b of every object
+		'''
+		for k,lcobj_name in enumerate(self.get_lcobj_names()):
+			i, j = offsets[k], offsets[k+1]
+			self.get_lcobj_writable(lcobj_name).get_b(b).set_values(buffers['days'][i:j], buffers['obs'][i:j], buffers['obse'][i:j])
+
+	def apply_valid_mask_b(self, b:str, valid_mask):
+		'''
+		Be careful, this method can remove info
+		valid_mask is a boolean buffer aligned with get_band_buffer(b)
+		'''
+		lcobj_names = self.get_lcobj_names()
+		_, offsets = self.get_band_buffer(b, [], lcobj_names)
+		for k,lcobj_name in enumerate(lcobj_names):
+			self.get_lcobj_writable(lcobj_name).get_b(b).apply_valid_indexs_to_attrs(valid_mask[offsets[k]:offsets[k+1]])
+
+	def get_lengths_b(self, b:str,
+		lcobj_names:list=None,
+		):
+		_, offsets = self.get_band_buffer(b, [], lcobj_names)
+		return seg.get_lengths(offsets)
+
+	def get_lengths_serial(self,
+		lcobj_names:list=None,
+		):
+		'''
+		Serial length (observations along all bands) of every object
+		'''
+		return sum([self.get_lengths_b(b, lcobj_names) for b in self.band_names])
+
+	def get_snr_b(self, b:str,
+		lcobj_names:list=None,
+		eps=1e-10,
+		):
+		'''
+		SubLCO.get_snr of every object (nan for empty bands), as segment reductions over the band buffer
+		'''
+		buffers, offsets = self.get_band_buffer(b, ['obs', 'obse'], lcobj_names)
+		snr = (buffers['obs']**2)/(buffers['obse']**2+eps)
+		return seg.segment_mean(snr, offsets)
+
+	def get_snr(self,
+		lcobj_names:list=None,
+		):
+		'''
+		LCO.get_snr of every object: max snr along bands
+		'''
+		return np.fmax.reduce([self.get_snr_b(b, lcobj_names) for b in self.band_names], axis=0)
+
+	def get_tmax_b(self, b:str,
+		lcobj_names:list=None,
+		):
+		'''
+		SubLCO.get_tmax of every object (nan for empty bands)
+		'''
+		buffers, offsets = self.get_band_buffer(b, ['days', 'obs'], lcobj_names)
+		return get_tmaxs(buffers['days'], buffers['obs'], offsets)
+
+	def get_days_duration_b(self, b:str,
+		lcobj_names:list=None,
+		):
+		'''
+		SubLCO.get_days_duration of every object (nan for empty bands)
+		'''
+		buffers, offsets = self.get_band_buffer(b, ['days'], lcobj_names)
+		return get_days_durations(buffers['days'], offsets)
+
+	def get_days_serial_duration(self,
+		lcobj_names:list=None,
+		):
+		'''
+		LCO.get_days_serial_duration of every object (nan for empty objects)
+		'''
+		first_days = []
+		last_days = []
+		for b in self.band_names:
+			buffers, offsets = self.get_band_buffer(b, ['days'], lcobj_names)
+			first_days.append(seg.segment_reduce(np.minimum, buffers['days'], offsets, np.nan, dtype=np.float64))
+			last_days.append(seg.segment_reduce(np.maximum, buffers['days'], offsets, np.nan, dtype=np.float64))
+		return np.fmax.reduce(last_days, axis=0)-np.fmin.reduce(first_days, axis=0)
+
+	def get_length_buckets(self, batch_size:int,
+		lcobj_names:list=None,
+		rng=None,
+		):
+		'''
+		Lists of object names with similar serial lengths, to minimize padding (see get_padded_serial_batch)
+		'''
+		lcobj_names = self.get_lcobj_names() if lcobj_names is None else lcobj_names
+		buckets = batching.get_length_buckets(self.get_lengths_serial(lcobj_names), batch_size, rng)
+		return [[lcobj_names[k] for k in bucket] for bucket in buckets]
+
+	def get_padded_serial_batch(self, lcobj_names:list,
+		attrs:list=['days', 'obs', 'obse'],
+		max_length:int=None,
+		out:dict=None,
+		dtype=np.float32,
+		):
+		'''
+		Padded x, band onehot, mask and lengths of the objects lcobj_names, built in one vectorized pass
+		See batching.get_padded_serial_batch
+		'''
+		return batching.get_padded_serial_batch(self, lcobj_names, attrs,
+			max_length=max_length,
+			out=out,
+			dtype=dtype,
+			)
+
+	def iter_boostrap_batches(self, batch_size:int,
+		attrs:list=['days', 'obs', 'obse'],
+		n_batches:int=None,
+		augment_kwargs:dict=None,
+		max_length:int=None,
+		prefetch:int=2,
+		n_workers:int=1,
+		use_processes:bool=False,
+		seed=0,
+		**kwargs
+		):
+		'''
+		Prefetched padded serial batches of bootstrap samples, optionally augmented (see batching.iter_boostrap_batches)
+		n_batches: if None, the batches of one bootstrap round
+		'''
+		return batching.iter_boostrap_batches(self, batch_size, attrs,
+			n_batches=n_batches,
+			augment_kwargs=augment_kwargs,
+			max_length=max_length,
+			prefetch=prefetch,
+			n_workers=n_workers,
+			use_processes=use_processes,
+			seed=seed,
+			**kwargs
+			)
 
 	def get_lcset_max_value_b(self, b:str, attr,
 		target_class=None,
@@ -483,16 +999,255 @@ class LCSet():
 
 	def reset_day_offset_serial(self,
 		store_day_offset:bool=False,
+		n_jobs:int=1,
 		):
 		'''
 		Along all keys
+		n_jobs: processes (see parallel_map), C_.N_JOBS if None
+		'''
+		self.call_lcobj_method('reset_day_offset_serial', (store_day_offset,), n_jobs)
+
+	def sigma_clipping(self,
+		sigma_n:int=1,
+		sigma_m:float=3.,
+		apply_lower_bound:bool=True,
+		length_to_keep=C_.MIN_POINTS_LIGHTCURVE_DEFINITION,
+		):
+		'''
+		Be careful, this method can remove info
+		Same as sigma_n rounds of search_over_sigma_samples (every band), clean_empty_obs_keys and reset_day_offset_serial,
+		but over the band buffers: the objects are read and written only once
+		Returns the deleted points per band
+		'''
+		lcobj_names = self.get_lcobj_names()
+		band_buffers = {b:self.get_band_buffer(b, SubLCO.ARRAY_ATTRS, lcobj_names) for b in self.band_names}
+		valid_rows = np.ones((len(lcobj_names),), dtype=bool)
+		total_deleted_points = {b:0 for b in self.band_names}
+		for k in range(0, sigma_n):
+			for b in self.band_names:
+				buffers, offsets = band_buffers[b]
+				sigma_values = buffers['obse']
+				valid_mask = get_sigma_clipping_indexing(sigma_values, np.mean(sigma_values), np.std(sigma_values), sigma_m, apply_lower_bound)
+				total_deleted_points[b] += np.sum(~valid_mask)
+				band_buffers[b] = {attr:buffers[attr][valid_mask] for attr in SubLCO.ARRAY_ATTRS}, seg.compact_segments(valid_mask, offsets)
+
+			### clean_empty_obs_keys
+			valid_indexs = np.where(valid_rows)[0]
+			new_valid_rows = np.zeros((len(valid_indexs),), dtype=bool)
+			for b in self.band_names:
+				new_valid_rows |= seg.get_lengths(band_buffers[b][1])>=length_to_keep
+			for b in self.band_names:
+				buffers, offsets = band_buffers[b]
+				band_buffers[b] = get_gathered_band_buffer(buffers, offsets, np.where(new_valid_rows)[0])
+			valid_rows[valid_indexs[~new_valid_rows]] = False
+
+		if sigma_n>0:
+			### reset_day_offset_serial, the min first day along all bands
+			first_days = [seg.segment_reduce(np.minimum, band_buffers[b][0]['days'], band_buffers[b][1], np.inf, dtype=np.float64) for b in self.band_names]
+			day_offsets = np.min(first_days, axis=0)
+			for b in self.band_names:
+				buffers, offsets = band_buffers[b]
+				buffers['days'] = (buffers['days']-np.repeat(day_offsets, seg.get_lengths(offsets))).astype(buffers['days'].dtype)
+
+		self.keep_rows(valid_rows)
+		for b in self.band_names:
+			self.set_band_buffer(b, *band_buffers[b])
+		return total_deleted_points
+
+	def clean_small_cadence(self,
+		dt=C_.CADENCE_THRESHOLD,
+		mode='expectation',
+		):
+		'''
+		Along all keys, one batched call per band
 		'''
-		for lcobj in self.get_lcobjs():
-			lcobj.reset_day_offset_serial(store_day_offset)
+		for b in self.band_names:
+			buffers, offsets = self.get_band_buffer(b)
+			new_days, new_obs, new_obse, new_offsets = clean_small_cadence_buffers(buffers['days'], buffers['obs'], buffers['obse'], offsets,
+				dt,
+				mode,
+				)
+			self.set_band_buffer(b, {'days':new_days, 'obs':new_obs, 'obse':new_obse}, new_offsets)
 
 	def __add__(self, other):
-		new = self.copy()
+		new = self.copy(cow=True)
 		lcobj_names = other.get_lcobj_names()
 		for lcobj_name in lcobj_names:
-			new.set_lcobj(lcobj_name, other[lcobj_name].copy())
-		return new
\ No newline at end of file
+			new.set_lcobj(lcobj_name, other.get_lcobj_source(lcobj_name).copy(cow=True))
+		return new
+
+###################################################################################################################################################
+
+class LCSetData():
+	'''
+	Dict-like access to the objects of an lcset that does not store them in a dict (see ColumnarLCSet and LCSetView)
+	The lcset must provide lcobj_names, has_lcobj, get_lcobj, set_lcobj and pop_lcobj
+	'''
+	def __init__(self, lcset):
+		self.lcset = lcset
+
+	def __getitem__(self, lcobj_name):
+		return self.lcset.get_lcobj(lcobj_name)
+
+	def __setitem__(self, lcobj_name, lcobj):
+		self.lcset.set_lcobj(lcobj_name, lcobj)
+
+	def __contains__(self, lcobj_name):
+		return self.lcset.has_lcobj(lcobj_name)
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.lcset.lcobj_names)
+
+	def keys(self):
+		return list(self.lcset.lcobj_names)
+
+	def values(self):
+		return [self[lcobj_name] for lcobj_name in self.keys()]
+
+	def items(self):
+		return [(lcobj_name, self[lcobj_name]) for lcobj_name in self.keys()]
+
+	def get(self, lcobj_name,
+		default=None,
+		):
+		return self[lcobj_name] if lcobj_name in self else default
+
+	def pop(self, lcobj_name,
+		default=None,
+		):
+		return self.lcset.pop_lcobj(lcobj_name, default)
+
+	def update(self, new_data:dict):
+		for lcobj_name in new_data.keys():
+			self.lcset.set_lcobj(lcobj_name, new_data[lcobj_name])
+
+###################################################################################################################################################
+
+class LCSetView(LCSet):
+	'''
+	LCSet over a subset of the objects of a base lcset, given by an index array over base_lcobj_names
+	No object is copied when the view is created and the reading methods use the base objects directly (get_lcobj_source)
+	lcset[lcobj_name] returns the object of the view, as in LCSet: on first access the base object is copied (writable arrays) into self.overlay,
+	so the in-place changes are kept. Only the objects set or accessed by lcset[lcobj_name] are kept in self.overlay: the base lcset is never modified
+	Many views can share the same base (k-fold splits), use materialize to get an independent LCSet
+	'''
+	def __init__(self, base, indexs,
+		base_lcobj_names:list=None,
+		):
+		self.base = base
+		self.base_lcobj_names = base.get_lcobj_names() if base_lcobj_names is None else base_lcobj_names
+		self.indexs = np.asarray(indexs, dtype=np.int64)
+		self.new_lcobj_names = [] # objects set after creation that are not in the view
+		self.overlay = {}
+		self.reset_lcobj_names()
+		super().__init__(LCSetData(self), base.survey, base.description, base.band_names, base.class_names, base.obs_is_flux)
+
+	def reset_lcobj_names(self):
+		self.lcobj_names = [self.base_lcobj_names[k] for k in self.indexs]+self.new_lcobj_names
+		self.rows = dict.fromkeys(self.lcobj_names)
+
+	def has_lcobj(self, lcobj_name):
+		return lcobj_name in self.rows
+
+	def get_lcobj_source(self, lcobj_name):
+		if lcobj_name in self.overlay:
+			return self.overlay[lcobj_name]
+		if not self.has_lcobj(lcobj_name):
+			raise KeyError(lcobj_name)
+		return self.base.get_lcobj_source(lcobj_name)
+
+	def get_lcobj(self, lcobj_name):
+		return self.get_lcobj_writable(lcobj_name)
+
+	def get_lcobj_writable(self, lcobj_name):
+		if not lcobj_name in self.overlay:
+			self.overlay[lcobj_name] = self.get_lcobj_source(lcobj_name).copy()
+		return self.overlay[lcobj_name]
+
+	def set_lcobj(self, lcobj_name, lcobj):
+		self.update_class_index(lcobj_name, lcobj.y)
+		self.pop_summary(lcobj_name)
+		if not self.has_lcobj(lcobj_name):
+			self.new_lcobj_names.append(lcobj_name)
+			self.lcobj_names.append(lcobj_name)
+			self.rows[lcobj_name] = None
+		self.overlay[lcobj_name] = lcobj
+
+	def pop_lcobj(self, lcobj_name,
+		default=None,
+		):
+		if not self.has_lcobj(lcobj_name):
+			return default
+		lcobj = self.overlay[lcobj_name] if lcobj_name in self.overlay else self.get_lcobj_source(lcobj_name).copy()
+		self.pop_class_index(lcobj_name)
+		self.pop_summary(lcobj_name)
+		if lcobj_name in self.new_lcobj_names:
+			self.new_lcobj_names.remove(lcobj_name)
+		else:
+			self.indexs = np.delete(self.indexs, self.lcobj_names.index(lcobj_name))
+		self.lcobj_names.remove(lcobj_name)
+		self.rows.pop(lcobj_name)
+		self.overlay.pop(lcobj_name, None)
+		return lcobj
+
+	def is_modified(self):
+		'''
+		True if any object was set or accessed by lcset[lcobj_name] (it may have been modified in place), the view is then more than its indexs
+		The reading methods (get_lcobj_source, get_band_buffer, ...) do not count
+		'''
+		return len(self.overlay)>0
+
+	def keep_rows(self, valid_rows):
+		'''
+		One boolean mask over the indexs and the new objects (pop_lcobj is linear in the length of the view)
+		'''
+		valid_rows = np.asarray(valid_rows, dtype=bool)
+		assert len(valid_rows)==len(self.lcobj_names)
+		for k in np.where(~valid_rows)[0]:
+			lcobj_name = self.lcobj_names[k]
+			self.pop_class_index(lcobj_name)
+			self.pop_summary(lcobj_name)
+			self.overlay.pop(lcobj_name, None)
+		n_indexs = len(self.indexs)
+		self.indexs = self.indexs[valid_rows[:n_indexs]]
+		self.new_lcobj_names = [lcobj_name for lcobj_name,valid in zip(self.new_lcobj_names, valid_rows[n_indexs:]) if valid]
+		self.reset_lcobj_names()
+
+	def __getstate__(self):
+		state = super().__getstate__()
+		state.pop('lcobj_names', None) # rebuilt from the indexs
+		state.pop('rows', None)
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.reset_lcobj_names()
+
+	def copy(self,
+		data:dict=None,
+		cow:bool=False,
+		):
+		'''
+		A new view over the same base, or a new LCSet if data is given
+		'''
+		if not data is None:
+			return LCSet.copy(self, data)
+		new_set = LCSetView(self.base, self.indexs.copy(), self.base_lcobj_names)
+		for lcobj_name in self.new_lcobj_names:
+			new_set.set_lcobj(lcobj_name, self.overlay[lcobj_name].copy(cow=cow))
+		for lcobj_name in self.overlay.keys():
+			if not lcobj_name in self.new_lcobj_names:
+				new_set.overlay[lcobj_name] = self.overlay[lcobj_name].copy(cow=cow)
+		return new_set
+
+	def materialize(self,
+		cow:bool=False,
+		):
+		'''
+		Independent LCSet with copies of the objects of the view
+		cow: the objects share read-only arrays with the base instead (see SubLCO.copy)
+		'''
+		return LCSet.copy(self, None, cow)
@@ -4,6 +4,8 @@ from . import C_
 
 import numpy as np
 
+CHUNK_SIZE = 2**20 # values per chunk in the bulk conversions
+
 ###################################################################################################################################################
 
 '''
@@ -24,11 +26,12 @@ def get_flux_error_from_magnitude(mag:np.ndarray, mag_error:np.ndarray,
 	zero_point:float=C_.DEFAULT_ZP,
 	scale:float=C_.DEFAULT_FLUX_SCALE,
 	):
+	'''
+	|flux(mag)-flux(mag+mag_error)| = flux(mag)*|1-10**(-mag_error/2.5)|
+	'''
 	assert np.all(mag_error>=0)
-
-	flux1 = get_flux_from_magnitude(mag, zero_point, scale)
-	flux2 = get_flux_from_magnitude(mag + mag_error, zero_point, scale)
-	flux_error = np.abs(flux1-flux2)
+	flux = get_flux_from_magnitude(mag, zero_point, scale)
+	flux_error = flux*np.abs(1-10**(-mag_error/2.5))
 	return flux_error
 
 def get_magnitude_from_flux(flux:np.ndarray,
@@ -37,7 +40,7 @@ def get_magnitude_from_flux(flux:np.ndarray,
 	clip_flux:bool=False,
 	):
 
-	flux = (np.clip(flux, EPS, None) if clip_flux else flux)
+	flux = (np.clip(flux, C_.EPS, None) if clip_flux else flux)
 	assert np.all(flux>0)
 	mag = (-2.5*np.log10(flux)+zero_point)*scale
 	return mag
@@ -54,6 +57,84 @@ def get_magnitude_error_from_flux(flux:np.ndarray, flux_error:np.ndarray,
 	mag_error = np.abs(mag1-mag2)
 	return mag_error
 
+###################################################################################################################################################
+
+'''
+Bulk conversions for whole columns (like all the detections of a survey): the values and their errors in one pass,
+chunk by chunk, with the operations written over the outputs (no full-size temporaries)
+in_place: the outputs are the input arrays (they must be writeable float arrays), otherwise new float64 arrays
+check: validation scans (positive values), skip them when the input is already clean
+'''
+
+def _get_outputs(x, x_error, in_place:bool):
+	if in_place:
+		return x, x_error
+	return np.empty(x.shape, dtype=np.float64), np.empty(x_error.shape, dtype=np.float64)
+
+def get_flux_and_error_from_magnitude(mag:np.ndarray, mag_error:np.ndarray,
+	zero_point:float=C_.DEFAULT_ZP,
+	scale:float=C_.DEFAULT_FLUX_SCALE,
+	in_place:bool=False,
+	chunk_size:int=CHUNK_SIZE,
+	check:bool=True,
+	):
+	'''
+	Same as get_flux_from_magnitude and get_flux_error_from_magnitude
+	'''
+	if check:
+		assert np.all(mag>0)
+		assert np.all(mag_error>=0)
+	flux, flux_error = _get_outputs(mag, mag_error, in_place)
+	for i in range(0, len(mag), chunk_size):
+		f, fe = flux[i:i+chunk_size], flux_error[i:i+chunk_size]
+		if not in_place:
+			f[:], fe[:] = mag[i:i+chunk_size], mag_error[i:i+chunk_size]
+		np.add(f, zero_point, out=f)
+		np.divide(f, -2.5, out=f)
+		np.power(10., f, out=f)
+		np.multiply(f, scale, out=f) # flux
+		np.divide(fe, -2.5, out=fe)
+		np.power(10., fe, out=fe)
+		np.subtract(1., fe, out=fe)
+		np.abs(fe, out=fe)
+		np.multiply(fe, f, out=fe) # flux error
+	return flux, flux_error
+
+def get_magnitude_and_error_from_flux(flux:np.ndarray, flux_error:np.ndarray,
+	zero_point:float=C_.DEFAULT_ZP,
+	scale:float=C_.DEFAULT_MAG_SCALE,
+	clip_flux:bool=False,
+	in_place:bool=False,
+	chunk_size:int=CHUNK_SIZE,
+	check:bool=True,
+	):
+	'''
+	Same as get_magnitude_from_flux and get_magnitude_error_from_flux:
+	mag = (-2.5*log10(flux)+zero_point)*scale and mag_error = 2.5*scale*|log10(flux+flux_error)-log10(flux)|
+	'''
+	if check:
+		assert np.all(flux_error>=0)
+		if not clip_flux:
+			assert np.all(flux>0)
+	mag, mag_error = _get_outputs(flux, flux_error, in_place)
+	for i in range(0, len(flux), chunk_size):
+		m, me = mag[i:i+chunk_size], mag_error[i:i+chunk_size]
+		if not in_place:
+			m[:], me[:] = flux[i:i+chunk_size], flux_error[i:i+chunk_size]
+		np.add(me, m, out=me) # flux+flux_error
+		if clip_flux:
+			np.clip(m, C_.EPS, None, out=m)
+			np.clip(me, C_.EPS, None, out=me)
+		np.log10(m, out=m)
+		np.log10(me, out=me)
+		np.subtract(me, m, out=me)
+		np.abs(me, out=me)
+		np.multiply(me, 2.5*scale, out=me) # mag error
+		np.multiply(m, -2.5, out=m)
+		np.add(m, zero_point, out=m)
+		np.multiply(m, scale, out=m) # mag
+	return mag, mag_error
+
 '''
 def get_magnitude_HITS(estimated_count_lc, zero_point, exp_time):
 	assert 0
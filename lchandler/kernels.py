@@ -0,0 +1,62 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+from fuzzytools import numba as ftnumba
+
+BAR_SCALE = 1.645*2 # for .95 percentile used in plot
+
+###################################################################################################################################################
+
+'''
+Fused kernel for observation noise and bounded clipping, compiled with numba (through fuzzytools.numba)
+It works over one curve or over a whole band buffer (CSR-style, see segments.py) with per-segment bounds
+use_numba=False runs an equivalent pure-NumPy implementation
+The random samples are always drawn outside the kernels, so the results only depend on the given rng
+'''
+
+def _noisy_obs_numpy(obs, obse, noise, std_scale, half_range, min_lims):
+	new_obs = noise*(obse*std_scale)+obs
+	bar_size = obse*(BAR_SCALE*half_range)
+	new_obs = np.minimum(np.maximum(new_obs, obs-bar_size), obs+bar_size)
+	return np.maximum(new_obs, min_lims)
+
+@ftnumba.jit(nopython=True, cache=True)
+def _noisy_obs_numba(obs, obse, noise, std_scale, half_range, segment_min_lims, offsets):
+	new_obs = np.empty_like(obs)
+	for k in range(0, len(offsets)-1):
+		min_lim = segment_min_lims[k]
+		for i in range(offsets[k], offsets[k+1]):
+			bar_size = obse[i]*(BAR_SCALE*half_range)
+			x = noise[i]*(obse[i]*std_scale)+obs[i]
+			x = max(min(x, obs[i]+bar_size), obs[i]-bar_size)
+			new_obs[i] = max(x, min_lim)
+	return new_obs
+
+def _get_segment_values(value, offsets, dtype):
+	'''
+	Scalar or per-segment value as one value per segment
+	'''
+	return np.broadcast_to(np.asarray(value, dtype=dtype), (len(offsets)-1,))
+
+def _get_offsets(x, offsets):
+	return np.array([0, len(x)], dtype=np.int64) if offsets is None else np.asarray(offsets, dtype=np.int64)
+
+def get_noisy_obs(obs, obse, noise, obs_min_lim, std_scale, obs_noise_range,
+	offsets=None,
+	use_numba:bool=True,
+	):
+	'''
+	new_obs = obs+noise*obse*std_scale, clipped to the error bar (scaled by obs_noise_range) and then to obs_min_lim
+	noise: standard samples (normal or Student-t), same length as obs
+	obs_min_lim: scalar, or one value per segment if offsets is given
+	'''
+	dtype = obs.dtype
+	offsets = _get_offsets(obs, offsets)
+	noise = noise.astype(dtype, copy=False)
+	if use_numba:
+		segment_min_lims = np.ascontiguousarray(_get_segment_values(obs_min_lim, offsets, dtype))
+		return _noisy_obs_numba(obs, obse.astype(dtype, copy=False), noise, dtype.type(std_scale), dtype.type(obs_noise_range/2), segment_min_lims, offsets)
+	min_lims = np.repeat(_get_segment_values(obs_min_lim, offsets, dtype), np.diff(offsets))
+	return _noisy_obs_numpy(obs, obse, noise, std_scale, obs_noise_range/2, min_lims).astype(dtype, copy=False)
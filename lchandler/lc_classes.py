@@ -7,6 +7,8 @@ import random
 from scipy.stats import t
 from copy import copy, deepcopy
 from fuzzytools import numba as ftnumba
+from . import kernels
+from . import segments as seg
 
 DF = 2 # 1 2 5 np.inf
 OBSE_STD_SCALE = 1/2
@@ -26,47 +28,249 @@ def diff_vector(x,
 	dx = new_x[1:]-new_x[:-1]
 	return dx
 
+def log_vector(x):
+	return np.log(x+C_.EPS)
+
+'''
+Registry of the derived attributes of SubLCO: name -> (kind, source attr)
+Any d_{attr} is also a diff derived attribute
+'''
+DERIVED_ATTRS = {
+	'd_days':('diff', 'days'),
+	'd_obs':('diff', 'obs'),
+	'd_obse':('diff', 'obse'),
+	'log_obs':('log', 'obs'),
+	'log_obse':('log', 'obse'),
+}
+
+def get_derived_attr_source(attr:str):
+	'''
+	Returns (kind, source attr) or None if attr is not a derived attribute
+	'''
+	if attr in DERIVED_ATTRS:
+		return DERIVED_ATTRS[attr]
+	if attr.startswith('d_') and len(attr)>len('d_'):
+		return 'diff', attr[len('d_'):]
+	return None
+
+def get_derived_values(kind:str, x,
+	offsets=None,
+	):
+	'''
+	offsets: if x is a CSR-style buffer (see segments.py), diffs are computed inside every segment
+	'''
+	if kind=='diff':
+		return diff_vector(x) if offsets is None else seg.segment_diff(x, offsets)
+	elif kind=='log':
+		return log_vector(x)
+	else:
+		raise Exception(f'no kind {kind}')
+
 def get_new_noisy_obs(obs, obse, obs_min_lim,
 	std_scale=OBSE_STD_SCALE,
 	df=DF,
 	obs_noise_range=OBS_NOISE_RANGE,
+	rng=None,
+	offsets=None,
 	):
+	'''
+	rng: np.random.Generator, the global np.random state is used if None
+	offsets: if given, obs is a band buffer (see segments.py) and obs_min_lim can be one value per segment
+	The noise and clipping run in one fused kernel (see kernels.py)
+	'''
 	assert df>=0
-	dtype = obs.dtype
-	std = obse*std_scale
+	rng = np.random if rng is None else rng
 	if df==np.inf:
-		new_obs = np.random.standard_normal(size=len(obs)).astype(dtype)*std+obs
+		noise = rng.standard_normal(size=len(obs))
 	else:
-		new_obs = np.random.standard_t(df, size=len(obs)).astype(dtype)*std+obs
-
-	bar_size = (1.645*2)*obse # for .95 percentile used in plot
-	min_lim = obs-bar_size*obs_noise_range/2
-	max_lim = obs+bar_size*obs_noise_range/2
-	new_obs = np.clip(new_obs, min_lim, max_lim)
-	new_obs = np.clip(new_obs, obs_min_lim, None)
+		noise = rng.standard_t(df, size=len(obs))
+	new_obs = kernels.get_noisy_obs(obs, obse, noise, obs_min_lim, std_scale, obs_noise_range,
+		offsets=offsets,
+		)
 	return new_obs
 
+def _get_readonly(x):
+	x.flags.writeable = False
+	return x
+
+def _get_readonly_view(x):
+	'''
+	Read-only view sharing the memory of x, x itself is not modified (stays writable)
+	'''
+	return _get_readonly(x.view())
+
+def _get_serial_output(x, copy:bool):
+	return np.array(x) if copy else x
+
+def clean_small_cadence_buffers(days, obs, obse, offsets,
+	dt=C_.CADENCE_THRESHOLD,
+	mode='expectation',
+	):
+	'''
+	Merge the points closer than dt (see SubLCO.clean_small_cadence) of many curves given as CSR-style buffers
+	Linear time: one grouping pass plus segment reductions. The group sums round as np.sum (see segment_sum),
+	so the result is the same as the per-curve SubLCO.clean_small_cadence
+	Returns new days, obs, obse and offsets
+	'''
+	group_offsets, new_offsets = seg.get_cadence_group_offsets(days, offsets, dt)
+	if mode=='mean':
+		group_lengths = seg.get_lengths(group_offsets)
+		new_values = [(seg.segment_sum(x, group_offsets)/group_lengths.astype(x.dtype)).astype(x.dtype) for x in [days, obs, obse]] # as np.mean
+
+	elif mode=='min_obse':
+		group_ids = seg.get_segment_ids(group_offsets)
+		min_indexs = np.lexsort((obse, group_ids))[group_offsets[:-1]] # lexsort is stable: first min as np.argmin
+		new_values = [x[min_indexs] for x in [days, obs, obse]]
+
+	elif mode=='expectation':
+		obse_exp = np.exp(-np.log(obse+C_.EPS))
+		assert len(np.where(obse_exp==np.inf)[0])==0
+		obse_exp_sum = seg.segment_sum(obse_exp, group_offsets)
+		dist = obse_exp/np.repeat(obse_exp_sum, seg.get_lengths(group_offsets))
+		new_values = [seg.segment_sum(x*dist, group_offsets) for x in [days, obs, obse]]
+
+	else:
+		raise Exception(f'no mode {mode}')
+
+	new_days, new_obs, new_obse = new_values
+	return new_days, new_obs, new_obse, new_offsets
+
 ###################################################################################################################################################
 
 class SubLCO():
 	'''
 	Dataclass object used to store an astronomical light curve
+	Fixed layout (__slots__): the 1D arrays are the ARRAY_ATTRS
+	Derived arrays (d_days, log_obs, ..., see DERIVED_ATTRS) are computed on first access (self.d_days) and cached in self.derived
+	until the arrays change. self.version is increased every time the arrays change (used by caches built on top of this object)
+	The arrays are properties over the _days, _obs and _obse slots: any assignment (self.days = ...) counts as a change
 	'''
+	ARRAY_ATTRS = ['days', 'obs', 'obse']
+	STATE_ATTRS = ['days', 'obs', 'obse', 'y', 'dtype', 'synthetic_mode']
+	__slots__ = ['_days', '_obs', '_obse', 'y', 'dtype', 'synthetic_mode', 'derived', 'version']
+
 	def __init__(self, days, obs, obse,
 		y:int=None,
 		dtype=np.float32,
 		):
-		self.days = days
-		self.obs = obs
-		self.obse = obse
+		self.derived = {}
+		self.version = 0
+		self._days = days
+		self._obs = obs
+		self._obse = obse
 		self.y = y
 		self.dtype = dtype
 		self.reset()
 
+	@classmethod
+	def from_arrays(cls, days, obs, obse,
+		y:int=None,
+		dtype=np.float32,
+		):
+		'''
+		Build an object referencing the given arrays, without copies (used by views over columnar buffers)
+		Arrays must be 1D and already of type dtype
+		'''
+		sublcobj = cls.__new__(cls)
+		sublcobj.y = y
+		sublcobj.dtype = dtype
+		sublcobj.derived = {}
+		sublcobj.version = 0
+		sublcobj._set_days(days)
+		sublcobj._set_obs(obs)
+		sublcobj._set_obse(obse)
+		sublcobj.set_synthetic_mode(None)
+		return sublcobj
+
 	def reset(self):
 		self.set_values(self.days, self.obs, self.obse)
 		self.set_synthetic_mode(None)
 
+	@property
+	def days(self):
+		return self._days
+
+	@days.setter
+	def days(self, days):
+		self._days = days
+		self._set_modified()
+
+	@property
+	def obs(self):
+		return self._obs
+
+	@obs.setter
+	def obs(self, obs):
+		self._obs = obs
+		self._set_modified()
+
+	@property
+	def obse(self):
+		return self._obse
+
+	@obse.setter
+	def obse(self, obse):
+		self._obse = obse
+		self._set_modified()
+
+	def __getattr__(self, name):
+		'''
+		Only called if name is not a slot: access to the derived arrays as attributes (self.d_days)
+		'''
+		if name in SubLCO.__slots__:
+			raise AttributeError(name)
+		if name in self.derived:
+			return self.derived[name]
+		derived_attr_source = get_derived_attr_source(name)
+		if derived_attr_source is None:
+			raise AttributeError(name)
+		kind, source_attr = derived_attr_source
+		values = get_derived_values(kind, self.get_attr(source_attr))
+		self.derived[name] = values
+		return values
+
+	def __getstate__(self):
+		return {k:getattr(self, k) for k in SubLCO.STATE_ATTRS}
+
+	def __setstate__(self, state):
+		'''
+		Derived arrays are not stored, they are computed again when needed
+		Also loads objects pickled before __slots__, when derived arrays were plain attributes
+		'''
+		self.derived = {}
+		self.synthetic_mode = None
+		self.version = 0
+		for k in state.keys():
+			if k in SubLCO.ARRAY_ATTRS:
+				setattr(self, f'_{k}', state[k])
+			elif k in SubLCO.STATE_ATTRS:
+				setattr(self, k, state[k])
+
+	def get_array_attrs(self):
+		'''
+		Arrays plus the derived arrays computed so far
+		'''
+		return SubLCO.ARRAY_ATTRS+list(self.derived.keys())
+
+	def _set_array_attr(self, attr:str, x):
+		'''
+		Does not count as a change (no _set_modified), the caller decides what to keep
+		'''
+		if attr in SubLCO.ARRAY_ATTRS:
+			setattr(self, f'_{attr}', x)
+		else:
+			self.derived[attr] = x
+
+	def _set_modified(self,
+		keep_derived:bool=False,
+		):
+		'''
+		Call after any change of the arrays: invalidates the derived arrays and the caches built on top of this object
+		'''
+		self.version += 1
+		if not keep_derived:
+			self.derived = {}
+
 	def get_synthetic_mode(self):
 		return self.synthetic_mode
 
@@ -83,9 +287,9 @@ class SubLCO():
 		assert len(days)==len(obs)
 		assert len(days)==len(obse)
 		if isinstance(days, np.ndarray):
-			tdays = copy(days).astype(self.dtype)
-			tobs = copy(obs).astype(self.dtype)
-			tobse = copy(obse).astype(self.dtype)
+			tdays = days.astype(self.dtype) # astype always returns a new array
+			tobs = obs.astype(self.dtype)
+			tobse = obse.astype(self.dtype)
 		else:
 			tdays = np.array(days, dtype=self.dtype)
 			tobs = np.array(obs, dtype=self.dtype)
@@ -136,7 +340,7 @@ class SubLCO():
 		if hours_noise==0:
 			return
 
-		hours_noise = np.Floatndarray(len(self)).uniform_(-hours_noise, hours_noise)
+		hours_noise = np.random.uniform(-hours_noise, hours_noise, size=len(self))
 		self.add_day_values(hours_noise/24.,
 			recalculate_order,
 			)
@@ -219,9 +423,9 @@ class SubLCO():
 	def set_diff(self, attr:str):
 		'''
 		Calculate a diff version from an attr and create a new attr with new name
+		Not needed anymore: d_{attr} is computed on first access, kept for compatibility
 		'''
-		diffv = self.get_diff(attr)
-		setattr(self, f'd_{attr}', diffv)
+		getattr(self, f'd_{attr}')
 
 	def apply_valid_indexs_to_attrs(self, valid_indexs,
 		recalculate_order:bool=True,
@@ -233,20 +437,15 @@ class SubLCO():
 		fixme: this function is not opimized... specially due the d_days and that kind of variables
 		'''
 		original_len = len(self)
-		for key in self.__dict__.keys():
-			x = self.__dict__[key]
-			if isinstance(x, np.ndarray): # apply same mask to all in the object
-				assert len(x.shape)==1 # 1D
-				assert original_len==len(x), f'{key} {original_len}=={len(x)}'
-				new_x = x[valid_indexs]
-				setattr(self, key, new_x)
+		array_attrs = SubLCO.ARRAY_ATTRS if recalculate_order else self.get_array_attrs()
+		for key in array_attrs: # apply same mask to all in the object
+			x = self.get_attr(key)
+			assert len(x.shape)==1 # 1D
+			assert original_len==len(x), f'{key} {original_len}=={len(x)}'
+			self._set_array_attr(key, x[valid_indexs])
 
-		### calcule again as the original values changed
-		if recalculate_order:
-			if hasattr(self, 'd_days'):
-				self.set_diff('days')
-			if hasattr(self, 'd_obs'):
-				self.set_diff('obs')
+		### derived arrays are calculated again (lazily) as the original values changed
+		self._set_modified(keep_derived=not recalculate_order)
 
 	def get_valid_indexs_max_day(self, max_day:float,
 		remove_offset=False,
@@ -294,29 +493,29 @@ class SubLCO():
 		return self.get_last_day()-self.get_first_day() if len(self)>0 else None
 
 	def keys(self):
-		return self.__dict__.keys()
+		return SubLCO.STATE_ATTRS+list(self.derived.keys())
 
-	def copy(self):
-		return copy(self)
-
-	def __copy__(self):
-		new_sublco = SubLCO(
-			copy(self.days),
-			copy(self.obs),
-			copy(self.obse),
+	def copy(self,
+		cow:bool=False,
+		):
+		'''
+		cow: copy-on-write, the new object shares the arrays instead of copying them (through read-only views, the original arrays stay writable)
+		This is safe because the methods that modify values always allocate new arrays (set_values, add_obs_values, apply_valid_indexs_to_attrs, astype, ...),
+		so each object gets its private arrays only when it is modified
+		Writing into the original arrays in place (self.days[:] = ...) also changes the copies: only use cow if the original is not written in place
+		'''
+		_copy = _get_readonly_view if cow else copy
+		new_sublco = SubLCO.from_arrays(_copy(self.days), _copy(self.obs), _copy(self.obse),
 			self.y,
 			self.dtype,
 			)
 		new_sublco.set_synthetic_mode(self.get_synthetic_mode())
-
-		for key in self.__dict__.keys():
-			if key in ['days', 'obs', 'obse']:
-				continue
-			v = self.__dict__[key]
-			if isinstance(v, np.ndarray):
-				setattr(new_sublco, key, copy(v))
+		new_sublco.derived = {k:_copy(self.derived[k]) for k in self.derived.keys()}
 		return new_sublco
 
+	def __copy__(self):
+		return self.copy()
+
 	def __len__(self):
 		l = len(self.days)
 		assert l==len(self.obs)
@@ -333,38 +532,10 @@ class SubLCO():
 		dt=C_.CADENCE_THRESHOLD,
 		mode='expectation',
 		):
-		ddict = {}
-		i = 0
-		while i<len(self.days):
-			day = self.days[i]
-			valid_indexs = np.where((self.days>=day) & (self.days<day+dt))[0]
-			ddict[day] = valid_indexs
-			i += len(valid_indexs)
-
-		new_days = []
-		new_obs = []
-		new_obse = []
-		for k in ddict.keys():
-			if mode=='mean':
-				new_days.append(np.mean(self.days[ddict[k]]))
-				new_obs.append(np.mean(self.obs[ddict[k]]))
-				new_obse.append(np.mean(self.obse[ddict[k]]))
-			elif mode=='min_obse':
-				i = np.argmin(self.obse[ddict[k]])
-				new_days.append(self.days[ddict[k]][i])
-				new_obs.append(self.obs[ddict[k]][i])
-				new_obse.append(self.obse[ddict[k]][i])
-			elif mode=='expectation':
-				obse_exp = np.exp(-np.log(self.obse[ddict[k]]+C_.EPS))
-				assert len(np.where(obse_exp==np.inf)[0])==0
-				#print(obse_exp, obse_exp.shape)
-				dist = obse_exp/obse_exp.sum()
-				new_days.append(np.sum(self.days[ddict[k]]*dist))
-				new_obs.append(np.sum(self.obs[ddict[k]]*dist))
-				new_obse.append(np.sum(self.obse[ddict[k]]*dist))
-			else:
-				raise Exception(f'no mode {mode}')
-
+		new_days, new_obs, new_obse, _ = clean_small_cadence_buffers(self.days, self.obs, self.obse, seg.get_offsets([len(self)]),
+			dt,
+			mode,
+			)
 		self.set_values(new_days, new_obs, new_obse)
 
 	def get_snr(self,
@@ -407,11 +578,9 @@ class SubLCO():
 
 	def astype(self, dtype):
 		self.dtype = dtype
-		for key in self.__dict__.keys():
-			x = self.__dict__[key]
-			if isinstance(x, np.ndarray): # apply same mask to all in the object
-				new_x = x.astype(self.dtype)
-				setattr(self, key, new_x)
+		for key in self.get_array_attrs():
+			self._set_array_attr(key, self.get_attr(key).astype(self.dtype))
+		self._set_modified(keep_derived=True)
 		return self
 
 ###################################################################################################################################################
@@ -419,7 +588,12 @@ class SubLCO():
 class LCO():
 	'''
 	Dataclass object used to store a multiband astronomical light curve
+	Fixed layout (__slots__): bands are stored in self.sublcobjs and can still be accessed as attributes (self.g)
+	The merged multiband (serial) representation is cached in self.serial_cache, see get_serial()
 	'''
+	STATE_ATTRS = ['is_flux', 'y', 'global_first_day', 'ra', 'dec', 'z', 'bands', 'sublcobjs']
+	__slots__ = STATE_ATTRS+['serial_cache']
+
 	def __init__(self,
 		is_flux:bool=True,
 		y:int=None,
@@ -438,6 +612,36 @@ class LCO():
 
 	def reset(self):
 		self.bands = []
+		self.sublcobjs = {}
+		self.serial_cache = {}
+
+	def __getattr__(self, name):
+		'''
+		Only called if name is not a slot: access to the bands as attributes (self.g)
+		'''
+		if name in LCO.__slots__:
+			raise AttributeError(name)
+		try:
+			return self.sublcobjs[name]
+		except KeyError:
+			raise AttributeError(name)
+
+	def __getstate__(self):
+		return {k:getattr(self, k) for k in LCO.STATE_ATTRS}
+
+	def __setstate__(self, state):
+		'''
+		Also loads objects pickled before __slots__, when bands were plain attributes
+		'''
+		self.is_flux = state.get('is_flux', True)
+		self.y = state.get('y', None)
+		self.global_first_day = state.get('global_first_day', 0)
+		self.ra = state.get('ra', None)
+		self.dec = state.get('dec', None)
+		self.z = state.get('z', None)
+		self.bands = state['bands']
+		self.sublcobjs = state['sublcobjs'] if 'sublcobjs' in state else {b:state[b] for b in self.bands}
+		self.serial_cache = {}
 
 	def add_b(self, b:str, days, obs, obse):
 		'''
@@ -447,7 +651,8 @@ class LCO():
 		self.add_sublcobj_b(b, sublcobj)
 
 	def add_sublcobj_b(self, b:str, sublcobj):
-		setattr(self, b, sublcobj)
+		self.sublcobjs[b] = sublcobj
+		self.serial_cache = {}
 		if not b in self.bands:
 			self.bands += [b]
 
@@ -462,23 +667,21 @@ class LCO():
 		)
 		return new_lco
 
-	def copy(self):
-		return copy(self)
-
-	def __copy__(self):
-		new_lco = LCO(
-			is_flux=self.is_flux,
-			y=self.y,
-			global_first_day=self.global_first_day,
-			ra=self.ra,
-			dec=self.dec,
-			z=self.z,
-		)
+	def copy(self,
+		cow:bool=False,
+		):
+		'''
+		cow: copy-on-write, see SubLCO.copy
+		'''
+		new_lco = self.copy_only_data()
 		for b in self.bands:
-			new_sublcobj = copy(self.get_b(b))
+			new_sublcobj = self.get_b(b).copy(cow)
 			new_lco.add_sublcobj_b(b, new_sublcobj)
 		return new_lco
 
+	def __copy__(self):
+		return self.copy()
+
 	def set_y(self, y:int):
 		'''
 		Always use this method
@@ -512,61 +715,104 @@ class LCO():
 		assert len(first_days)>0
 		day_offset = min(first_days) # select the min along all bands
 		for b in bands:
-			self.get_b(b).days = self.get_b(b).days-day_offset
+			self.get_b(b)._set_days(self.get_b(b).days-day_offset)
 		if store_day_offset:
 			self.global_first_day = day_offset
 		if return_day_offset:
 			return self, day_offset
 		return self
 
+	def get_serial(self,
+		bands=None,
+		):
+		'''
+		Cached merged representation of the bands, sorted by days
+		The cache is rebuilt automatically if any band changed (see SubLCO.version)
+		Cached arrays are read-only: the get_*_serial getters return writable copies unless copy=False
+		'''
+		bands = self.bands if bands is None else bands
+		key = tuple(bands)
+		versions = tuple([(id(self.get_b(b)), self.get_b(b).version) for b in bands])
+		serial = self.serial_cache.get(key, None)
+		if serial is None or serial['versions']!=versions:
+			all_days = np.concatenate([self.get_b(b).days for b in bands], axis=0)
+			sorted_days_indexs = np.argsort(all_days, kind='stable') # ties are kept in band order
+			band_indexs = np.repeat(np.arange(0, len(bands)), [len(self.get_b(b)) for b in bands])[sorted_days_indexs]
+			serial = {
+				'versions':versions,
+				'sorted_days_indexs':_get_readonly(sorted_days_indexs),
+				'band_indexs':_get_readonly(band_indexs),
+				'values':{},
+				'x':{},
+				}
+			self.serial_cache[key] = serial
+		return serial
+
+	def clear_serial_cache(self):
+		self.serial_cache = {}
+
 	def get_sorted_days_indexs_serial(self,
 		bands=None,
+		copy:bool=True,
+		):
+		'''
+		copy: if False, the cached read-only array is returned (no copy)
+		'''
+		return _get_serial_output(self.get_serial(bands)['sorted_days_indexs'], copy)
+
+	def get_values_serial(self, attr:str,
+		bands=None,
+		copy:bool=True,
 		):
 		bands = self.bands if bands is None else bands
-		values = [self.get_b(b).days for b in bands]
-		all_days = np.concatenate(values, axis=0)
-		sorted_days_indexs = np.argsort(all_days)
-		return sorted_days_indexs
+		serial = self.get_serial(bands)
+		if not attr in serial['values']:
+			values = np.concatenate([self.get_b(b).get_attr(attr) for b in bands], axis=0)
+			serial['values'][attr] = _get_readonly(values[serial['sorted_days_indexs']])
+		return _get_serial_output(serial['values'][attr], copy)
 
 	def get_onehot_serial(self,
 		bands=None,
+		copy:bool=True,
 		):
 		bands = self.bands if bands is None else bands
-		onehot = np.zeros((len(self), len(bands)), dtype=np.bool)
-		index = 0
-		for kb,b in enumerate(bands):
-			l = len(getattr(self, b))
-			onehot[index:index+l,kb] = True
-			index += l
-		sorted_days_indexs = self.get_sorted_days_indexs_serial(bands)
-		onehot = onehot[sorted_days_indexs]
-		return onehot
+		serial = self.get_serial(bands)
+		if not 'onehot' in serial:
+			onehot = serial['band_indexs'][:,None]==np.arange(0, len(bands))[None,:]
+			serial['onehot'] = _get_readonly(onehot)
+		return _get_serial_output(serial['onehot'], copy)
 
 	def get_custom_x_serial(self, attrs:list,
 		bands=None,
+		copy:bool=True,
 		):
 		bands = self.bands if bands is None else bands
-		values = [self.get_b(b).get_custom_x(attrs) for b in bands]
-		x = np.concatenate(values, axis=0)
-		sorted_days_indexs = self.get_sorted_days_indexs_serial(bands)
-		x = x[sorted_days_indexs]
-		return x
+		serial = self.get_serial(bands)
+		key = tuple(attrs)
+		if not key in serial['x']:
+			x = np.concatenate([self.get_values_serial(attr, bands, False)[...,None] for attr in attrs], axis=-1)
+			serial['x'][key] = _get_readonly(x)
+		return _get_serial_output(serial['x'][key], copy)
 
 	def get_x_serial(self,
 		bands=None,
+		copy:bool=True,
 		):
 		bands = self.bands if bands is None else bands
 		return self.get_custom_x_serial(['days', 'obs', 'obse'],
 			bands,
+			copy,
 			)
 
 	def get_days_serial(self,
 		bands=None,
+		copy:bool=True,
 		):
 		bands = self.bands if bands is None else bands
-		return self.get_custom_x_serial(['days'],
+		return self.get_values_serial('days',
 			bands,
-			)[:,0]
+			copy,
+			)
 
 	def get_days_serial_duration(self,
 		bands=None,
@@ -593,7 +839,7 @@ class LCO():
 			self.set_diff_b(b, attr)
 
 	def get_b(self, b:str):
-		return getattr(self, b)
+		return self.sublcobjs[b]
 
 	def get_bands(self):
 		return self.bands
@@ -0,0 +1,79 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+###################################################################################################################################################
+
+'''
+Process-pool map over shards of objects (see LCSet.parallel_map)
+The items are split in contiguous shards of chunk_size items, the split does not depend on n_jobs
+Every shard gets its own np.random.Generator spawned from one seed (np.random.SeedSequence),
+so the results only depend on seed and chunk_size, and the shard results are merged back in the original order
+The functions must be picklable (defined at module level) to be sent to the workers
+'''
+
+def get_n_jobs(n_jobs):
+	return C_.N_JOBS if n_jobs is None or n_jobs<0 else max(1, n_jobs)
+
+def get_shard_slices(n:int, chunk_size:int):
+	chunk_size = max(1, n if chunk_size is None else chunk_size)
+	return [slice(i, min(i+chunk_size, n)) for i in range(0, n, chunk_size)]
+
+def get_seed_sequences(seed, n:int):
+	'''
+	seed: int, None (fresh entropy) or np.random.SeedSequence
+	'''
+	seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+	return seed_sequence.spawn(n)
+
+def _map_shard(function, items:list, seed_sequence, kwargs:dict):
+	rng = np.random.default_rng(seed_sequence)
+	return function(items, rng, **kwargs)
+
+def map_shards(function, items:list,
+	n_jobs:int=None,
+	chunk_size:int=C_.CHUNK_SIZE,
+	seed=0,
+	**kwargs
+	):
+	'''
+	function(shard_items, rng, **kwargs) -> list with one result per item
+	n_jobs: processes, C_.N_JOBS if None; with n_jobs=1 the shards run in this process
+	Returns the list of results aligned with items
+	'''
+	items = list(items)
+	shard_slices = get_shard_slices(len(items), chunk_size)
+	shards = [items[shard_slice] for shard_slice in shard_slices]
+	seed_sequences = get_seed_sequences(seed, len(shards))
+	n_jobs = min(get_n_jobs(n_jobs), len(shards))
+	if n_jobs<=1:
+		shard_results = [_map_shard(function, shard, seed_sequence, kwargs) for shard,seed_sequence in zip(shards, seed_sequences)]
+	else:
+		with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+			shard_results = list(executor.map(_map_shard, [function]*len(shards), shards, seed_sequences, [kwargs]*len(shards)))
+
+	results = []
+	for shard,shard_result in zip(shards, shard_results):
+		assert len(shard_result)==len(shard)
+		results += list(shard_result)
+	return results
+
+def apply_lcobj_function(lcobjs:list, rng, lcobj_function,
+	**kwargs
+	):
+	'''
+	Shard function for per-object functions: lcobj_function(lcobj, rng, **kwargs)
+	'''
+	return [lcobj_function(lcobj, rng, **kwargs) for lcobj in lcobjs]
+
+def call_lcobj_method(lcobj, rng, method:str,
+	args:tuple=(),
+	):
+	'''
+	Per-object function for in-place methods of LCO, returns the modified object
+	'''
+	getattr(lcobj, method)(*args)
+	return lcobj
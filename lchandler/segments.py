@@ -0,0 +1,177 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+
+OFFSETS_DTYPE = np.int64
+
+###################################################################################################################################################
+
+'''
+Helpers for ragged (CSR-style) buffers: N light curves stored one after the other in a contiguous 1D array,
+where the curve i lives in x[offsets[i]:offsets[i+1]]
+'''
+
+def get_offsets(lengths):
+	lengths = np.asarray(lengths, dtype=OFFSETS_DTYPE)
+	offsets = np.zeros((len(lengths)+1,), dtype=OFFSETS_DTYPE)
+	np.cumsum(lengths, out=offsets[1:])
+	return offsets
+
+def get_lengths(offsets):
+	return np.diff(offsets)
+
+def get_segment_ids(offsets):
+	'''
+	Segment index of every element in the buffer
+	'''
+	lengths = get_lengths(offsets)
+	return np.repeat(np.arange(0, len(lengths), dtype=OFFSETS_DTYPE), lengths)
+
+def get_segment_positions(offsets):
+	'''
+	Position of every element inside its own segment
+	'''
+	lengths = get_lengths(offsets)
+	return np.arange(0, offsets[-1], dtype=OFFSETS_DTYPE)-np.repeat(offsets[:-1], lengths)
+
+def concatenate_segments(arrays,
+	dtype=None,
+	):
+	arrays = list(arrays)
+	offsets = get_offsets([len(x) for x in arrays])
+	if len(arrays)==0:
+		return np.zeros((0,), dtype=np.float32 if dtype is None else dtype), offsets
+	x = np.concatenate(arrays, axis=0)
+	x = x if dtype is None else x.astype(dtype, copy=False)
+	return x, offsets
+
+def split_segments(x, offsets):
+	'''
+	Returns a list of views, one per segment
+	'''
+	return [x[offsets[i]:offsets[i+1]] for i in range(0, len(offsets)-1)]
+
+def gather_segments(x, offsets, indexs):
+	'''
+	Select (and reorder) whole segments given their indexs
+	Returns the new buffer and its offsets
+	'''
+	indexs = np.asarray(indexs, dtype=OFFSETS_DTYPE)
+	lengths = get_lengths(offsets)[indexs]
+	new_offsets = get_offsets(lengths)
+	source_indexs = np.repeat(offsets[:-1][indexs]-new_offsets[:-1], lengths)+np.arange(0, new_offsets[-1], dtype=OFFSETS_DTYPE)
+	return x[source_indexs], new_offsets
+
+def compact_segments(valid_mask, offsets):
+	'''
+	New offsets after removing the invalid elements of every segment
+	'''
+	valid_lengths = segment_reduce(np.add, valid_mask.astype(OFFSETS_DTYPE), offsets, 0)
+	return get_offsets(valid_lengths)
+
+def segment_reduce(ufunc, x, offsets, empty_value,
+	dtype=None,
+	):
+	'''
+	ufunc.reduceat over every segment
+	Empty segments are set to empty_value (reduceat alone does not support them)
+	'''
+	lengths = get_lengths(offsets)
+	nonempty = lengths>0
+	out = np.full((len(lengths),), empty_value, dtype=x.dtype if dtype is None else dtype)
+	if np.any(nonempty):
+		out[nonempty] = ufunc.reduceat(x, offsets[:-1][nonempty])
+	return out
+
+def segment_sum(x, offsets):
+	'''
+	Sum of every segment with the same rounding as np.sum(x[i:j]) (0 if the segment is empty)
+	Segments up to 2 elements are reduced together, longer ones call np.sum: it adds the floats by blocks, not in order as reduceat
+	'''
+	sums = segment_reduce(np.add, x, offsets, 0)
+	for k in np.where(get_lengths(offsets)>2)[0]:
+		sums[k] = np.sum(x[offsets[k]:offsets[k+1]])
+	return sums
+
+def segment_mean(x, offsets,
+	empty_value=np.nan,
+	):
+	lengths = get_lengths(offsets)
+	sums = segment_reduce(np.add, x, offsets, 0, dtype=np.float64)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		means = sums/lengths
+	means[lengths==0] = empty_value
+	return means
+
+def segment_argmax(x, offsets):
+	'''
+	Global index (in the buffer) of the first maximum of every segment, -1 if the segment is empty
+	Same as np.nanargmax: nan values are ignored, -1 if all the values of the segment are nan
+	'''
+	segment_ids = get_segment_ids(offsets)
+	maxs = segment_reduce(np.fmax, x, offsets, 0) # fmax ignores nan
+	candidates = np.where(x==maxs[segment_ids], np.arange(0, len(x), dtype=OFFSETS_DTYPE), offsets[-1])
+	argmaxs = segment_reduce(np.minimum, candidates, offsets, -1)
+	argmaxs[argmaxs==offsets[-1]] = -1
+	return argmaxs
+
+def segment_diff(x, offsets):
+	'''
+	diff_vector (with prepend) applied to every segment: the first element of every segment is 0
+	'''
+	if len(x)==0:
+		return x.copy()
+	dx = np.empty_like(x)
+	dx[0] = 0
+	dx[1:] = x[1:]-x[:-1]
+	lengths = get_lengths(offsets)
+	dx[offsets[:-1][lengths>0]] = 0
+	return dx
+
+def get_next_day_indexs(days, offsets, dt:float):
+	'''
+	For every point, the index of the first point of its segment with day>=point_day+dt (the segment end if there is none)
+	days must be sorted inside every segment
+	One lexsort over the (segment, day) pairs of the points and of the queries: exact for any number of segments
+	The queries are computed in days.dtype, as the comparison days<day+dt of SubLCO.clean_small_cadence
+	'''
+	n = len(days)
+	segment_ids = get_segment_ids(offsets)
+	query_days = days+np.asarray(dt, dtype=days.dtype)
+	is_point = np.concatenate([np.ones((n,), dtype=bool), np.zeros((n,), dtype=bool)]) # queries go before equal points (searchsorted side='left')
+	sorted_indexs = np.lexsort((is_point, np.concatenate([days, query_days]), np.concatenate([segment_ids, segment_ids])))
+	sorted_is_point = is_point[sorted_indexs]
+	points_before = np.cumsum(sorted_is_point)-sorted_is_point
+	next_indexs = np.empty((n,), dtype=OFFSETS_DTYPE)
+	next_indexs[sorted_indexs[~sorted_is_point]-n] = points_before[~sorted_is_point]
+	return np.maximum(next_indexs, np.arange(1, n+1, dtype=OFFSETS_DTYPE)) # always move forward (dt<=0)
+
+def get_cadence_group_offsets(days, offsets, dt:float):
+	'''
+	Groups the points of every segment: a group starts at a point and takes every point with day<first_day+dt
+	days must be sorted inside every segment. Groups never cross segments
+	All segments are processed together: the loop runs max(groups per segment) times
+	Returns the group offsets (over the buffer) and the new segment offsets (over the groups)
+	'''
+	lengths = get_lengths(offsets)
+	nonempty = lengths>0
+	starts = offsets[:-1][nonempty]
+	ends = offsets[1:][nonempty]
+	if len(starts)==0:
+		return np.zeros((1,), dtype=OFFSETS_DTYPE), np.zeros_like(offsets)
+
+	next_indexs = get_next_day_indexs(days, offsets, dt)
+	group_starts = []
+	while len(starts)>0:
+		group_starts.append(starts)
+		next_starts = next_indexs[starts]
+		active = next_starts<ends
+		starts = next_starts[active]
+		ends = ends[active]
+
+	group_starts = np.sort(np.concatenate(group_starts)).astype(OFFSETS_DTYPE)
+	group_offsets = np.append(group_starts, offsets[-1]).astype(OFFSETS_DTYPE)
+	new_offsets = np.searchsorted(group_starts, offsets, side='left').astype(OFFSETS_DTYPE)
+	return group_offsets, new_offsets
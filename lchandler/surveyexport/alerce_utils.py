@@ -18,29 +18,31 @@ def subset_df_columns(df, subset_cols):
 	df_cols = list(df.columns)
 	return df[[c for c in subset_cols if c in df_cols]]
 
-def delete_invalid_detections(df, index_name,
-	uses_corr:True,
-	npartitions=C_.N_JOBS,
+def get_invalid_detections_mask(df,
+	uses_corr:bool=True,
 	):
+	'''
+	Works with pandas and dask DataFrames
+	'''
 	days_col = 'mjd'
 	obs_col = 'magpsf_corr' if uses_corr else 'magpsf'
 	obse_col = 'sigmapsf_corr' if uses_corr else 'sigmapsf'
-	ddf = dd.from_pandas(df, npartitions=npartitions)
+	invalid_mask = (
+		(df['isdiffpos']==-1) | # bad photometry
+		(df[days_col].isna()) | # delete nans
+		(df[obs_col].isna()) | # delete nans
+		(df[obse_col].isna()) # delete nans
+	)
 	if uses_corr:
-		df = ddf[~(
-			(ddf['isdiffpos']==-1) | # bad photometry
-			(ddf[days_col].isna()) | # delete nans
-			(ddf[obs_col].isna()) | # delete nans
-			(ddf[obse_col].isna()) | # delete nans
-			(ddf[obse_col]>=100) # 100 error only with corr version
-		)].compute() # FAST
-	else:
-		df = ddf[~(
-			(ddf['isdiffpos']==-1) | # bad photometry
-			(ddf[days_col].isna()) | # delete nans
-			(ddf[obs_col].isna()) | # delete nans
-			(ddf[obse_col].isna()) # delete nans
-		)].compute() # FAST
+		invalid_mask = invalid_mask | (df[obse_col]>=100) # 100 error only with corr version
+	return invalid_mask
+
+def delete_invalid_detections(df, index_name,
+	uses_corr:True,
+	npartitions=C_.N_JOBS,
+	):
+	ddf = dd.from_pandas(df, npartitions=npartitions)
+	df = ddf[~get_invalid_detections_mask(ddf, uses_corr)].compute() # FAST
 	return df
 
 def delete_invalid_objs(df, new_index_name,
@@ -97,4 +99,44 @@ def process_df_labels(df, new_index_name, det_objs):
 	df = drop_duplicates(df)
 	df = df.set_index([new_index_name])
 	objs = list(set(df.index))
-	return df, objs
\ No newline at end of file
+	return df, objs
+
+###################################################################################################################################################
+
+class AlerceChunkCleaner():
+	'''
+	Same cleaning as process_df_detections for detections read in chunks (see LightCurveDictionaryCreator.export_dictionary_from_files)
+	Row-wise cleaning runs on every chunk. Duplicates and invalid objects need all the detections of an object,
+	so they are applied on every spill partition (the invalid objects are collected from the chunks)
+	Unlike process_df_detections, duplicates are removed after the invalid detections, so a valid duplicate is kept
+	'''
+	def __init__(self, index_name, new_index_name, detections_cols,
+		uses_corr=True,
+		clean_detections=True,
+		clean_invalid_objs=False,
+		):
+		if not uses_corr:
+			warnings.warn('only use uses_corr=False with SNe objects')
+		self.index_name = index_name
+		self.new_index_name = new_index_name
+		self.detections_cols = detections_cols
+		self.uses_corr = uses_corr
+		self.clean_detections = clean_detections
+		self.clean_invalid_objs = clean_invalid_objs
+		self.invalid_objs = set()
+
+	def process_chunk(self, df):
+		if df.index.name==self.index_name:
+			df = df.reset_index()
+		df = df.rename(columns={self.index_name:self.new_index_name})
+		if self.clean_invalid_objs:
+			self.invalid_objs.update(df.loc[df['isdiffpos']==-1, self.new_index_name].values)
+		if self.clean_detections:
+			df = df[~get_invalid_detections_mask(df, self.uses_corr)]
+		return subset_df_columns(df, self.detections_cols+[self.new_index_name])
+
+	def process_partition(self, df):
+		df = df.drop_duplicates(subset=[self.new_index_name, 'fid', 'mjd'])
+		if self.clean_invalid_objs:
+			df = df[~df[self.new_index_name].isin(self.invalid_objs)]
+		return df
@@ -3,19 +3,205 @@ from __future__ import division
 from . import C_
 
 import numpy as np
-from dask import dataframe as dd
 from fuzzytools.progress_bars import ProgressBar
 from fuzzytools.level_bars import LevelBar
 import matplotlib.pyplot as plt
 from fuzzytools.files import save_pickle, load_pickle
 import fuzzytools.cuteplots.colors as cc
-from ..flux_magnitude import get_flux_from_magnitude, get_flux_error_from_magnitude
+from ..flux_magnitude import get_flux_from_magnitude, get_flux_error_from_magnitude, get_flux_and_error_from_magnitude
 from ..flux_magnitude import get_magnitude_from_flux, get_magnitude_error_from_flux
 from ..plots.dataframe import plot_class_distribution_df
+from ..columnar_files import save_lcdataset
+from .streaming import get_shard_dfs, read_detections_chunks, get_n_partitions, DetectionsSpill
 import lchandler.dataset_classes as dsc
 import lchandler.lc_classes as lcc
+import lchandler.segments as seg
 import pandas as pd
 import copy
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+###################################################################################################################################################
+
+'''
+Object assembly without per-object DataFrame lookups: the detections are sorted once by (object, band, day)
+and every object/band curve is a contiguous block of CSR-style band buffers (see segments.py)
+'''
+
+def get_flux_values(obs, obse,
+	obs_uses_flux:bool=True,
+	zero_point:float=C_.DEFAULT_ZP,
+	flux_scale:float=C_.DEFAULT_FLUX_SCALE,
+	check:bool=True,
+	):
+	'''
+	obs and obse as flux, works over any number of detections (whole columns are converted in one chunked pass)
+	check: validation scans of the magnitudes, skip them for already cleaned detections
+	'''
+	if obs_uses_flux:
+		return obs, obse
+	else:
+		flux, flux_error = get_flux_and_error_from_magnitude(obs, obse, zero_point, flux_scale, check=check)
+		return flux, flux_error
+
+def get_band_buffers_from_detections(lcobj_indexs, band_indexs, values:dict, n_lcobjs:int, n_bands:int,
+	dtype=np.float32,
+	):
+	'''
+	lcobj_indexs, band_indexs: integer codes of the object and the band of every detection
+	values: dict attr->array (days, obs, obse) of every detection
+	Returns a list of (buffers, offsets), one per band: the object k lives in the segment k of every band, sorted by days
+	'''
+	sorted_indexs = np.lexsort((values['days'], band_indexs, lcobj_indexs))
+	sorted_band_indexs = band_indexs[sorted_indexs]
+	band_buffers = []
+	for kb in range(0, n_bands):
+		band_sorted_indexs = sorted_indexs[sorted_band_indexs==kb]
+		buffers = {attr:values[attr][band_sorted_indexs].astype(dtype) for attr in lcc.SubLCO.ARRAY_ATTRS}
+		offsets = seg.get_offsets(np.bincount(lcobj_indexs[band_sorted_indexs], minlength=n_lcobjs))
+		band_buffers.append((buffers, offsets))
+	return band_buffers
+
+def clean_small_cadence_band_buffers(band_buffers:list,
+	dt=C_.CADENCE_THRESHOLD,
+	mode='expectation',
+	):
+	'''
+	Same as LCO.clean_small_cadence for every object, one batched call per band
+	'''
+	new_band_buffers = []
+	for buffers,offsets in band_buffers:
+		new_days, new_obs, new_obse, new_offsets = lcc.clean_small_cadence_buffers(buffers['days'], buffers['obs'], buffers['obse'], offsets, dt, mode)
+		new_band_buffers.append(({'days':new_days, 'obs':new_obs, 'obse':new_obse}, new_offsets))
+	return new_band_buffers
+
+def reset_day_offset_band_buffers(band_buffers:list):
+	'''
+	Same as LCO.reset_day_offset_serial for every object: the min first day along all bands is subtracted
+	'''
+	first_days = [seg.segment_reduce(np.minimum, buffers['days'], offsets, np.inf, dtype=np.float64) for buffers,offsets in band_buffers]
+	day_offsets = np.min(first_days, axis=0)
+	assert np.all(np.isfinite(day_offsets))
+	for buffers,offsets in band_buffers:
+		buffers['days'] = buffers['days']-np.repeat(day_offsets.astype(buffers['days'].dtype), seg.get_lengths(offsets))
+	return band_buffers
+
+def get_native_array(x):
+	'''
+	x over the builtin instance of its dtype. Arrays unpickled from other processes (or files) get their own dtype instances,
+	which the pickle memo can not share, so a dataset with them is pickled to different bytes
+	'''
+	return x.view(np.dtype(x.dtype.str))
+
+def get_lcobj_from_band_buffers(band_names:list, band_buffers:list, k:int):
+	lcobj = lcc.LCO()
+	for b,(buffers, offsets) in zip(band_names, band_buffers):
+		i, j = offsets[k], offsets[k+1]
+		lcobj.add_b(b, buffers['days'][i:j], buffers['obs'][i:j], buffers['obse'][i:j])
+	return lcobj
+
+def get_detections_band_buffers(detections_df:pd.DataFrame, band_names:list, band_dictionary:dict, df_index_names:dict,
+	flux_kwargs:dict={},
+	):
+	'''
+	Flux band buffers (see get_band_buffers_from_detections) of the objects in detections_df, cleaned as in LCO.clean_small_cadence
+	and with the day offset removed as in LCO.reset_day_offset_serial
+	flux_kwargs: see get_flux_values
+	Returns the sorted object names and the band buffers
+	'''
+	lcobj_indexs, lcobj_names = pd.factorize(detections_df[df_index_names['oid']].values, sort=True)
+	band_values = detections_df[df_index_names['band']].values
+	band_indexs = np.full((len(band_values),), -1, dtype=np.int64)
+	for kb,b in enumerate(band_names):
+		band_indexs[band_values==band_dictionary[b]] = kb
+	assert np.all(band_indexs>=0)
+	obs, obse = get_flux_values(detections_df[df_index_names['obs']].values, detections_df[df_index_names['obs_error']].values, **flux_kwargs)
+	values = {
+		'days':detections_df[df_index_names['obs_day']].values,
+		'obs':obs,
+		'obse':obse,
+		}
+	band_buffers = get_band_buffers_from_detections(lcobj_indexs, band_indexs, values, len(lcobj_names), len(band_names))
+	band_buffers = clean_small_cadence_band_buffers(band_buffers)
+	band_buffers = reset_day_offset_band_buffers(band_buffers)
+	return list(lcobj_names), band_buffers
+
+def get_any_band_valid_rows(band_buffers:list, any_band_points:int):
+	'''
+	Same as LCO.any_band_eqover_length for every object
+	'''
+	valid_rows = np.zeros((len(band_buffers[0][1])-1,), dtype=bool)
+	for _,offsets in band_buffers:
+		valid_rows |= seg.get_lengths(offsets)>=any_band_points
+	return valid_rows
+
+def get_lcobjs_from_band_buffers(lcobj_names:list, band_buffers:list, band_names:list, any_band_points:int):
+	'''
+	Objects (without labels) of the band buffers (see get_detections_band_buffers), only the ones with any band with at least any_band_points
+	The buffers can come from a worker process (see get_native_array)
+	Returns a dict lcobj_name->LCO, sorted by name
+	'''
+	band_buffers = [({attr:get_native_array(buffers[attr]) for attr in buffers.keys()}, offsets) for buffers,offsets in band_buffers]
+	valid_rows = get_any_band_valid_rows(band_buffers, any_band_points)
+	return {lcobj_name:get_lcobj_from_band_buffers(band_names, band_buffers, k) for k,lcobj_name in enumerate(lcobj_names) if valid_rows[k]}
+
+###################################################################################################################################################
+
+class ExportCheckpoint():
+	'''
+	Checkpoints of an export: a folder with the export config and parts, every part has the processed object names and their band buffers
+	(see get_detections_band_buffers). The objects are built again from the buffers when resuming, as the objects of a new export
+	Parts are written atomically and only appended, so an interrupted export can be resumed from the last written part
+	'''
+	CONFIG_FILENAME = 'config.json'
+
+	def __init__(self, rootdir:str, config:dict):
+		self.rootdir = rootdir
+		self.config = json.loads(json.dumps(config))
+		self.n_parts = 0
+
+	def get_part_filedir(self, k:int):
+		return f'{self.rootdir}/part{k:06d}.pkl'
+
+	def exists(self):
+		return os.path.isfile(f'{self.rootdir}/{ExportCheckpoint.CONFIG_FILENAME}')
+
+	def start(self, band_names:list, any_band_points:int):
+		'''
+		Returns the processed object names and the objects of the previous parts (empty if there is no checkpoint), see get_lcobjs_from_band_buffers
+		'''
+		processed_lcobj_names = set()
+		lcobjs = {}
+		if self.exists():
+			with open(f'{self.rootdir}/{ExportCheckpoint.CONFIG_FILENAME}', 'r') as f:
+				config = json.load(f)
+			if config!=self.config:
+				raise Exception(f'checkpoint in {self.rootdir} was saved with a different config ({config}), remove it to start again')
+			while os.path.isfile(self.get_part_filedir(self.n_parts)):
+				part = load_pickle(self.get_part_filedir(self.n_parts))
+				processed_lcobj_names.update(part['lcobj_names'])
+				lcobjs.update(get_lcobjs_from_band_buffers(part['lcobj_names'], part['band_buffers'], band_names, any_band_points))
+				self.n_parts += 1
+			print(f'resuming from {self.rootdir} - parts={self.n_parts} - processed_samples={len(processed_lcobj_names):,}')
+		else:
+			os.makedirs(self.rootdir, exist_ok=True)
+			with open(f'{self.rootdir}/{ExportCheckpoint.CONFIG_FILENAME}', 'w') as f:
+				json.dump(self.config, f, indent=1)
+		return processed_lcobj_names, lcobjs
+
+	def save_part(self, lcobj_names:list, band_buffers:list):
+		if len(lcobj_names)==0:
+			return
+		part_filedir = self.get_part_filedir(self.n_parts)
+		save_pickle(f'{part_filedir}.tmp', {'lcobj_names':list(lcobj_names), 'band_buffers':band_buffers})
+		os.replace(f'{part_filedir}.tmp', part_filedir)
+		self.n_parts += 1
+
+	def remove(self):
+		shutil.rmtree(self.rootdir, ignore_errors=True)
 
 ###################################################################################################################################################
 
@@ -126,68 +312,172 @@ class LightCurveDictionaryCreator():
 			name += f'{k}={name_parameters[k]}~'
 		return name[:-1]
 
-	def get_label(self, labels_df:pd.DataFrame, lcobj_name:str, easy_label_dict:dict):
-		label = labels_df[self.df_index_names['label']][lcobj_name]
-		uint_label = easy_label_dict[label]
-		return uint_label
+	def get_flux_kwargs(self,
+		check:bool=True,
+		):
+		return {
+			'obs_uses_flux':self.dataframe_obs_uses_flux,
+			'zero_point':self.zero_point,
+			'flux_scale':self.flux_scale,
+			'check':check,
+			}
+
+	def get_labels_values(self, lcobj_names:list, easy_label_dict:dict):
+		'''
+		Labels (as easy_label_dict[label]), ra and dec (None if not in labels_df) of many objects
+		'''
+		labels_df = self.labels_df.loc[lcobj_names]
+		ys = [easy_label_dict[label] for label in labels_df[self.df_index_names['label']].values]
+		radecs = [None, None]
+		for k,radec_key in enumerate(['ra', 'dec']):
+			dfkey = self.df_index_names.get(radec_key, None)
+			if not dfkey is None and dfkey in labels_df.columns:
+				radecs[k] = labels_df[dfkey].values.tolist()
+		ras, decs = [[None]*len(lcobj_names) if radec is None else radec for radec in radecs]
+		return ys, ras, decs
+
+	def get_detections_band_buffers(self, detections_df:pd.DataFrame, band_names:list,
+		check_flux:bool=True,
+		):
+		return get_detections_band_buffers(detections_df, band_names, self.band_dictionary, self.df_index_names, self.get_flux_kwargs(check_flux))
 
-	def get_radec(self, labels_df:pd.DataFrame, lcobj_name:str):
+	def get_lcobjs(self, detections_df:pd.DataFrame, band_names:list,
+		any_band_points=C_.MIN_POINTS_LIGHTCURVE_SURVEY_EXPORT,
+		checkpoint=None,
+		checkpoint_every:int=1000,
+		check_flux:bool=True,
+		):
+		'''
+		Objects (without labels) with any band with at least any_band_points, built in this process
+		checkpoint: ExportCheckpoint, the objects are then built by shards of about checkpoint_every objects (by name hash, see get_shard_dfs)
+		and a part is saved for every shard, so a resumed export only builds the shards that were not finished
+		Returns a dict lcobj_name->LCO sorted by name
+		'''
+		columns = [self.df_index_names[k] for k in ['oid', 'band', 'obs_day', 'obs', 'obs_error']]
+		detections_df = detections_df[columns]
+		n_lcobjs = len(pd.unique(detections_df[self.df_index_names['oid']].values))
+		n_shards = 1 if checkpoint is None else max(1, int(np.ceil(n_lcobjs/checkpoint_every)))
+		lcobjs = {}
+		bar = ProgressBar(n_shards)
 		try:
-			ra = labels_df[self.df_index_names['ra']][lcobj_name]
-			dec = labels_df[self.df_index_names['dec']][lcobj_name]
-			return ra, dec
-		except:
-			return None, None
-
-	def get_band(self, curve):
-		indexs = np.argsort(curve[:,C_.DAYS_INDEX]) # need to be sorted
-		curve = curve[indexs]
-
-		if self.dataframe_obs_uses_flux:
-			return curve
-		else:
-			mag = curve[:,C_.OBS_INDEX]
-			mag_error = curve[:,C_.OBSE_INDEX]
-			flux = get_flux_from_magnitude(mag, self.zero_point, self.flux_scale)
-			flux_error = get_flux_error_from_magnitude(mag, mag_error, self.zero_point, self.flux_scale)
-			curve[:,C_.OBS_INDEX] = flux
-			curve[:,C_.OBSE_INDEX] = flux_error
-			return curve
+			for k,shard_detections_df in get_shard_dfs(detections_df, self.df_index_names['oid'], n_shards):
+				shard_lcobj_names, band_buffers = self.get_detections_band_buffers(shard_detections_df, band_names, check_flux)
+				lcobjs.update(get_lcobjs_from_band_buffers(shard_lcobj_names, band_buffers, band_names, any_band_points))
+				if not checkpoint is None:
+					checkpoint.save_part(shard_lcobj_names, band_buffers)
+				bar(f'shard={k} - samples={len(shard_lcobj_names):,} - correct_samples (any-band>={any_band_points})={len(lcobjs):,}')
+
+		except KeyboardInterrupt:
+			bar.done()
+			print('stopped!')
+			raise
 
-	###################################################################################################################################################
+		bar.done()
+		return {lcobj_name:lcobjs[lcobj_name] for lcobj_name in sorted(lcobjs.keys())}
 
-	def export_dictionary(self, description:str, save_folder:str,
-		band_names:list=None,
-		filename_extra_parameters:dict={},
-		npartitions:int=C_.N_JOBS,
+	def get_lcobjs_sharded(self, detections_df:pd.DataFrame, band_names:list,
 		any_band_points=C_.MIN_POINTS_LIGHTCURVE_SURVEY_EXPORT,
-		outliers_df=None,
+		n_shards:int=C_.N_JOBS,
+		n_jobs:int=C_.N_JOBS,
+		checkpoint=None,
+		check_flux:bool=True,
 		):
-		class_dfkey = self.df_index_names['label']
-		band_dfkey = self.df_index_names['band']
+		'''
+		Same as get_lcobjs, but the objects are partitioned by the hash of their names (see get_shard_dfs)
+		and the band buffers of every shard are built in a process pool. The objects are built here from the returned buffers (see get_native_array)
+		and sorted by name, so the result (and the saved dataset) does not depend on n_shards or n_jobs
+		checkpoint: ExportCheckpoint where a part is saved for every finished shard
+		'''
+		columns = [self.df_index_names[k] for k in ['oid', 'band', 'obs_day', 'obs', 'obs_error']]
+		detections_df = detections_df[columns]
+		lcobjs = {}
+		bar = ProgressBar(n_shards)
+		with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+			futures = {}
+			for k,shard_detections_df in get_shard_dfs(detections_df, self.df_index_names['oid'], n_shards):
+				future = executor.submit(get_detections_band_buffers, shard_detections_df, band_names, self.band_dictionary, self.df_index_names, self.get_flux_kwargs(check_flux))
+				futures[future] = k
+			try:
+				for future in as_completed(futures.keys()):
+					k = futures[future]
+					shard_lcobj_names, band_buffers = future.result()
+					shard_lcobjs = get_lcobjs_from_band_buffers(shard_lcobj_names, band_buffers, band_names, any_band_points)
+					lcobjs.update(shard_lcobjs)
+					if not checkpoint is None:
+						checkpoint.save_part(shard_lcobj_names, band_buffers)
+					bar(f'shard={k} - samples={len(shard_lcobj_names):,} - shard_correct_samples={len(shard_lcobjs):,} - correct_samples (any-band>={any_band_points})={len(lcobjs):,}')
 
-		### separate bands for optimal
-		band_names = list(self.band_dictionary.keys()) if band_names is None else band_names
-		print(f'band_names={band_names}')
+			except KeyboardInterrupt:
+				for future in futures.keys():
+					future.cancel()
+				bar.done()
+				print('stopped!')
+				raise
 
-		### clean dataframe to speed up thing in the objects search
-		detections_df = self.detections_df.reset_index()
-		print(f'cleaning the DataFrame - samples={len(detections_df):,}')
-		#print('detections_df',detections_df[detections_df[self.df_index_names['oid']]=='ZTF17aabwgdw'])
+		bar.done()
+		return {lcobj_name:lcobjs[lcobj_name] for lcobj_name in sorted(lcobjs.keys())}
 
-		detections_ddf = dd.from_pandas(detections_df, npartitions=npartitions)
-		detections_df = detections_ddf.loc[detections_ddf[self.df_index_names['band']].isin([self.band_dictionary[b] for b in band_names])].compute()
-		print(f'remove_invalid_bands > samples={len(detections_df):,}')
+	###################################################################################################################################################
 
-		detections_ddf = dd.from_pandas(detections_df, npartitions=npartitions)
-		detections_df = detections_ddf.loc[detections_ddf[self.df_index_names['oid']].isin(list(set(self.labels_df.index)))].compute()
-		print(f'remove_invalid_classes > samples={len(detections_df):,}')
+	def filter_detections_df(self, detections_df:pd.DataFrame, band_names:list,
+		verbose:int=1,
+		):
+		'''
+		Keeps the detections of the bands band_names, of the objects with labels and with positive obs
+		'''
+		if verbose:
+			print(f'cleaning the DataFrame - samples={len(detections_df):,}')
 
-		detections_ddf = dd.from_pandas(detections_df, npartitions=npartitions)
-		detections_df = detections_ddf.loc[detections_ddf[self.df_index_names['obs']]>0].compute()
-		print(f'remove_negative_obs > samples={len(detections_df):,}')
-		detections_df = detections_df.set_index(self.df_index_names['oid'])
+		detections_df = detections_df[detections_df[self.df_index_names['band']].isin([self.band_dictionary[b] for b in band_names]).values]
+		if verbose:
+			print(f'remove_invalid_bands > samples={len(detections_df):,}')
 
+		detections_df = detections_df[detections_df[self.df_index_names['oid']].isin(list(set(self.labels_df.index))).values]
+		if verbose:
+			print(f'remove_invalid_classes > samples={len(detections_df):,}')
+
+		detections_df = detections_df[(detections_df[self.df_index_names['obs']]>0).values]
+		if verbose:
+			print(f'remove_negative_obs > samples={len(detections_df):,}')
+		return detections_df
+
+	def get_save_filedir(self, save_folder:str, band_names:list, filename_extra_parameters:dict):
+		filename_parameters = {
+			'survey':self.survey_name,
+			'bands':''.join(band_names),
+		}
+		filename_parameters.update(filename_extra_parameters)
+		save_filedir = f'{save_folder}/{self.get_dict_name(filename_parameters)}.{C_.EXT_RAW_LIGHTCURVE}'
+		print(f'save_filedir={save_filedir}')
+		return save_filedir
+
+	def get_labels_config(self):
+		'''
+		Label/class config of the export (class mapping and the labeled objects after update_labels_df), part of the checkpoint config
+		'''
+		labels = sorted([f'{lcobj_name}:{label}' for lcobj_name,label in zip(self.labels_df.index, self.labels_df[self.df_index_names['label']].values)])
+		return {
+			'class_names':[str(c) for c in self.class_names],
+			'label_to_class_dict':{str(k):str(self.label_to_class_dict[k]) for k in self.label_to_class_dict.keys()},
+			'labels_hash':hashlib.md5('\n'.join(labels).encode()).hexdigest(),
+			}
+
+	def get_checkpoint(self, save_filedir:str, band_names:list, any_band_points):
+		checkpoint_config = {
+			'band_names':band_names,
+			'any_band_points':any_band_points,
+			'flux_kwargs':{k:v for k,v in self.get_flux_kwargs().items() if k!='check'}, # the checks do not change the objects
+			'labels':self.get_labels_config(),
+			}
+		return ExportCheckpoint(f'{save_filedir}.checkpoint', checkpoint_config)
+
+	def get_export_lcdataset(self, lcobjs:dict, description:str, band_names:list,
+		outliers_df=None,
+		):
+		'''
+		lcobjs: dict lcobj_name->LCO (without labels), the objects are added in this order
+		Returns the dataset with the raw, faint and outliers lcsets
+		'''
 		### prepare dataset
 		lcset = dsc.LCSet(
 			{},
@@ -202,66 +492,171 @@ class LightCurveDictionaryCreator():
 		lcdataset.set_lcset('faint', lcset.copy())
 		lcdataset.set_lcset('raw', lcset.copy())
 
-		### get filename
-		filename_parameters = {
-			'survey':self.survey_name,
-			'bands':''.join(band_names),
-		}
-		filename_parameters.update(filename_extra_parameters)
-		save_filedir = f'{save_folder}/{self.get_dict_name(filename_parameters)}.{C_.EXT_RAW_LIGHTCURVE}'
-		print(f'save_filedir={save_filedir}')
-
 		### easy variables
-		outliers = [] if outliers_df is None else list(outliers_df['outliers'].values) 
+		outliers = set() if outliers_df is None else set(outliers_df['outliers'].values)
 		easy_label_dict = {self.class_to_label_dict[c]:kc for kc,c in enumerate(self.class_names)}
 		print(f'easy_label_dict={easy_label_dict}')
 
-		# start loop
-		correct_samples = 0
-		detections_ddf = dd.from_pandas(detections_df, npartitions=npartitions)
-		lcobj_names = sorted(list(set(detections_df.index)))
-		bar = ProgressBar(len(lcobj_names))
+		### labels and sets
+		lcobj_names = list(lcobjs.keys())
+		ys, ras, decs = self.get_labels_values(lcobj_names, easy_label_dict)
 		for k,lcobj_name in enumerate(lcobj_names):
-			try:
-				lcobj = lcc.LCO()
-
-				### get detections
-				obj_df = detections_ddf.loc[lcobj_name].compute() # FAST
-				for kb,b in enumerate(band_names):
-					band_object_df = obj_df[obj_df[band_dfkey] == self.band_dictionary[b]]
-					original_lc = band_object_df[[self.df_index_names['obs_day'], self.df_index_names['obs'], self.df_index_names['obs_error']]].values
-					band_lc_flux = self.get_band(original_lc)
-					lcobj.add_b(b, band_lc_flux[:,0], band_lc_flux[:,1], band_lc_flux[:,2])
-
-				lcobj.clean_small_cadence()
-				lcobj.reset_day_offset_serial()
-
-				### get label
-				y = self.get_label(self.labels_df, lcobj_name, easy_label_dict)
-				lcobj.set_y(y)
-
-				### check lengths
-				if lcobj.any_band_eqover_length(any_band_points):
-					ra, dec = self.get_radec(self.labels_df, lcobj_name)
-					lcobj.ra = ra
-					lcobj.dec = dec
-					lcset_name = 'raw'
-					if lcobj_name in outliers:
-						lcset_name = 'outliers'
-					elif lcobj.get_snr()<C_.MIN_SNR:
-						lcset_name = 'faint'
-					lcdataset[lcset_name].set_lcobj(lcobj_name, lcobj)
-					correct_samples += 1
-				else:
-					pass
-					#print(lcobj_name)
-				bar(f'obj={lcobj_name} - y={y} - c={self.class_names[y]} - lengths_bdict={lcobj.get_length_bdict()} - correct_samples (any-band>={any_band_points})={correct_samples:,}')
-					
-			except KeyboardInterrupt:
-				bar.done()
-				print('stopped!')
-				break
+			lcobj = lcobjs[lcobj_name]
+			lcobj.set_y(ys[k])
+			lcobj.ra = ras[k]
+			lcobj.dec = decs[k]
+			lcset_name = 'raw'
+			if lcobj_name in outliers:
+				lcset_name = 'outliers'
+			lcdataset[lcset_name].set_lcobj(lcobj_name, lcobj)
+
+		### faint objects, set-wide snr
+		raw_lcset = lcdataset['raw']
+		raw_lcobj_names = raw_lcset.get_lcobj_names()
+		for lcobj_name,snr in zip(raw_lcobj_names, raw_lcset.get_snr()):
+			if snr<C_.MIN_SNR:
+				lcdataset['faint'].set_lcobj(lcobj_name, raw_lcset.pop_lcobj(lcobj_name))
+		return lcdataset
+
+	def save_export(self, save_filedir:str, lcdataset,
+		save_columnar:bool=False,
+		checkpoint=None,
+		):
+		if save_columnar:
+			save_lcdataset(save_filedir, lcdataset)
+		else:
+			save_pickle(save_filedir, lcdataset)
+		if not checkpoint is None:
+			checkpoint.remove()
+
+	def export_dictionary(self, description:str, save_folder:str,
+		band_names:list=None,
+		filename_extra_parameters:dict={},
+		npartitions:int=C_.N_JOBS,
+		any_band_points=C_.MIN_POINTS_LIGHTCURVE_SURVEY_EXPORT,
+		outliers_df=None,
+		save_columnar:bool=False,
+		n_jobs:int=1,
+		use_checkpoints:bool=False,
+		checkpoint_every:int=1000,
+		check_flux:bool=True,
+		):
+		'''
+		npartitions: shards of objects (by name hash) if n_jobs is not 1, see get_lcobjs_sharded
+		n_jobs: processes used to build the objects, the output is the same for any n_jobs
+		use_checkpoints: save checkpoints (see ExportCheckpoint) next to the output, every shard of about checkpoint_every objects (n_jobs=1) or every shard,
+		a later call with the same parameters (and labels, see get_labels_config) resumes from them. The checkpoints are removed once the complete dataset is saved
+		If interrupted (KeyboardInterrupt), the interruption is raised again and nothing is saved in save_filedir: only the checkpoints keep the finished objects
+		save_columnar: save the dataset in the memory-mapped columnar format (a folder, see columnar_files.py) instead of a pickle
+		check_flux: validation scans of the magnitudes (see get_flux_values), skip them for already cleaned detections
+		'''
+		### separate bands for optimal
+		band_names = list(self.band_dictionary.keys()) if band_names is None else band_names
+		print(f'band_names={band_names}')
+
+		### clean dataframe to speed up thing in the objects search
+		detections_df = self.filter_detections_df(self.detections_df.reset_index(), band_names)
+
+		### get filename
+		save_filedir = self.get_save_filedir(save_folder, band_names, filename_extra_parameters)
+
+		### checkpoints
+		checkpoint = None
+		lcobjs = {}
+		if use_checkpoints:
+			checkpoint = self.get_checkpoint(save_filedir, band_names, any_band_points)
+			processed_lcobj_names, lcobjs = checkpoint.start(band_names, any_band_points)
+			detections_df = detections_df[~detections_df[self.df_index_names['oid']].isin(processed_lcobj_names).values]
+			print(f'remove_processed_objects > samples={len(detections_df):,}')
+
+		### all the objects at once: one sort and batched cleaning, no per-object DataFrame lookups
+		if n_jobs==1:
+			lcobjs.update(self.get_lcobjs(detections_df, band_names, any_band_points, checkpoint, checkpoint_every, check_flux))
+		else:
+			lcobjs.update(self.get_lcobjs_sharded(detections_df, band_names, any_band_points, npartitions, n_jobs, checkpoint, check_flux))
+		lcobjs = {lcobj_name:lcobjs[lcobj_name] for lcobj_name in sorted(lcobjs.keys())}
+
+		lcdataset = self.get_export_lcdataset(lcobjs, description, band_names, outliers_df)
+		self.save_export(save_filedir, lcdataset, save_columnar, checkpoint)
+		return lcdataset
+
+	def export_dictionary_from_files(self, description:str, save_folder:str, detections_filedirs:list,
+		band_names:list=None,
+		filename_extra_parameters:dict={},
+		any_band_points=C_.MIN_POINTS_LIGHTCURVE_SURVEY_EXPORT,
+		outliers_df=None,
+		save_columnar:bool=False,
+		use_checkpoints:bool=False,
+		chunk_size:int=1000000,
+		max_memory:float=4e9,
+		n_partitions:int=None,
+		chunk_function=None,
+		partition_function=None,
+		check_flux:bool=True,
+		):
+		'''
+		Same as export_dictionary, but the detections are read in chunks from CSV or Parquet files (or folders) instead of self.detections_df
+		Every chunk is filtered (chunk_function and filter_detections_df) and spilled to disk by object hash (see DetectionsSpill),
+		then the objects of every partition are built (after partition_function) and only one partition is loaded at a time
+		max_memory: memory ceiling (bytes) of the spill buffers and of every partition, larger partitions are loaded by parts (see DetectionsSpill)
+		n_partitions: by default, estimated from the size of the files and max_memory (see get_n_partitions)
+		chunk_function, partition_function: DataFrame->DataFrame, like AlerceChunkCleaner.process_chunk and AlerceChunkCleaner.process_partition
+		use_checkpoints: one checkpoint part per partition, see export_dictionary (also for the KeyboardInterrupt behaviour)
+		check_flux: see export_dictionary
+		'''
+		detections_filedirs = [detections_filedirs] if isinstance(detections_filedirs, str) else detections_filedirs
+		band_names = list(self.band_dictionary.keys()) if band_names is None else band_names
+		print(f'band_names={band_names}')
+		save_filedir = self.get_save_filedir(save_folder, band_names, filename_extra_parameters)
+
+		### checkpoints
+		checkpoint = None
+		processed_lcobj_names = set()
+		lcobjs = {}
+		if use_checkpoints:
+			checkpoint = self.get_checkpoint(save_filedir, band_names, any_band_points)
+			processed_lcobj_names, lcobjs = checkpoint.start(band_names, any_band_points)
+
+		### spill
+		n_partitions = get_n_partitions(detections_filedirs, max_memory) if n_partitions is None else n_partitions
+		spill = DetectionsSpill(f'{save_filedir}.spill', n_partitions, self.df_index_names['oid'], max_memory)
+		samples = 0
+		for detections_filedir in detections_filedirs:
+			for chunk_df in read_detections_chunks(detections_filedir, chunk_size):
+				samples += len(chunk_df)
+				chunk_df = chunk_df if chunk_function is None else chunk_function(chunk_df)
+				chunk_df = self.filter_detections_df(chunk_df.reset_index(drop=chunk_df.index.name is None), band_names, verbose=0)
+				chunk_df = chunk_df[~chunk_df[self.df_index_names['oid']].isin(processed_lcobj_names).values]
+				spill.add(chunk_df)
+				print(f'reading {detections_filedir} - samples={samples:,}')
+		spill.flush()
+
+		### objects, one partition (or group of buckets of a partition larger than max_memory) at a time
+		partition_bucket_groups = [(k, buckets) for k in range(0, n_partitions) for buckets in spill.get_partition_bucket_groups(k)]
+		bar = ProgressBar(len(partition_bucket_groups))
+		try:
+			for k, buckets in partition_bucket_groups:
+				partition_df = spill.load_partition(k, buckets)
+				if len(partition_df)==0:
+					bar(f'partition={k} - samples=0 - correct_samples (any-band>={any_band_points})={len(lcobjs):,}')
+					continue
+				partition_df = partition_df if partition_function is None else partition_function(partition_df)
+				partition_lcobj_names, band_buffers = self.get_detections_band_buffers(partition_df, band_names, check_flux)
+				lcobjs.update(get_lcobjs_from_band_buffers(partition_lcobj_names, band_buffers, band_names, any_band_points))
+				if not checkpoint is None:
+					checkpoint.save_part(partition_lcobj_names, band_buffers)
+				bar(f'partition={k} - samples={len(partition_df):,} - correct_samples (any-band>={any_band_points})={len(lcobjs):,}')
+
+		except KeyboardInterrupt:
+			bar.done()
+			spill.remove()
+			print('stopped!')
+			raise
 
 		bar.done()
-		save_pickle(save_filedir, lcdataset)
-		return lcdataset
\ No newline at end of file
+		spill.remove()
+		lcobjs = {lcobj_name:lcobjs[lcobj_name] for lcobj_name in sorted(lcobjs.keys())}
+
+		lcdataset = self.get_export_lcdataset(lcobjs, description, band_names, outliers_df)
+		self.save_export(save_filedir, lcdataset, save_columnar, checkpoint)
+		return lcdataset
@@ -0,0 +1,197 @@
+from __future__ import print_function
+from __future__ import division
+from . import C_
+
+import numpy as np
+from .. import segments as seg
+import pandas as pd
+import os
+import shutil
+import zlib
+import warnings
+
+INPUT_MEMORY_FACTOR = 8 # in-memory size of the detections over their size on disk (compressed formats), used to choose the partitions
+CSV_EXTS = ['.csv', '.csv.gz']
+PARQUET_EXTS = ['.parquet', '.pq']
+SPILL_BUCKETS = 64 # hash buckets of every partition, the smallest part a partition is split into when it does not fit in max_memory
+
+###################################################################################################################################################
+
+'''
+Streaming ingestion of detections larger than memory: the files are read in chunks, every chunk is split by the hash of
+the object names (see get_shard_indexs) and spilled to disk, so every partition holds complete objects and can be processed alone
+'''
+
+def get_shard_indexs(oids, n_shards:int):
+	'''
+	Shard of every detection given by the crc32 hash of its object name, stable along runs and machines
+	'''
+	lcobj_indexs, lcobj_names = pd.factorize(oids)
+	lcobj_shard_indexs = np.array([zlib.crc32(str(lcobj_name).encode('utf-8'))%n_shards for lcobj_name in lcobj_names], dtype=np.int64)
+	return lcobj_shard_indexs[lcobj_indexs]
+
+def get_shard_dfs(detections_df:pd.DataFrame, oid_dfkey:str, n_shards:int):
+	'''
+	Iterator of (k, detections of the shard k), see get_shard_indexs
+	One stable sort by shard instead of a mask per shard: the rows keep their order inside every shard
+	'''
+	if n_shards==1:
+		yield 0, detections_df
+		return
+	shard_indexs = get_shard_indexs(detections_df[oid_dfkey].values, n_shards)
+	shard_offsets = seg.get_offsets(np.bincount(shard_indexs, minlength=n_shards))
+	detections_df = detections_df.iloc[np.argsort(shard_indexs, kind='stable')]
+	for k in range(0, n_shards):
+		yield k, detections_df.iloc[shard_offsets[k]:shard_offsets[k+1]]
+
+def _has_ext(filedir:str, exts:list):
+	return any([filedir.endswith(ext) for ext in exts])
+
+def get_detections_filedirs(filedir:str):
+	'''
+	A file, or the sorted CSV/Parquet files of a folder (like a Parquet dataset)
+	'''
+	if not os.path.isdir(filedir):
+		return [filedir]
+	filedirs = []
+	for root, dirs, files in os.walk(filedir):
+		dirs.sort()
+		filedirs += [f'{root}/{f}' for f in sorted(files) if _has_ext(f, CSV_EXTS+PARQUET_EXTS)]
+	return filedirs
+
+def read_detections_chunks(filedir:str,
+	chunk_size:int=1000000,
+	columns:list=None,
+	):
+	'''
+	Iterator of DataFrames with at most chunk_size rows of a CSV or Parquet file (or folder, see get_detections_filedirs)
+	Parquet files are read with pyarrow one row group at a time (ParquetFile.read_row_group, also in pyarrow<3.0), so a chunk is never larger than a row group
+	'''
+	for detections_filedir in get_detections_filedirs(filedir):
+		if _has_ext(detections_filedir, CSV_EXTS):
+			for chunk_df in pd.read_csv(detections_filedir, chunksize=chunk_size, usecols=columns):
+				yield chunk_df
+		else:
+			try:
+				import pyarrow.parquet as pq
+			except ImportError:
+				raise Exception('pyarrow is required to read Parquet files in chunks')
+			parquet_file = pq.ParquetFile(detections_filedir)
+			for i in range(0, parquet_file.num_row_groups):
+				row_group = parquet_file.read_row_group(i, columns=columns)
+				for offset in range(0, row_group.num_rows, chunk_size):
+					yield row_group.slice(offset, chunk_size).to_pandas()
+
+def get_n_partitions(filedirs:list, max_memory:float):
+	'''
+	Partitions needed to keep every partition under max_memory, estimated from the size of the files
+	'''
+	files_size = sum([os.path.getsize(filedir) for input_filedir in filedirs for filedir in get_detections_filedirs(input_filedir)])
+	return max(1, int(np.ceil(files_size*INPUT_MEMORY_FACTOR/max_memory)))
+
+###################################################################################################################################################
+
+class DetectionsSpill():
+	'''
+	Detections partitioned by the hash of their object names and spilled to disk
+	The chunks are kept in memory until they use more than max_memory/2, then every partition gets a new file
+	The memory of every partition is tracked by hash buckets (SPILL_BUCKETS per partition), so a partition larger than max_memory
+	is loaded in groups of buckets (see get_partition_bucket_groups), every group with complete objects
+	'''
+	def __init__(self, rootdir:str, n_partitions:int, oid_dfkey:str,
+		max_memory:float=4e9,
+		):
+		self.rootdir = rootdir
+		self.n_partitions = n_partitions
+		self.oid_dfkey = oid_dfkey
+		self.max_memory = max_memory
+		self.reset()
+
+	def reset(self):
+		shutil.rmtree(self.rootdir, ignore_errors=True)
+		for k in range(0, self.n_partitions):
+			os.makedirs(self.get_partition_dir(k), exist_ok=True)
+		self.partition_dfs = {k:[] for k in range(0, self.n_partitions)}
+		self.memory = 0
+		self.n_flushes = 0
+		self.columns = None
+		self.bucket_memorys = np.zeros((SPILL_BUCKETS, self.n_partitions), dtype=np.float64)
+
+	def get_partition_dir(self, k:int):
+		return f'{self.rootdir}/partition{k:05d}'
+
+	def get_bucket_indexs(self, oids):
+		'''
+		Bucket of every detection: the hash shard over n_partitions*SPILL_BUCKETS is bucket*n_partitions+partition
+		'''
+		return get_shard_indexs(oids, self.n_partitions*SPILL_BUCKETS)
+
+	def add(self, detections_df:pd.DataFrame):
+		if len(detections_df)==0:
+			return
+		self.columns = list(detections_df.columns)
+		bucket_indexs = self.get_bucket_indexs(detections_df[self.oid_dfkey].values)
+		shard_indexs = bucket_indexs%self.n_partitions
+		for k in np.unique(shard_indexs):
+			self.partition_dfs[k].append(detections_df[shard_indexs==k])
+		memory = detections_df.memory_usage(deep=True).sum()
+		self.bucket_memorys += np.bincount(bucket_indexs, minlength=self.n_partitions*SPILL_BUCKETS).reshape(self.bucket_memorys.shape)*(memory/len(detections_df)) # mean memory per detection
+		self.memory += memory
+		if self.memory>self.max_memory/2:
+			self.flush()
+
+	def flush(self):
+		for k in range(0, self.n_partitions):
+			if len(self.partition_dfs[k])>0:
+				pd.concat(self.partition_dfs[k]).to_pickle(f'{self.get_partition_dir(k)}/chunk{self.n_flushes:06d}.pkl')
+		self.partition_dfs = {k:[] for k in range(0, self.n_partitions)}
+		self.memory = 0
+		self.n_flushes += 1
+
+	def get_partition_bucket_groups(self, k:int):
+		'''
+		Groups of buckets of the partition k, every group under max_memory. [None] (the whole partition) if it fits in max_memory
+		Raises an exception if a single bucket does not fit (use a larger max_memory)
+		'''
+		bucket_memorys = self.bucket_memorys[:,k]
+		if bucket_memorys.sum()<=self.max_memory:
+			return [None]
+		if bucket_memorys.max()>self.max_memory:
+			raise Exception(f'partition {k} has a hash bucket of {bucket_memorys.max()/1e9:.2f}GB, larger than max_memory={self.max_memory/1e9:.2f}GB')
+		bucket_groups = [[]]
+		group_memory = 0
+		for bucket in range(0, SPILL_BUCKETS):
+			if group_memory+bucket_memorys[bucket]>self.max_memory:
+				bucket_groups.append([])
+				group_memory = 0
+			bucket_groups[-1].append(bucket)
+			group_memory += bucket_memorys[bucket]
+		return bucket_groups
+
+	def get_buckets_df(self, detections_df:pd.DataFrame, buckets:list):
+		if buckets is None:
+			return detections_df
+		return detections_df[np.isin(self.get_bucket_indexs(detections_df[self.oid_dfkey].values)//self.n_partitions, buckets)]
+
+	def load_partition(self, k:int,
+		buckets:list=None,
+		):
+		'''
+		All the detections of the objects of the partition k, only of the buckets if given (see get_partition_bucket_groups)
+		'''
+		partition_dir = self.get_partition_dir(k)
+		partition_dfs = []
+		for f in sorted(os.listdir(partition_dir)):
+			partition_dfs.append(self.get_buckets_df(pd.read_pickle(f'{partition_dir}/{f}'), buckets)) # one spilled file in memory at a time
+		for partition_df in self.partition_dfs[k]:
+			partition_dfs.append(self.get_buckets_df(partition_df, buckets))
+		if len(partition_dfs)==0:
+			return pd.DataFrame(columns=self.columns)
+		partition_df = pd.concat(partition_dfs, ignore_index=True)
+		memory = partition_df.memory_usage(deep=True).sum()
+		if memory>self.max_memory:
+			warnings.warn(f'partition {k} uses {memory/1e9:.2f}GB (max_memory={self.max_memory/1e9:.2f}GB), the bucket memory is estimated with the mean memory per detection')
+		return partition_df
+
+	def remove(self):
+		shutil.rmtree(self.rootdir, ignore_errors=True)
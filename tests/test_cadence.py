@@ -0,0 +1,87 @@
+from __future__ import print_function
+from __future__ import division
+
+import numpy as np
+import pytest
+import lchandler.C_ as C_
+import lchandler.lc_classes as lcc
+
+###################################################################################################################################################
+
+def clean_small_cadence_baseline(days, obs, obse,
+	dt=C_.CADENCE_THRESHOLD,
+	mode='expectation',
+	):
+	'''
+	Per-point loop of the original SubLCO.clean_small_cadence, used as reference
+	'''
+	ddict = {}
+	i = 0
+	while i<len(days):
+		day = days[i]
+		valid_indexs = np.where((days>=day) & (days<day+dt))[0]
+		ddict[day] = valid_indexs
+		i += len(valid_indexs)
+
+	new_days = []
+	new_obs = []
+	new_obse = []
+	for k in ddict.keys():
+		if mode=='mean':
+			new_days.append(np.mean(days[ddict[k]]))
+			new_obs.append(np.mean(obs[ddict[k]]))
+			new_obse.append(np.mean(obse[ddict[k]]))
+		elif mode=='min_obse':
+			i = np.argmin(obse[ddict[k]])
+			new_days.append(days[ddict[k]][i])
+			new_obs.append(obs[ddict[k]][i])
+			new_obse.append(obse[ddict[k]][i])
+		elif mode=='expectation':
+			obse_exp = np.exp(-np.log(obse[ddict[k]]+C_.EPS))
+			dist = obse_exp/obse_exp.sum()
+			new_days.append(np.sum(days[ddict[k]]*dist))
+			new_obs.append(np.sum(obs[ddict[k]]*dist))
+			new_obse.append(np.sum(obse[ddict[k]]*dist))
+	return [np.array(x, dtype=days.dtype) for x in [new_days, new_obs, new_obse]]
+
+def get_random_curves(n_curves, seed):
+	rng = np.random.default_rng(seed)
+	curves = []
+	for _ in range(0, n_curves):
+		length = int(rng.integers(0, 40))
+		days = np.sort(np.round(rng.random(length)*100, 1)).astype(np.float32) # rounded days: many points exactly at dt
+		obs = (rng.random(length)+0.1).astype(np.float32)
+		obse = (rng.random(length)*0.1+0.01).astype(np.float32)
+		curves.append((days, obs, obse))
+	return curves
+
+###################################################################################################################################################
+
+@pytest.mark.parametrize('mode', ['mean', 'min_obse', 'expectation'])
+@pytest.mark.parametrize('dt', [C_.CADENCE_THRESHOLD, 3.])
+def test_clean_small_cadence_baseline(mode, dt):
+	for days, obs, obse in get_random_curves(400, 0):
+		sublcobj = lcc.SubLCO(days.copy(), obs.copy(), obse.copy())
+		sublcobj.clean_small_cadence(dt, mode)
+		baseline_values = clean_small_cadence_baseline(days, obs, obse, dt, mode)
+		for attr,baseline_x in zip(lcc.SubLCO.ARRAY_ATTRS, baseline_values):
+			assert np.array_equal(getattr(sublcobj, attr), baseline_x), (days, attr)
+
+def test_clean_small_cadence_regression():
+	days = np.array([3.2, 6.2, 9.0, 9.5, 12.], dtype=np.float32)
+	obs = np.ones_like(days)
+	obse = np.ones_like(days)*0.1
+	sublcobj = lcc.SubLCO(days.copy(), obs.copy(), obse.copy())
+	sublcobj.clean_small_cadence(3., 'min_obse')
+	assert np.array_equal(sublcobj.days, clean_small_cadence_baseline(days, obs, obse, 3., 'min_obse')[0])
+
+@pytest.mark.parametrize('mode', ['mean', 'min_obse', 'expectation'])
+def test_clean_small_cadence_buffers(mode):
+	curves = get_random_curves(100, 1)
+	offsets = np.cumsum([0]+[len(days) for days,_,_ in curves])
+	buffers = [np.concatenate([curve[k] for curve in curves]) for k in range(0, 3)]
+	new_days, new_obs, new_obse, new_offsets = lcc.clean_small_cadence_buffers(*buffers, offsets, 3., mode)
+	for k,(days, obs, obse) in enumerate(curves):
+		baseline_values = clean_small_cadence_baseline(days, obs, obse, 3., mode)
+		for x,baseline_x in zip([new_days, new_obs, new_obse], baseline_values):
+			assert np.array_equal(x[new_offsets[k]:new_offsets[k+1]], baseline_x)
@@ -0,0 +1,216 @@
+from __future__ import print_function
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+import pytest
+import os
+import lchandler.C_ as C_
+import lchandler.lc_classes as lcc
+import lchandler.surveyexport.dictionary_creator as dcm
+from test_cadence import clean_small_cadence_baseline
+
+DF_INDEX_NAMES = {
+	'oid':'oid',
+	'band':'fid',
+	'obs_day':'mjd',
+	'obs':'magpsf',
+	'obs_error':'sigmapsf',
+	'label':'classALeRCE',
+	'ra':'ra',
+	'dec':'dec',
+	}
+BAND_DICTIONARY = {'g':1, 'r':2}
+
+###################################################################################################################################################
+
+def get_detections_df(n_lcobjs,
+	seed=0,
+	):
+	rng = np.random.default_rng(seed)
+	rows = []
+	for k in range(0, n_lcobjs):
+		for _ in range(0, int(rng.integers(1, 40))):
+			mag = rng.uniform(15, 21) if rng.random()>0.02 else -1 # some negative obs
+			rows.append((f'ZTF{k:05d}', rng.choice([1, 2, 3]), rng.uniform(58000, 58010), mag, rng.uniform(0.01, 0.3)))
+	return pd.DataFrame(rows, columns=['oid', 'fid', 'mjd', 'magpsf', 'sigmapsf']).set_index('oid')
+
+def get_labels_df(n_lcobjs,
+	seed=0,
+	):
+	rng = np.random.default_rng(seed)
+	return pd.DataFrame({
+		'oid':[f'ZTF{k:05d}' for k in range(0, n_lcobjs)],
+		'classALeRCE':rng.choice(['SNIa', 'SNII', 'SLSN'], n_lcobjs),
+		'ra':rng.uniform(0, 360, n_lcobjs),
+		'dec':rng.uniform(-30, 30, n_lcobjs),
+		}).set_index('oid')
+
+def get_creator(n_lcobjs,
+	seed=0,
+	):
+	detections_df = get_detections_df(n_lcobjs, seed)
+	labels_df = get_labels_df(n_lcobjs+5, seed)
+	return dcm.LightCurveDictionaryCreator('ztf', detections_df, labels_df, BAND_DICTIONARY, DF_INDEX_NAMES, dataframe_obs_uses_flux=False)
+
+def get_outliers_df():
+	return pd.DataFrame({'outliers':['ZTF00003', 'ZTF00010']})
+
+def export_dictionary_baseline(creator, outliers_df,
+	band_names=['g', 'r'],
+	any_band_points=3,
+	):
+	'''
+	Per-object loop of the original export_dictionary (with pandas instead of dask), used as reference
+	Returns a dict lcset_name->dict lcobj_name->LCO
+	'''
+	detections_df = creator.detections_df.reset_index()
+	detections_df = detections_df[detections_df['fid'].isin([BAND_DICTIONARY[b] for b in band_names])]
+	detections_df = detections_df[detections_df['oid'].isin(list(set(creator.labels_df.index)))]
+	detections_df = detections_df[detections_df['magpsf']>0].set_index('oid')
+	outliers = list(outliers_df['outliers'].values)
+	easy_label_dict = {creator.class_to_label_dict[c]:kc for kc,c in enumerate(creator.class_names)}
+	lcsets = {'outliers':{}, 'faint':{}, 'raw':{}}
+	for lcobj_name in sorted(list(set(detections_df.index))):
+		lcobj = lcc.LCO()
+		obj_df = detections_df.loc[[lcobj_name]]
+		for b in band_names:
+			curve = obj_df[obj_df['fid']==BAND_DICTIONARY[b]][['mjd', 'magpsf', 'sigmapsf']].values
+			curve = curve[np.argsort(curve[:,C_.DAYS_INDEX])]
+			curve[:,C_.OBS_INDEX], curve[:,C_.OBSE_INDEX] = dcm.get_flux_values(curve[:,C_.OBS_INDEX], curve[:,C_.OBSE_INDEX], **creator.get_flux_kwargs())
+			lcobj.add_b(b, curve[:,0], curve[:,1], curve[:,2])
+			sublcobj = lcobj.get_b(b)
+			sublcobj.set_values(*clean_small_cadence_baseline(sublcobj.days, sublcobj.obs, sublcobj.obse))
+		lcobj.reset_day_offset_serial()
+		lcobj.set_y(easy_label_dict[creator.labels_df['classALeRCE'][lcobj_name]])
+		if lcobj.any_band_eqover_length(any_band_points):
+			lcobj.ra = creator.labels_df['ra'][lcobj_name]
+			lcobj.dec = creator.labels_df['dec'][lcobj_name]
+			lcset_name = 'raw'
+			if lcobj_name in outliers:
+				lcset_name = 'outliers'
+			elif lcobj.get_snr()<C_.MIN_SNR:
+				lcset_name = 'faint'
+			lcsets[lcset_name][lcobj_name] = lcobj
+	return lcsets
+
+def assert_equal_lcobjs(lcobj, baseline_lcobj):
+	assert lcobj.y==baseline_lcobj.y
+	assert lcobj.ra==baseline_lcobj.ra and lcobj.dec==baseline_lcobj.dec
+	for b in baseline_lcobj.bands:
+		for attr in lcc.SubLCO.ARRAY_ATTRS:
+			x = getattr(lcobj.get_b(b), attr)
+			baseline_x = getattr(baseline_lcobj.get_b(b), attr)
+			assert x.dtype==baseline_x.dtype and np.array_equal(x, baseline_x), (b, attr)
+
+###################################################################################################################################################
+
+def test_export_dictionary_baseline(tmp_path):
+	creator = get_creator(120)
+	lcdataset = creator.export_dictionary('description', str(tmp_path), outliers_df=get_outliers_df(), any_band_points=3)
+	baseline_lcsets = export_dictionary_baseline(creator, get_outliers_df())
+	for lcset_name in baseline_lcsets.keys():
+		assert lcdataset[lcset_name].get_lcobj_names()==list(baseline_lcsets[lcset_name].keys())
+		for lcobj_name,baseline_lcobj in baseline_lcsets[lcset_name].items():
+			assert_equal_lcobjs(lcdataset[lcset_name][lcobj_name], baseline_lcobj)
+
+def get_export_bytes(creator, save_folder, **kwargs):
+	os.makedirs(save_folder, exist_ok=True)
+	creator.export_dictionary('description', save_folder, outliers_df=get_outliers_df(), any_band_points=3, **kwargs)
+	save_filedir = creator.get_save_filedir(save_folder, ['g', 'r'], {})
+	with open(save_filedir, 'rb') as f:
+		return f.read()
+
+@pytest.mark.parametrize('n_jobs, npartitions', [(3, 5), (2, 1)])
+def test_export_dictionary_sharded(tmp_path, n_jobs, npartitions):
+	creator = get_creator(300)
+	serial_bytes = get_export_bytes(creator, str(tmp_path/'serial'))
+	sharded_bytes = get_export_bytes(creator, str(tmp_path/'sharded'), n_jobs=n_jobs, npartitions=npartitions)
+	assert sharded_bytes==serial_bytes
+
+def test_export_dictionary_interrupted(tmp_path, monkeypatch):
+	creator = get_creator(300)
+	full_bytes = get_export_bytes(creator, str(tmp_path/'full'))
+	save_folder = str(tmp_path/'interrupted')
+	save_filedir = creator.get_save_filedir(save_folder, ['g', 'r'], {})
+	get_lcobjs_from_band_buffers = dcm.get_lcobjs_from_band_buffers
+	calls = []
+	def interrupted_get_lcobjs_from_band_buffers(*args):
+		calls.append(None)
+		if len(calls)==4:
+			raise KeyboardInterrupt
+		return get_lcobjs_from_band_buffers(*args)
+
+	monkeypatch.setattr(dcm, 'get_lcobjs_from_band_buffers', interrupted_get_lcobjs_from_band_buffers)
+	with pytest.raises(KeyboardInterrupt):
+		get_export_bytes(creator, save_folder, use_checkpoints=True, checkpoint_every=30)
+	assert not os.path.exists(save_filedir) # never a partial dataset under the final name
+	assert sorted(os.listdir(f'{save_filedir}.checkpoint'))==['config.json', 'part000000.pkl', 'part000001.pkl', 'part000002.pkl']
+
+	monkeypatch.setattr(dcm, 'get_lcobjs_from_band_buffers', get_lcobjs_from_band_buffers)
+	assert get_export_bytes(creator, save_folder, use_checkpoints=True, checkpoint_every=30)==full_bytes # resumed
+	assert not os.path.exists(f'{save_filedir}.checkpoint')
+
+def test_export_dictionary_check_flux(tmp_path, monkeypatch):
+	creator = get_creator(120)
+	checked_bytes = get_export_bytes(creator, str(tmp_path/'checked'))
+	get_flux_and_error_from_magnitude = dcm.get_flux_and_error_from_magnitude
+	checks = []
+	def recorded_get_flux_and_error_from_magnitude(*args, check=True, **kwargs):
+		checks.append(check)
+		return get_flux_and_error_from_magnitude(*args, check=check, **kwargs)
+
+	monkeypatch.setattr(dcm, 'get_flux_and_error_from_magnitude', recorded_get_flux_and_error_from_magnitude)
+	assert get_export_bytes(creator, str(tmp_path/'unchecked'), check_flux=False)==checked_bytes
+	assert len(checks)>0 and not any(checks)
+
+def test_export_checkpoint_config(tmp_path):
+	creator = get_creator(50)
+	checkpoint = creator.get_checkpoint(str(tmp_path/'export'), ['g', 'r'], 3)
+	checkpoint.start(['g', 'r'], 3)
+	creator.labels_df = creator.labels_df.iloc[1:] # other labels
+	with pytest.raises(Exception, match='different config'):
+		creator.get_checkpoint(str(tmp_path/'export'), ['g', 'r'], 3).start(['g', 'r'], 3)
+
+def get_files_export(creator, save_folder, detections_filedir, monkeypatch):
+	bucket_groups = []
+	get_partition_bucket_groups = dcm.DetectionsSpill.get_partition_bucket_groups
+	def recorded_get_partition_bucket_groups(self, k):
+		bucket_groups.append(get_partition_bucket_groups(self, k))
+		return bucket_groups[-1]
+
+	monkeypatch.setattr(dcm.DetectionsSpill, 'get_partition_bucket_groups', recorded_get_partition_bucket_groups)
+	os.makedirs(save_folder, exist_ok=True)
+	lcdataset = creator.export_dictionary_from_files('description', save_folder, detections_filedir, outliers_df=get_outliers_df(), any_band_points=3,
+		chunk_size=500,
+		max_memory=5e4,
+		n_partitions=2,
+		)
+	assert any([len(buckets)>1 for buckets in bucket_groups]) # partitions loaded by groups of buckets
+	save_filedir = creator.get_save_filedir(save_folder, ['g', 'r'], {})
+	assert not os.path.exists(f'{save_filedir}.spill')
+	return lcdataset
+
+def assert_equal_lcdatasets(lcdataset, baseline_lcdataset):
+	for lcset_name in ['raw', 'faint', 'outliers']:
+		assert lcdataset[lcset_name].get_lcobj_names()==baseline_lcdataset[lcset_name].get_lcobj_names()
+		for lcobj_name in baseline_lcdataset[lcset_name].get_lcobj_names():
+			assert_equal_lcobjs(lcdataset[lcset_name][lcobj_name], baseline_lcdataset[lcset_name][lcobj_name])
+
+def test_export_dictionary_from_csv(tmp_path, monkeypatch):
+	creator = get_creator(300)
+	baseline_lcdataset = creator.export_dictionary('description', str(tmp_path), outliers_df=get_outliers_df(), any_band_points=3)
+	creator.detections_df.to_csv(str(tmp_path/'detections.csv'))
+	lcdataset = get_files_export(creator, str(tmp_path/'csv'), str(tmp_path/'detections.csv'), monkeypatch)
+	assert_equal_lcdatasets(lcdataset, baseline_lcdataset)
+
+def test_export_dictionary_from_parquet(tmp_path, monkeypatch):
+	pytest.importorskip('pyarrow')
+	creator = get_creator(300)
+	baseline_lcdataset = creator.export_dictionary('description', str(tmp_path), outliers_df=get_outliers_df(), any_band_points=3)
+	os.makedirs(str(tmp_path/'detections'))
+	detections_df = creator.detections_df.reset_index()
+	for k in range(0, 2): # a Parquet folder, with row groups larger than chunk_size
+		detections_df.iloc[k::2].to_parquet(str(tmp_path/f'detections/part{k}.parquet'), index=False, row_group_size=1200)
+	lcdataset = get_files_export(creator, str(tmp_path/'parquet'), str(tmp_path/'detections'), monkeypatch)
+	assert_equal_lcdatasets(lcdataset, baseline_lcdataset)
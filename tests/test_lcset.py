@@ -0,0 +1,73 @@
+from __future__ import print_function
+from __future__ import division
+
+import numpy as np
+import pytest
+import lchandler.lc_classes as lcc
+import lchandler.dataset_classes as dsc
+
+###################################################################################################################################################
+
+def get_lcobj(rng, y,
+	band_names=['g', 'r'],
+	):
+	lcobj = lcc.LCO(y=y)
+	for b in band_names:
+		length = int(rng.integers(3, 20))
+		lcobj.add_b(b, np.sort(rng.random(length)*100), rng.random(length)+0.1, rng.random(length)*0.1+0.01)
+	return lcobj
+
+def get_lcset(n_lcobjs,
+	seed=0,
+	):
+	rng = np.random.default_rng(seed)
+	data = {f'obj{k:04d}':get_lcobj(rng, k%3) for k in range(0, n_lcobjs)}
+	return dsc.LCSet(data, 'survey', 'description', ['g', 'r'], ['A', 'B', 'C'], True)
+
+###################################################################################################################################################
+
+def test_unlabeled_lcobjs():
+	lcset = get_lcset(9)
+	rng = np.random.default_rng(1)
+	lcset.set_lcobj('unlabeled', get_lcobj(rng, None))
+	assert lcset.get_lcobj_names()[-1]=='unlabeled'
+	assert lcset.get_lcobj_labels()[-1] is None
+	assert lcset.get_populations_cdict()=={'A':3, 'B':3, 'C':3}
+	assert not 'unlabeled' in sum([lcset.get_lcobj_names(c) for c in lcset.class_names], [])
+	lcset['unlabeled'].set_y(1)
+	lcset.reset_class_index()
+	assert 'unlabeled' in lcset.get_lcobj_names('B')
+	lcset.set_lcobj('unlabeled', get_lcobj(rng, None)) # labeled -> unlabeled
+	assert lcset.get_populations_cdict()['B']==3
+	lcset.pop_lcobj('unlabeled')
+	assert len(lcset.get_lcobj_labels())==9
+
+def test_split_independent():
+	lcdataset = dsc.LCDataset({'raw':get_lcset(60)})
+	lcdataset.split('raw', None, 3)
+	lcset_names = [lcset_name for lcset_name in lcdataset.get_lcset_names() if lcset_name!='raw']
+	raw_days = {lcobj_name:lcdataset['raw'][lcobj_name].get_b('g').days.copy() for lcobj_name in lcdataset['raw'].get_lcobj_names()}
+	for lcobj_name in raw_days.keys():
+		lcdataset['raw'][lcobj_name].get_b('g').days[:] = -1
+	for lcset_name in lcset_names:
+		for lcobj_name in lcdataset[lcset_name].get_lcobj_names():
+			assert np.array_equal(lcdataset[lcset_name][lcobj_name].get_b('g').days, raw_days[lcobj_name])
+
+def test_view_getitem():
+	lcset = get_lcset(30)
+	days = lcset['obj0003'].get_b('g').days.copy()
+	view = dsc.LCSetView(lcset, np.arange(0, 10))
+	assert not view.is_modified()
+	view.get_band_buffer('g')
+	view.get_lcobj_source('obj0003')
+	assert not view.is_modified() # reads
+
+	valid_indexs = np.arange(0, len(days))>0
+	view['obj0003'].get_b('g').apply_valid_indexs_to_attrs(valid_indexs) # in-place method
+	assert np.array_equal(view['obj0003'].get_b('g').days, days[1:])
+	view['obj0003'].get_b('g').days[:] = -1 # direct write
+	assert np.all(view['obj0003'].get_b('g').days==-1)
+	assert np.all(view.get_band_buffer('g', ['days'], ['obj0003'])[0]['days']==-1)
+	assert np.array_equal(lcset['obj0003'].get_b('g').days, days) # the base is not modified
+	assert view.is_modified()
+	assert np.array_equal(view.materialize()['obj0003'].get_b('g').days, view['obj0003'].get_b('g').days)
@@ -0,0 +1,94 @@
+from __future__ import print_function
+from __future__ import division
+
+import numpy as np
+import pytest
+import lchandler.C_ as C_
+import lchandler.lc_classes as lcc
+import lchandler.dataset_classes as dsc
+from lchandler.columnar_classes import ColumnarLCSet
+
+###################################################################################################################################################
+
+def diff_vector(x):
+	if len(x)==0:
+		return x
+	new_x = np.concatenate([x[0][None,...], x], axis=0)
+	return new_x[1:]-new_x[:-1]
+
+def get_bstats_baseline(lcobjs, b):
+	'''
+	Values of the original LCSet.get_bstats_idf_c, used as reference
+	'''
+	sublcobjs = [lcobj.get_b(b) for lcobj in lcobjs]
+	return {
+		'$x$':np.concatenate([sublcobj.obs for sublcobj in sublcobjs]),
+		'$L$':np.array([len(sublcobj) for sublcobj in sublcobjs]),
+		'$\\Delta T$':np.array([sublcobj.days[-1]-sublcobj.days[0] for sublcobj in sublcobjs if len(sublcobj)>=1]),
+		'$\\Delta t$':np.concatenate([diff_vector(sublcobj.days) for sublcobj in sublcobjs]),
+		'tmax':np.array([sublcobj.days[np.argmax(sublcobj.obs)] for sublcobj in sublcobjs if len(sublcobj)>=1]),
+		}
+
+def get_serial_stats_baseline(lcobjs, band_names):
+	'''
+	Values of the original LCSet.get_serial_stats_idf_c, used as reference
+	'''
+	xs = []
+	for lcobj in lcobjs:
+		x = np.concatenate([np.stack([lcobj.get_b(b).days, lcobj.get_b(b).obs], axis=-1) for b in band_names], axis=0)
+		xs.append(x[np.argsort(x[:,0])])
+	return {
+		'$x$':np.concatenate([x[:,C_.OBS_INDEX] for x in xs]),
+		'$L$':np.array([len(x) for x in xs]),
+		'$\\Delta T$':np.array([np.max(x[:,C_.DAYS_INDEX])-np.min(x[:,C_.DAYS_INDEX]) for x in xs]),
+		'$\\Delta t$':np.concatenate([diff_vector(x[:,C_.DAYS_INDEX]) for x in xs]),
+		}
+
+def get_lcset(n_lcobjs,
+	seed=0,
+	):
+	rng = np.random.default_rng(seed)
+	data = {}
+	for k in range(0, n_lcobjs):
+		lcobj = lcc.LCO(y=int(rng.integers(0, 2))) # class C is empty
+		for b in ['g', 'r']:
+			length = int(rng.integers(0, 30))
+			lcobj.add_b(b, np.sort(rng.random(length)*100), rng.random(length)+0.1, rng.random(length)*0.1+0.01)
+		if len(lcobj)>0:
+			data[f'obj{k:04d}'] = lcobj
+	return dsc.LCSet(data, 'survey', 'description', ['g', 'r'], ['A', 'B', 'C'], True)
+
+def assert_equal_values(info_dict, baseline_values, c):
+	for k,baseline_x in baseline_values.items():
+		x = info_dict[f'{c}-{k}'].x
+		assert len(x)==len(baseline_x), (c, k)
+		if len(x)>0:
+			assert np.array_equal(x.astype(baseline_x.dtype), baseline_x), (c, k)
+
+###################################################################################################################################################
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_stats_baseline(columnar):
+	lcset = get_lcset(80)
+	lcset = ColumnarLCSet.from_lcset(lcset) if columnar else lcset
+	for c in lcset.class_names:
+		lcobjs = [lcset.get_lcobj_source(lcobj_name) for lcobj_name in lcset.get_lcobj_names(c)]
+		serial_info_dict = lcset.get_serial_stats_idf().iloc[0].to_dict()
+		class_df, mean_length_df_bdict = lcset.get_class_stats_idf()
+		assert class_df[f'{c}-$N_c$'].values[0]==len(lcobjs)
+		if len(lcobjs)==0:
+			assert len(serial_info_dict[f'{c}-$x$'].x)==0
+			continue
+		assert_equal_values(serial_info_dict, get_serial_stats_baseline(lcobjs, lcset.band_names), c)
+		for b in lcset.band_names:
+			assert_equal_values(lcset.get_bstats_idf(b).iloc[0].to_dict(), get_bstats_baseline(lcobjs, b), c)
+			assert mean_length_df_bdict[b][f'{c}{b}-$N_c$'].values[0]==sum([len(lcobj.get_b(b)) for lcobj in lcobjs])/len(lcobjs)
+
+def test_stats_cache():
+	lcset = get_lcset(40)
+	lcset.get_bstats_idf('g')
+	lcobj_name = lcset.get_lcobj_names('A')[0]
+	sublcobj = lcset[lcobj_name].get_b('g')
+	sublcobj.add_day_values(np.ones_like(sublcobj.days)) # in place, the cached stats must be computed again
+	lcobjs = [lcset[lcobj_name] for lcobj_name in lcset.get_lcobj_names('A')]
+	assert_equal_values(lcset.get_bstats_idf('g').iloc[0].to_dict(), get_bstats_baseline(lcobjs, 'g'), 'A')